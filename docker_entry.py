@@ -17,43 +17,139 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import argparse
 import json
-import shutil
+import os
+import signal
 from pathlib import Path
 from sys import exit as sys_exit
 from tempfile import TemporaryDirectory
 
-from pdf_generator.generator import compile_pdf, create_templates
+from pdf_generator.backends import BACKENDS, DIRECT_BACKEND, LATEX_BACKEND
+from pdf_generator.ingestion import load_analysis
+from pdf_generator.instrumentation import recording
 
+# Each report runs in a fresh container, so imports are paid on every report. Modules only needed by one backend or
+# by the worker mode (reportlab, jinja2, multiprocessing) are imported where they are used.
 
-INPUT_DIR = Path('/tmp/interface')
+INTERFACE_DIR_VARIABLE = 'FACT_PDF_INTERFACE_DIR'
+INPUT_DIR = Path(os.environ.get(INTERFACE_DIR_VARIABLE, '/tmp/interface'))
 
 
 def _load_data(file_name: str) -> dict:
     return json.loads((INPUT_DIR / 'data' / file_name).read_text())
 
 
-def move_pdf_report(pdf_path: Path):
-    output_path = INPUT_DIR / 'pdf' / pdf_path.name
-    shutil.move(pdf_path, output_path)
-    file_stats = INPUT_DIR.lstat()
-    shutil.chown(output_path, user=file_stats.st_uid, group=file_stats.st_gid)
+def move_pdf_report(pdf_path: Path) -> Path:
+    from pdf_generator.generator import publish_pdf  # pylint: disable=import-outside-toplevel
+    return publish_pdf(pdf_path, INPUT_DIR / 'pdf', INPUT_DIR)
 
 
-def main(template_style='default'):
-    analysis = _load_data('analysis.json')
-    meta_data = _load_data('meta.json')
+def main(template_style='default', backend=LATEX_BACKEND, appendix=False):
+    with recording() as recorder:
+        analysis = load_analysis(INPUT_DIR / 'data' / 'analysis.json', full_inventory=appendix)
+        meta_data = _load_data('meta.json')
 
-    with TemporaryDirectory() as tmp_dir:
-        create_templates(analysis, meta_data, tmp_dir, template_style)
-        try:
-            target_path = compile_pdf(meta_data, tmp_dir)
-            move_pdf_report(target_path)
-        except RuntimeError:
-            return 1
+        with TemporaryDirectory() as tmp_dir:
+            try:
+                target_path = _render(analysis, meta_data, tmp_dir, template_style, backend, appendix)
+                output_path = move_pdf_report(target_path)
+            except RuntimeError:
+                return 1
 
+    from pdf_generator.generator import change_owner  # pylint: disable=import-outside-toplevel
+    change_owner(recorder.write_sidecar(output_path), INPUT_DIR)
     return 0
 
 
+def _render(analysis, meta_data, tmp_dir, template_style, backend, appendix) -> Path:
+    # pylint: disable=import-outside-toplevel
+    if backend == DIRECT_BACKEND:
+        from pdf_generator.direct_pdf import render_direct_pdf
+        return render_direct_pdf(analysis, meta_data, tmp_dir)
+    from pdf_generator.generator import compile_pdf, create_templates
+    from pdf_generator.result_cache import get_default_cache
+    create_templates(analysis, meta_data, tmp_dir, template_style, appendix=appendix)
+    return compile_pdf(meta_data, tmp_dir, template_style, cache=get_default_cache())
+
+
+def render_styles(template_styles, appendix=False):
+    '''
+    Load the input once and publish one pdf per template style, named <report name>_<style>.pdf.
+    '''
+    # pylint: disable=import-outside-toplevel
+    from pdf_generator.generator import change_owner, create_report_filename
+    from pdf_generator.report import typeset_styles
+    from pdf_generator.result_cache import get_default_cache
+    with recording() as recorder:
+        analysis = load_analysis(INPUT_DIR / 'data' / 'analysis.json', full_inventory=appendix)
+        meta_data = _load_data('meta.json')
+        report_name = Path(create_report_filename(meta_data))
+
+        with TemporaryDirectory() as tmp_dir:
+            try:
+                pdf_paths = typeset_styles(analysis, meta_data, template_styles, tmp_dir, cache=get_default_cache(), appendix=appendix)
+                output_paths = [
+                    move_pdf_report(pdf_path.rename(Path(tmp_dir, '{}_{}{}'.format(report_name.stem, template_style, report_name.suffix))))
+                    for template_style, pdf_path in pdf_paths.items()
+                ]
+            except RuntimeError:
+                return 1
+
+    for output_path in output_paths:
+        change_owner(recorder.write_sidecar(output_path), INPUT_DIR)
+    return 0
+
+
+def worker(template_style='default', concurrency=None, max_pending=None, metrics_file=None, backend=LATEX_BACKEND, standby=0,
+           worker_id=None):
+    from pdf_generator.spool_worker import SpoolWorker  # pylint: disable=import-outside-toplevel
+    spool_worker = SpoolWorker(
+        INPUT_DIR / 'spool', INPUT_DIR / 'pdf', INPUT_DIR, template_style=template_style, concurrency=concurrency,
+        max_pending=max_pending, metrics_file=metrics_file, backend=backend, standby=standby,
+        worker_id=worker_id
+    )
+    signal.signal(signal.SIGTERM, lambda *_: spool_worker.stop())
+    spool_worker.run()
+    return 0
+
+
+def warm_up(template_style='default'):
+    '''
+    Fill the caches a report run would otherwise fill on its first use: the jinja bytecode of all templates of the
+    style and the dumped LaTeX format. Meant to run while the image is built.
+    '''
+    # pylint: disable=import-outside-toplevel
+    from pdf_generator.latex_format import get_format_file
+    from pdf_generator.tex_generation.template_engine import TemplateEngine
+    templates = TemplateEngine(template_folder=template_style).load_templates()
+    format_file = get_format_file(template_style)
+    print('Compiled {} templates, LaTeX format: {}'.format(templates, format_file if format_file else 'not available'))
+    return 0
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Generate FACT pdf reports from /tmp/interface')
+    parser.add_argument('--template-style', default='default', help='template folder to use')
+    parser.add_argument('--backend', default=LATEX_BACKEND, choices=BACKENDS, help='latex (typeset report) or direct (fast, no TeX needed)')
+    parser.add_argument('--styles', default=None, help='comma separated template styles, renders one pdf per style from a single load of the input (latex backend)')
+    parser.add_argument('--appendix', action='store_true', help='append a full inventory of software, CVEs, IPs / URIs and executables (latex backend)')
+    parser.add_argument('--worker', action='store_true', help='keep running and process job folders from /tmp/interface/spool/incoming')
+    parser.add_argument('--concurrency', type=int, default=None, help='number of reports rendered in parallel (worker mode, default: cpu count)')
+    parser.add_argument('--max-pending', type=int, default=None, help='maximum number of claimed jobs (worker mode, default: 2 * concurrency)')
+    parser.add_argument('--metrics-file', type=Path, default=None, help='append the stage metrics of every job to this json lines file (worker mode)')
+    parser.add_argument('--warm-up', action='store_true', help='only prepare templates and LaTeX format for later runs (e.g. while building the image)')
+    parser.add_argument('--standby', type=int, default=0, help='pdflatex processes kept ready per worker process (worker mode, latex backend)')
+    parser.add_argument('--worker-id', default=None, help='name of the claimed folder of this worker, must be stable across restarts (worker mode, default: host name)')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    sys_exit(main())
+    ARGS = _parse_args()
+    if ARGS.warm_up:
+        sys_exit(warm_up(ARGS.template_style))
+    if ARGS.styles:
+        sys_exit(render_styles(ARGS.styles.split(','), ARGS.appendix))
+    if ARGS.worker:
+        sys_exit(worker(ARGS.template_style, ARGS.concurrency, ARGS.max_pending, ARGS.metrics_file, ARGS.backend, ARGS.standby, ARGS.worker_id))
+    sys_exit(main(ARGS.template_style, ARGS.backend, ARGS.appendix))
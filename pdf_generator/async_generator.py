@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+from pdf_generator.generator import (
+    build_latex_command, check_latex_result, check_limits, create_report_filename, create_templates, finish_typesetting,
+    get_latex_environment, get_latex_limits, kill_process_group, LOG_NAME, PDF_NAME, prepare_typesetting,
+    record_latex_statistics, retry_without_format, WATCHDOG_INTERVAL
+)
+from pdf_generator.instrumentation import bind_recorder, stage
+from pdf_generator.latex_errors import find_first_error, LatexCompilationError
+from pdf_generator.latex_format import find_format, finish_format_build, get_format_environment, install_format, prepare_format_build
+from pdf_generator.tex_generation.template_engine import MAIN_TEMPLATE
+
+DEFAULT_CONCURRENT_COMPILES = os.cpu_count() or 1
+
+
+async def _read_output(process, limit: int, output: dict):
+    while True:
+        chunk = await process.stdout.read(65536)
+        if not chunk:
+            break
+        if output['size'] < limit:
+            output['chunks'].append(chunk[:limit - output['size']])
+        output['size'] += len(chunk)
+    await process.wait()
+
+
+async def _watch_process(process, tmp_dir) -> str:
+    limits, started = get_latex_limits(), time.monotonic()
+    output = {'chunks': [], 'size': 0}
+    reader = asyncio.ensure_future(_read_output(process, limits.max_output, output))
+    try:
+        while not reader.done():
+            await asyncio.wait({reader}, timeout=WATCHDOG_INTERVAL)
+            violation = check_limits(started, limits, tmp_dir, output['size']) if not reader.done() else None
+            if violation:
+                kill_process_group(process)
+                await reader
+                raise LatexCompilationError(violation, find_first_error(Path(tmp_dir, LOG_NAME), Path(tmp_dir, MAIN_TEMPLATE)), killed=True)
+        await reader
+    finally:
+        reader.cancel()
+    return b''.join(output['chunks']).decode(errors='replace')
+
+
+async def execute_latex_async(tmp_dir, format_file=None):
+    '''
+    Run pdflatex as asyncio subprocess in tmp_dir, under the same time and output limits as execute_latex. If the
+    calling task is cancelled, the TeX process (and anything it started) is killed before the cancellation is
+    propagated.
+    '''
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *build_latex_command(tmp_dir, format_file), cwd=str(tmp_dir), env=get_latex_environment(),
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True
+        )
+    except OSError as error:
+        await run_in_executor(check_latex_result, tmp_dir, str(error), 127)
+        return
+    try:
+        with stage('latex', python_stage=False):
+            output = await _watch_process(process, tmp_dir)
+    except asyncio.CancelledError:
+        kill_process_group(process)
+        await process.wait()
+        raise
+    await run_in_executor(_finish_latex, tmp_dir, output, process.returncode)
+
+
+def _finish_latex(tmp_dir, output: str, return_code: int):
+    record_latex_statistics(tmp_dir)
+    check_latex_result(tmp_dir, output, return_code)
+
+
+async def run_in_executor(function, *args):
+    '''
+    Run blocking work (file I/O, decoding images, rendering templates) in the default executor of the event loop. Its
+    stages are recorded by the recorder of the calling task's thread.
+    '''
+    future = asyncio.get_event_loop().run_in_executor(None, bind_recorder(function), *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # the thread can not be stopped, it has to finish before the caller removes the files it works on
+        await asyncio.wait({future})
+        raise
+
+
+async def create_templates_async(analysis, meta_data, tmp_dir, template_style='default', engine=None):
+    # decoding the images and rendering large analyses takes long enough to stall every other report of the loop
+    await run_in_executor(partial(create_templates, engine=engine), analysis, meta_data, tmp_dir, template_style)
+
+
+async def build_format_async(format_file: Path, class_file: Path, preamble: str) -> bool:
+    with TemporaryDirectory() as build_dir:
+        command = prepare_format_build(build_dir, format_file, class_file, preamble)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, cwd=build_dir, env=get_format_environment(), stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+        except OSError as error:
+            logging.warning('Could not build LaTeX format: {}'.format(error))
+            return False
+        try:
+            await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        return await run_in_executor(install_format, build_dir, format_file, process.returncode)
+
+
+async def get_format_file_async(template_style='default') -> Optional[Path]:
+    '''
+    Like get_format_file, but a format that has to be built is dumped by an asyncio subprocess.
+    '''
+    format_file, source = find_format(template_style)
+    if source is None:
+        return format_file
+    return finish_format_build(format_file, source, await build_format_async(format_file, source.class_file, source.preamble))
+
+
+async def typeset_pdf_async(tmp_dir, template_style='default', cache=None) -> Path:
+    '''
+    typeset_pdf for the event loop: hashing the input and the cache lookup run in the default executor, format
+    build and pdflatex run as asyncio subprocesses.
+    '''
+    cache_key, cached = await run_in_executor(prepare_typesetting, tmp_dir, cache)
+    if cached:
+        return Path(tmp_dir, PDF_NAME)
+
+    format_file = await get_format_file_async(template_style)
+    try:
+        await execute_latex_async(tmp_dir, format_file)
+    except RuntimeError as error:
+        if not retry_without_format(error, format_file):
+            raise
+        await execute_latex_async(tmp_dir)
+    return await run_in_executor(finish_typesetting, tmp_dir, cache, cache_key)
+
+
+async def compile_pdf_async(meta_data, tmp_dir, template_style='default', cache=None) -> Path:
+    target_path = Path(tmp_dir, create_report_filename(meta_data))
+    os.replace(str(await typeset_pdf_async(tmp_dir, template_style, cache)), str(target_path))
+    return target_path
+
+
+class AsyncReportGenerator:
+    '''
+    Generates reports from within an event loop. At most max_concurrent_compiles pdflatex processes run at once,
+    further reports wait for a free slot. Cancelling a report kills its TeX process and removes its temp dir.
+    '''
+
+    def __init__(self, max_concurrent_compiles=DEFAULT_CONCURRENT_COMPILES, cache=None):
+        self.max_concurrent_compiles = max_concurrent_compiles
+        self.cache = cache
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:  # created lazily so it belongs to the running loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_compiles)
+        return self._semaphore
+
+    async def generate(self, analysis, meta_data, template_style='default') -> bytes:
+        with TemporaryDirectory() as tmp_dir:
+            await create_templates_async(analysis, meta_data, tmp_dir, template_style)
+            async with self.semaphore:
+                pdf_path = await compile_pdf_async(meta_data, tmp_dir, template_style, cache=self.cache)
+            return await run_in_executor(pdf_path.read_bytes)
@@ -0,0 +1,3 @@
+# kept apart from direct_pdf, so the backend can be chosen without importing reportlab
+LATEX_BACKEND, DIRECT_BACKEND = 'latex', 'direct'
+BACKENDS = (LATEX_BACKEND, DIRECT_BACKEND)
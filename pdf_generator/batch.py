@@ -0,0 +1,155 @@
+'''
+Render reports for many firmware analyses in parallel:
+
+    python3 -m pdf_generator.batch <manifest.json or job directory> --output-dir <directory>
+
+A manifest is a json list of {"analysis": <path>, "meta": <path>} objects (an optional "name" identifies the job).
+A job directory contains one sub directory per job holding analysis.json and meta.json.
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, NamedTuple, Optional
+
+from pdf_generator.backends import BACKENDS, DIRECT_BACKEND, LATEX_BACKEND
+from pdf_generator.combined import compile_combined
+from pdf_generator.generator import compile_pdf, create_templates, reserve_output_path
+from pdf_generator.ingestion import load_analysis
+from pdf_generator.result_cache import get_default_cache
+
+
+class BatchJob(NamedTuple):
+    name: str
+    analysis: Path
+    meta: Path
+
+
+class JobResult(NamedTuple):
+    name: str
+    output: Optional[str]
+    error: Optional[str]
+    duration: float
+
+
+def read_jobs(source: Path) -> List[BatchJob]:
+    if source.is_dir():
+        return [
+            BatchJob(job_dir.name, job_dir / 'analysis.json', job_dir / 'meta.json')
+            for job_dir in sorted(source.iterdir())
+            if (job_dir / 'analysis.json').is_file() and (job_dir / 'meta.json').is_file()
+        ]
+    jobs = []
+    for index, entry in enumerate(json.loads(source.read_text())):
+        analysis, meta = (source.parent / entry['analysis']), (source.parent / entry['meta'])
+        jobs.append(BatchJob(entry.get('name', '{}_{}'.format(index, analysis.parent.name)), analysis, meta))
+    return jobs
+
+
+def render_batch_job(job: BatchJob, output_dir: Path, template_style='default', backend=LATEX_BACKEND) -> JobResult:
+    start = time.monotonic()
+    try:
+        analysis = load_analysis(job.analysis)
+        meta_data = json.loads(job.meta.read_text())
+        with TemporaryDirectory() as tmp_dir:
+            if backend == DIRECT_BACKEND:
+                from pdf_generator.direct_pdf import render_direct_pdf  # pylint: disable=import-outside-toplevel
+                pdf_path = render_direct_pdf(analysis, meta_data, tmp_dir)
+            else:
+                create_templates(analysis, meta_data, tmp_dir, template_style)
+                pdf_path = compile_pdf(meta_data, tmp_dir, template_style, cache=get_default_cache())
+            output_path = reserve_output_path(output_dir, pdf_path.name)
+            shutil.move(str(pdf_path), str(output_path))
+    except Exception:  # pylint: disable=broad-except
+        return JobResult(job.name, None, traceback.format_exc(), time.monotonic() - start)
+    return JobResult(job.name, str(output_path), None, time.monotonic() - start)
+
+
+def render_batch_group(jobs: List[BatchJob], output_dir: Path, template_style='default') -> List[JobResult]:
+    '''
+    Render jobs with a single pdflatex run (see compile_combined). The time of the group is split evenly between its jobs.
+    '''
+    start = time.monotonic()
+    loaded, errors = [], {}
+    for job in jobs:
+        try:
+            loaded.append((job, load_analysis(job.analysis), json.loads(job.meta.read_text())))
+        except Exception:  # pylint: disable=broad-except
+            errors[job.name] = traceback.format_exc()
+
+    outputs = {}
+    with TemporaryDirectory() as tmp_dir:
+        combined_results = compile_combined([(analysis, meta_data) for _, analysis, meta_data in loaded], tmp_dir, template_style)
+        for (job, _, _), result in zip(loaded, combined_results):
+            if result.error is not None:
+                errors[job.name] = result.error
+                continue
+            outputs[job.name] = reserve_output_path(output_dir, result.pdf_path.name)
+            shutil.move(str(result.pdf_path), str(outputs[job.name]))
+
+    duration = (time.monotonic() - start) / len(jobs)
+    return [
+        JobResult(job.name, str(outputs[job.name]) if job.name in outputs else None, errors.get(job.name), duration)
+        for job in jobs
+    ]
+
+
+def run_batch(jobs: List[BatchJob], output_dir: Path, template_style='default', processes=None, backend=LATEX_BACKEND, combine=1) -> List[JobResult]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processes if processes else os.cpu_count()) as executor:
+        if combine > 1 and backend == LATEX_BACKEND:
+            groups = [jobs[offset:offset + combine] for offset in range(0, len(jobs), combine)]
+            futures = [executor.submit(render_batch_group, group, output_dir, template_style) for group in groups]
+            return [result for future in as_completed(futures) for result in future.result()]
+        futures = [executor.submit(render_batch_job, job, output_dir, template_style, backend) for job in jobs]
+        return [future.result() for future in as_completed(futures)]
+
+
+def summarize(results: List[JobResult], wall_time: float) -> dict:
+    durations = sorted(result.duration for result in results)
+    return {
+        'jobs': len(results),
+        'succeeded': sum(1 for result in results if result.error is None),
+        'failed': {result.name: result.error for result in results if result.error is not None},
+        'wall_time': wall_time,
+        'job_time_total': sum(durations),
+        'job_time_median': durations[len(durations) // 2] if durations else 0,
+        'job_time_max': durations[-1] if durations else 0,
+        'outputs': {result.name: result.output for result in results if result.error is None},
+    }
+
+
+def _parse_args(arguments):
+    parser = argparse.ArgumentParser(description='Render FACT pdf reports for many analyses in parallel')
+    parser.add_argument('source', type=Path, help='json manifest or directory of job folders')
+    parser.add_argument('-o', '--output-dir', type=Path, required=True, help='directory the reports are written to')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of parallel jobs (default: cpu count)')
+    parser.add_argument('--template-style', default='default', help='template folder to use')
+    parser.add_argument('--backend', default=LATEX_BACKEND, choices=BACKENDS, help='latex (typeset report) or direct (fast, no TeX needed)')
+    parser.add_argument('--combine', type=int, default=1, help='compile this many reports in one pdflatex run (latex backend only)')
+    parser.add_argument('--summary', type=Path, default=None, help='also write the summary as json to this file')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = _parse_args(arguments)
+    start = time.monotonic()
+    results = run_batch(read_jobs(args.source), args.output_dir, args.template_style, args.processes, args.backend, args.combine)
+    summary = summarize(results, time.monotonic() - start)
+
+    for name, error in summary['failed'].items():
+        print('Job {} failed:\n{}'.format(name, error), file=sys.stderr)
+    print('{succeeded}/{jobs} reports generated in {wall_time:.2f} s (median job time {job_time_median:.2f} s, max {job_time_max:.2f} s)'.format(**summary))
+    if args.summary:
+        args.summary.write_text(json.dumps(summary, indent=2))
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import logging
+import os
+import stat
+from functools import lru_cache
+from pathlib import Path
+from tempfile import gettempdir, mkdtemp
+
+CACHE_DIR_VARIABLE = 'FACT_PDF_CACHE_DIR'
+
+
+def get_cache_directory(name: str) -> Path:
+    configured_root = os.environ.get(CACHE_DIR_VARIABLE)
+    cache_root = Path(configured_root) if configured_root else get_default_cache_root()
+    directory = cache_root / name
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def get_default_cache_root() -> Path:
+    '''
+    <tmp>/fact_pdf_report-<uid>, private to the user like the default bytecode cache of jinja. Jinja bytecode, LaTeX
+    formats and finished pdfs are loaded from it, so a directory that is not owned by the user or that others can
+    write to is never used. A new private directory is used for the lifetime of the process instead.
+    '''
+    cache_root = Path(gettempdir(), 'fact_pdf_report-{}'.format(os.getuid()))
+    try:
+        cache_root.mkdir(mode=0o700)
+    except FileExistsError:
+        pass
+    if _make_private(cache_root):
+        return cache_root
+    return _get_fallback_root(str(cache_root))
+
+
+def _make_private(directory: Path) -> bool:
+    try:
+        stats = os.lstat(str(directory))
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISDIR(stats.st_mode) or stats.st_uid != os.getuid():
+        return False
+    if stat.S_IMODE(stats.st_mode) & 0o077:
+        os.chmod(str(directory), 0o700)
+    return True
+
+
+@lru_cache(maxsize=1)
+def _get_fallback_root(rejected_root: str) -> Path:
+    fallback_root = Path(mkdtemp(prefix='fact_pdf_report-', dir=gettempdir()))
+    logging.warning('Cache directory {} is not owned by this user, using {} instead'.format(rejected_root, fallback_root))
+    return fallback_root
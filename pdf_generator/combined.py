@@ -0,0 +1,206 @@
+'''
+Render several reports into one LaTeX document, compile it with a single pdflatex run and split the result into one
+pdf per report. This saves the process start and preamble loading of every report but the first.
+'''
+import logging
+import re
+import traceback
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from pdf_generator.generator import (
+    compile_pdf, link_fact_image, link_template_class, create_report_filename, create_templates, execute_latex, PDF_NAME,
+    retry_without_format
+)
+from pdf_generator.latex_format import DUMP_MARKER, get_format_file
+from pdf_generator.reproducible import is_reproducible, write_reproducible_settings
+from pdf_generator.tex_generation.template_engine import APPENDIX_TEMPLATE, MAIN_TEMPLATE, META_TEMPLATE, TemplateEngine
+
+PAGES_FILE = 'report_pages.txt'
+REPORT_MARKER = 'FACT report'
+BEGIN_DOCUMENT, END_DOCUMENT = r'\begin{document}', r'\end{document}'
+# counters of twentysecondcv.cls that are changed globally by a report
+RESET_COUNTERS = ['colorCounter']
+
+_REPORT_MARKER_REGEX = re.compile(r'^{} (\d+)$'.format(REPORT_MARKER))
+
+
+class CombinedResult(NamedTuple):
+    pdf_path: Optional[Path]
+    error: Optional[str]
+
+
+def compile_combined(jobs: List[Tuple[dict, dict]], tmp_dir, template_style='default', engine=None) -> List[CombinedResult]:
+    '''
+    Compile the reports of jobs, a list of (analysis, meta_data) pairs, in one pdflatex run.
+    Each report is rendered into its own sub directory of tmp_dir where its pdf is placed as well.
+    If the combined document can not be built, every report is compiled on its own instead.
+    '''
+    engine = engine if engine is not None else TemplateEngine(template_folder=template_style)
+    results, report_dirs = [], []
+    for index, (analysis, meta_data) in enumerate(jobs):
+        report_dir = Path(tmp_dir, 'report{}'.format(index)).absolute()
+        report_dir.mkdir()
+        try:
+            create_templates(analysis, meta_data, str(report_dir), template_style, engine=engine)
+            report_dirs.append((index, report_dir, meta_data))
+            results.append(None)
+        except Exception:  # pylint: disable=broad-except
+            results.append(CombinedResult(None, traceback.format_exc()))
+
+    for index, pdf_path in _compile_document(report_dirs, tmp_dir, template_style).items():
+        results[index] = CombinedResult(pdf_path, None)
+    for index, report_dir, meta_data in report_dirs:
+        if results[index] is None:
+            results[index] = _compile_single(meta_data, report_dir, template_style)
+    return results
+
+
+def _compile_document(report_dirs, tmp_dir, template_style) -> dict:
+    if not report_dirs:
+        return {}
+    document = build_combined_document([(index, report_dir) for index, report_dir, _ in report_dirs], Path(tmp_dir))
+    if document is None:
+        return {}
+    Path(tmp_dir, MAIN_TEMPLATE).write_text(document)
+    link_fact_image(tmp_dir)
+    link_template_class(tmp_dir, template_style)
+    if is_reproducible():
+        write_reproducible_settings(tmp_dir)
+
+    try:
+        _execute_latex_with_fallback(tmp_dir, template_style)
+        reader = _read_pdf(Path(tmp_dir, PDF_NAME))
+        page_ranges = read_page_ranges(Path(tmp_dir, PAGES_FILE), len(reader.pages))
+        if sorted(page_ranges) != sorted(index for index, _, _ in report_dirs):
+            raise RuntimeError('Combined pdf is missing reports')
+    except RuntimeError as error:
+        failing_job = find_failing_report(Path(tmp_dir, 'main.log'))
+        logging.warning('Combined build failed ({}), suspected report: {}. Compiling reports one by one'.format(error, failing_job))
+        return {}
+
+    pdf_paths = {}
+    for index, report_dir, meta_data in report_dirs:
+        pdf_paths[index] = report_dir / create_report_filename(meta_data)
+        split_pdf(reader, page_ranges[index], pdf_paths[index])
+    return pdf_paths
+
+
+def _execute_latex_with_fallback(tmp_dir, template_style):
+    format_file = get_format_file(template_style)
+    try:
+        execute_latex(tmp_dir, format_file)
+    except RuntimeError as error:
+        if not retry_without_format(error, format_file):
+            raise
+        execute_latex(tmp_dir)
+    if _log_has_errors(Path(tmp_dir, 'main.log')):
+        # errors are not fatal in batchmode, but a broken report may leak its state into the following ones
+        raise RuntimeError('LaTeX errors in combined document')
+
+
+def _compile_single(meta_data, report_dir: Path, template_style) -> CombinedResult:
+    try:
+        return CombinedResult(compile_pdf(meta_data, str(report_dir), template_style), None)
+    except Exception:  # pylint: disable=broad-except
+        return CombinedResult(None, traceback.format_exc())
+
+
+def build_combined_document(report_dirs: List[Tuple[int, Path]], tmp_dir: Path) -> Optional[str]:
+    '''
+    Join the rendered main.tex files of report_dirs into one document. Each report is set inside a group, so the
+    self redefining commands of the class (\\cvname, \\skills, ...) are reset afterwards, and starts on a new page,
+    whose number is written to PAGES_FILE. Returns None if a main.tex does not have the expected structure.
+    '''
+    parts, preamble = [], None
+    for index, report_dir in report_dirs:
+        content = (report_dir / MAIN_TEMPLATE).read_text()
+        if DUMP_MARKER not in content or BEGIN_DOCUMENT not in content or END_DOCUMENT not in content:
+            return None
+        report_preamble, setup_and_body = content.split(DUMP_MARKER, 1)
+        preamble = preamble if preamble is not None else report_preamble
+        setup, body = setup_and_body.split(BEGIN_DOCUMENT, 1)
+        body = body.rsplit(END_DOCUMENT, 1)[0]
+        parts.append('\n'.join([
+            r'\begingroup',
+            *(r'\setcounter{{{}}}{{0}}'.format(counter) for counter in RESET_COUNTERS),
+            r'\typeout{{{} {}}}'.format(REPORT_MARKER, index),
+            r'\immediate\write\factreportpages{{{} \thepage}}'.format(index),
+            _prefix_inputs(setup, report_dir, tmp_dir),
+            _prefix_inputs(body, report_dir, tmp_dir),
+            r'\clearpage',
+            r'\endgroup',
+        ]))
+    return '\n'.join([
+        preamble + DUMP_MARKER,
+        r'\newwrite\factreportpages',
+        r'\immediate\openout\factreportpages={}'.format(PAGES_FILE),
+        BEGIN_DOCUMENT,
+        *parts,
+        r'\immediate\closeout\factreportpages',
+        END_DOCUMENT,
+        ''
+    ])
+
+
+def _prefix_inputs(content: str, report_dir: Path, tmp_dir: Path) -> str:
+    for template in (META_TEMPLATE, APPENDIX_TEMPLATE):
+        input_file = (report_dir / template).relative_to(tmp_dir.absolute()).as_posix()
+        content = content.replace(r'\input{{{}}}'.format(template), r'\input{{{}}}'.format(input_file))
+    return content
+
+
+def _read_pdf(pdf_file: Path) -> PdfReader:
+    if not pdf_file.is_file():
+        raise RuntimeError('No pdf output generated. Aborting.')
+    return PdfReader(str(pdf_file))
+
+
+def read_page_ranges(pages_file: Path, page_count: int) -> dict:
+    '''
+    Return {report index: range of 0 based page numbers} from the start pages written by the combined document.
+    '''
+    if not pages_file.is_file():
+        raise RuntimeError('Page numbers of the reports were not written')
+    starts = [tuple(int(value) for value in line.split()) for line in pages_file.read_text().splitlines() if line.strip()]
+    page_ranges = {}
+    for position, (index, start_page) in enumerate(starts):
+        end_page = starts[position + 1][1] if position + 1 < len(starts) else page_count + 1
+        if end_page <= start_page:
+            raise RuntimeError('Report {} has no pages'.format(index))
+        page_ranges[index] = range(start_page - 1, end_page - 1)
+    return page_ranges
+
+
+def split_pdf(reader: PdfReader, pages: range, target: Path):
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(reader.pages[page])
+    with target.open('wb') as output_file:
+        writer.write(output_file)
+
+
+def _log_has_errors(log_file: Path) -> bool:
+    if not log_file.is_file():
+        return False
+    with log_file.open(errors='replace') as log:
+        return any(line.startswith('!') for line in log)
+
+
+def find_failing_report(log_file: Path) -> Optional[int]:
+    '''
+    Index of the report that was being typeset when the first error occurred, according to the markers in the log.
+    '''
+    if not log_file.is_file():
+        return None
+    current_report = None
+    with log_file.open(errors='replace') as log:
+        for line in log:
+            match = _REPORT_MARKER_REGEX.match(line.rstrip('\n'))
+            if match:
+                current_report = int(match.group(1))
+            elif line.startswith('!'):
+                return current_report
+    return current_report
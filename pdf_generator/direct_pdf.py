@@ -0,0 +1,216 @@
+'''
+TeX free backend: draws the summary report (sidebar with meta data, crypto material and exploit mitigation bars plus
+the software, vulnerability, CVE, file type, IP and executable sections) straight to pdf with reportlab.
+It takes the same analysis / meta data as the LaTeX templates and renders in milliseconds, the LaTeX backend stays
+available for the typeset version of the report.
+'''
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+
+from pdf_generator.generator import create_report_filename
+from pdf_generator.tex_generation.image_processing import store_base64_image
+from pdf_generator.tex_generation.ip_classification import IP_CLASSES
+from pdf_generator.tex_generation.summary_reduction import exploit_mitigation_ratios, reduce_analysis
+from pdf_generator.tex_generation.template_engine import LOGO_FILE, render_number_as_size, split_software_version
+
+rl_config.useA85 = 0  # ascii85 encoding of images is done in pure python and would dominate the render time
+
+LOGO_PATH = Path(__file__).parent / 'templates' / LOGO_FILE
+LOGO_WIDTH_PIXELS = 400
+FONT, BOLD_FONT = 'Helvetica', 'Helvetica-Bold'
+MAIN_BLUE, MAIN_GRAY, SIDE_COLOR, TEXT_GRAY, TEXT_BLACK = '#0E5484', '#69C0AC', '#E7E7E7', '#4D4D4D', '#333333'
+
+# same order and defaults as meta.tex
+META_FIELDS = [
+    ('vendor', 'No Vendor'), ('size', 'No Size'), ('version', 'No Version'), ('release_date', 'No Release Date')
+]
+SECTION_TITLES = [
+    ('software_components', 'Software'), ('known_vulnerabilities', 'Known Vulnerabilities'), ('cve_lookup', 'CVE Lookup'),
+    ('file_type', 'Top five occuring file types'), ('ip_and_uri_finder', 'IPs and URIs'), ('cpu_architecture', 'Executables')
+]
+
+
+def render_direct_pdf(analysis: dict, meta_data: dict, tmp_dir) -> Path:
+    target_path = Path(tmp_dir, create_report_filename(meta_data))
+    report = _ReportCanvas(Canvas(str(target_path), pagesize=letter, pageCompression=1))
+    report.canvas.setTitle('Analysis report of {}'.format(meta_data.get('device_name', 'No Name')))
+    report.canvas.setCreator('FACT pdf report')
+
+    sections = reduce_analysis(analysis)
+    _draw_sidebar(report, analysis, meta_data, sections)
+    _draw_entropy_graph(report, analysis, tmp_dir)
+    for plugin, title in SECTION_TITLES:
+        if sections.get(plugin):
+            report.section(title, get_section_rows(plugin, sections[plugin]))
+    report.canvas.save()
+    return target_path
+
+
+def get_meta_rows(meta_data: dict) -> Tuple[str, str, List[str]]:
+    rows = [
+        render_number_as_size(meta_data[key]) if key == 'size' and key in meta_data else str(meta_data.get(key, default))
+        for key, default in META_FIELDS
+    ]
+    return str(meta_data.get('device_name', 'No Name')), str(meta_data.get('device_class', 'No Class')), rows
+
+
+def get_mitigation_bars(analysis: dict, sections: dict) -> List[Tuple[str, float]]:
+    if 'exploit_mitigations' not in sections:
+        return [('Analysis not present', 1)]
+    if not sections['exploit_mitigations']:
+        return []
+    return exploit_mitigation_ratios(analysis['exploit_mitigations']['summary'])
+
+
+def get_section_rows(plugin: str, section) -> List[Tuple[str, str]]:
+    '''
+    Rows of (left column, right column) as in the twentyshort lists of main.tex, but without LaTeX escaping.
+    '''
+    if plugin == 'software_components':
+        rows = [tuple(reversed(split_software_version(entry))) for entry in section['entries']]
+        return rows + ([('', 'and {} others'.format(section['others']))] if section['others'] else [])
+    if plugin == 'known_vulnerabilities':
+        return [(entry, '') for entry in section]
+    if plugin == 'cve_lookup':
+        rows = [(str(count), severity.lower()) for severity, count in section.counts.items() if count]
+        rows += [('{:.1f}'.format(cve.score) if cve.score is not None else '', cve.name) for cve in section.top]
+        return rows + ([('', 'and {} others'.format(section.others))] if section.others else [])
+    if plugin == 'ip_and_uri_finder':
+        return [
+            (str(section.counts[ip_class]), '{} (incl. {})'.format(ip_class, section.sample(ip_class)) if section.counts[ip_class] else ip_class)
+            for ip_class in IP_CLASSES
+        ]
+    return [(str(count), name) for name, count in section]
+
+
+def _draw_sidebar(report: '_ReportCanvas', analysis: dict, meta_data: dict, sections: dict):
+    canvas, left = report.canvas, 0.5 * cm
+    canvas.setFillColor(HexColor(SIDE_COLOR))
+    canvas.rect(0, 0, 7.1 * cm, report.height, stroke=0, fill=1)
+
+    logo = _load_logo()
+    logo_width, logo_height = _scaled_size(logo, 5 * cm)
+    y = report.height - 0.5 * cm - logo_height
+    canvas.drawImage(logo, left + 0.5 * cm, y, logo_width, logo_height, mask='auto')
+
+    name, device_class, rows = get_meta_rows(meta_data)
+    y = report.draw_text(left, y - 1 * cm, name, 22, color=MAIN_BLUE, max_width=6 * cm)
+    y = report.draw_text(left, y - 0.7 * cm, device_class, 15, color=TEXT_BLACK, max_width=6 * cm)
+    y -= 0.3 * cm
+    for row in rows:
+        y = report.draw_text(left + 1 * cm, y - 0.6 * cm, row, 10, max_width=5 * cm)
+
+    crypto = sections['crypto_material'] if 'crypto_material' in sections else ['Analysis not present']
+    if crypto:
+        y = _draw_profile_section(report, left, y - 1 * cm, 'Crypto')
+        for entry in crypto:
+            y = report.draw_text(left, y - 0.5 * cm, entry, 10, max_width=6 * cm)
+
+    y = _draw_profile_section(report, left, y - 1 * cm, 'Exp. Mitigation')
+    for label, ratio in get_mitigation_bars(analysis, sections):
+        report.draw_text(left, y - 0.55 * cm, label, 10, max_width=6 * cm)
+        y -= 0.6 * cm + 0.4 * cm
+        canvas.setFillColor(HexColor(MAIN_GRAY))
+        canvas.rect(left, y, 6 * cm, 0.4 * cm, stroke=0, fill=1)
+        canvas.setFillColor(HexColor(MAIN_BLUE))
+        canvas.rect(left, y, max(0.0, min(float(ratio), 1.0)) * 6 * cm, 0.4 * cm, stroke=0, fill=1)
+
+
+def _draw_profile_section(report: '_ReportCanvas', x: float, y: float, title: str) -> float:
+    report.draw_text(x, y, title, 20, color=TEXT_BLACK)
+    title_width = stringWidth(title + ' ', FONT, 20)
+    report.canvas.setFillColor(HexColor(TEXT_BLACK))
+    report.canvas.rect(x + title_width, y + 4, 6 * cm - title_width, 1, stroke=0, fill=1)
+    return y - 0.2 * cm
+
+
+def _draw_entropy_graph(report: '_ReportCanvas', analysis: dict, tmp_dir):
+    binwalk = analysis.get('binwalk') if isinstance(analysis, dict) else None
+    graph = binwalk.get('entropy_analysis_graph') if isinstance(binwalk, dict) else None
+    if not graph:
+        return
+    try:
+        image = ImageReader(store_base64_image(graph, 'entropy_analysis_graph', tmp_dir))
+        width, height = _scaled_size(image, report.text_width)
+        report.y -= height
+        report.canvas.drawImage(image, report.left, report.y, width, height, mask='auto')
+    except Exception as error:  # pylint: disable=broad-except
+        logging.warning('Could not add entropy graph to report: {}'.format(error))
+
+
+@lru_cache(maxsize=1)
+def _load_logo():
+    # the logo is only shown 5cm wide, a downscaled copy keeps the per report compression cheap
+    with Image.open(str(LOGO_PATH)) as logo:
+        logo.thumbnail((LOGO_WIDTH_PIXELS, LOGO_WIDTH_PIXELS * logo.height // logo.width))
+        return ImageReader(logo.copy())
+
+
+def _scaled_size(image, width: float) -> Tuple[float, float]:
+    pixel_width, pixel_height = image.getSize()
+    return width, width * pixel_height / pixel_width
+
+
+class _ReportCanvas:
+    '''
+    Keeps track of the vertical position in the main column and starts a new page (without sidebar) once it is full.
+    '''
+    LINE_HEIGHT = 0.6 * cm
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.width, self.height = letter
+        self.left, self.right, self.bottom = 7.6 * cm, self.width - 1 * cm, 0.5 * cm
+        self.text_width = self.right - self.left
+        self.y = self.height - 0.5 * cm
+        self.section_count = 0
+
+    def draw_text(self, x: float, y: float, text: str, size: float, font=FONT, color=TEXT_GRAY, max_width: Optional[float] = None) -> float:
+        self.canvas.setFont(font, size)
+        self.canvas.setFillColor(HexColor(color))
+        self.canvas.drawString(x, y, _fit_text(text, font, size, max_width) if max_width else text)
+        return y
+
+    def section(self, title: str, rows: List[Tuple[str, str]]):
+        self._reserve(1.2 * cm + self.LINE_HEIGHT)
+        color = MAIN_GRAY if self.section_count % 2 == 0 else MAIN_BLUE
+        self.section_count += 1
+        title_width = stringWidth(title, FONT, 14) + 0.2 * cm
+        self.y -= 1 * cm
+        self.canvas.setFillColor(HexColor(color))
+        self.canvas.roundRect(self.left, self.y - 0.15 * cm, title_width, 0.65 * cm, 3, stroke=0, fill=1)
+        self.draw_text(self.left + 0.1 * cm, self.y, title, 14, color='#FFFFFF')
+        self.y -= 0.2 * cm
+
+        value_offset = 0.17 * self.text_width
+        for left_column, right_column in rows:
+            self._reserve(self.LINE_HEIGHT)
+            self.y -= self.LINE_HEIGHT
+            self.draw_text(self.left, self.y, left_column, 10, max_width=self.text_width if not right_column else value_offset - 4)
+            if right_column:
+                self.draw_text(self.left + value_offset, self.y, right_column, 10, font=BOLD_FONT, max_width=self.text_width - value_offset)
+
+    def _reserve(self, height: float):
+        if self.y - height < self.bottom:
+            self.canvas.showPage()
+            self.left, self.text_width = 1 * cm, self.right - 1 * cm
+            self.y = self.height - 1 * cm
+
+
+def _fit_text(text: str, font: str, size: float, max_width: float) -> str:
+    if stringWidth(text, font, size) <= max_width:
+        return text
+    while text and stringWidth(text + '...', font, size) > max_width:
+        text = text[:max(len(text) - max(len(text) // 8, 1), 0)]
+    return text + '...'
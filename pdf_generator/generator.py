@@ -1,30 +1,176 @@
 import os
 import shutil
+import signal
+import subprocess
+import time
 from pathlib import Path
+from threading import Thread
+from typing import List, NamedTuple, Optional, Tuple
 
-from common_helper_process import execute_shell_command_get_return_code
-
+from pdf_generator.instrumentation import get_recorder, stage
+from pdf_generator.latex_errors import find_first_error, LatexCompilationError
+from pdf_generator.latex_format import get_format_file, link_format_file, TEMPLATE_DIR
+from pdf_generator.reproducible import get_reproducible_environment, is_reproducible, write_reproducible_settings
+from pdf_generator.result_cache import compute_input_hash
 from pdf_generator.tex_generation.template_engine import (
-    CUSTOM_TEMPLATE_CLASS, LOGO_FILE, MAIN_TEMPLATE, META_TEMPLATE, TemplateEngine
+    APPENDIX_TEMPLATE, CUSTOM_TEMPLATE_CLASS, LOGO_FILE, MAIN_TEMPLATE, META_TEMPLATE, TemplateEngine
 )
 
 PDF_NAME = Path(MAIN_TEMPLATE).with_suffix('.pdf').name
+LOG_NAME = Path(MAIN_TEMPLATE).with_suffix('.log').name
+
+LATEX_TIMEOUT_VARIABLE = 'FACT_PDF_LATEX_TIMEOUT'
+LATEX_MAX_OUTPUT_VARIABLE = 'FACT_PDF_LATEX_MAX_OUTPUT'
+DEFAULT_LATEX_TIMEOUT = 300
+DEFAULT_LATEX_MAX_OUTPUT = 64 * 1024 * 1024
+WATCHDOG_INTERVAL = 0.05
+MAX_PRINTED_OUTPUT = 4096
+
+
+class LatexLimits(NamedTuple):
+    timeout: float
+    max_output: int
+
+
+def get_latex_limits() -> LatexLimits:
+    return LatexLimits(
+        float(os.environ.get(LATEX_TIMEOUT_VARIABLE, DEFAULT_LATEX_TIMEOUT)),
+        int(os.environ.get(LATEX_MAX_OUTPUT_VARIABLE, DEFAULT_LATEX_MAX_OUTPUT))
+    )
+
+
+def get_latex_environment() -> dict:
+    environment = dict(os.environ, buf_size='1000000')
+    if is_reproducible():
+        environment.update(get_reproducible_environment())
+    return environment
+
+
+def check_limits(started: float, limits: LatexLimits, directory, output_size=0) -> Optional[str]:
+    '''
+    Reason to stop a running pdflatex: wall time since started or size of its terminal output / main.log over limits.
+    '''
+    if time.monotonic() - started > limits.timeout:
+        return 'pdflatex exceeded the time limit of {} seconds'.format(limits.timeout)
+    try:
+        log_size = Path(directory, LOG_NAME).stat().st_size
+    except FileNotFoundError:
+        log_size = 0
+    if max(output_size, log_size) > limits.max_output:
+        return 'pdflatex exceeded the output limit of {} bytes'.format(limits.max_output)
+    return None
+
+
+def kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class _OutputReader(Thread):
+    '''
+    Drains the terminal output of a process, keeping at most limit bytes of it.
+    '''
+
+    def __init__(self, stream, limit: int):
+        super().__init__(daemon=True)
+        self.stream, self.limit = stream, limit
+        self.chunks, self.size = [], 0
+
+    def run(self):
+        for chunk in iter(lambda: self.stream.read1(65536), b''):
+            if self.size < self.limit:
+                self.chunks.append(chunk[:self.limit - self.size])
+            self.size += len(chunk)
+
+    @property
+    def text(self) -> str:
+        return b''.join(self.chunks).decode(errors='replace')
+
+
+def execute_command_in_directory(command: List[str], directory, limits: Optional[LatexLimits] = None) -> Tuple[str, int]:
+    '''
+    Run command in directory under a watchdog. If it exceeds limits (see check_limits), the process and everything it
+    started is killed and LatexCompilationError is raised.
+    '''
+    limits = limits if limits is not None else get_latex_limits()
+    try:
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            command, cwd=str(directory), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            env=get_latex_environment(), start_new_session=True
+        )
+    except OSError as error:
+        return str(error), 127
+
+    reader = _OutputReader(process.stdout, limits.max_output)
+    reader.start()
+    started = time.monotonic()
+    with process:
+        while True:
+            try:
+                return_code = process.wait(timeout=WATCHDOG_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                violation = check_limits(started, limits, directory, reader.size)
+                if violation:
+                    kill_process_group(process)
+                    process.wait()
+                    reader.join()
+                    raise LatexCompilationError(violation, find_first_error(Path(directory, LOG_NAME), Path(directory, MAIN_TEMPLATE)), killed=True)
+        reader.join()
+    return reader.text, return_code
+
+
+def build_latex_command(tmp_dir, format_file=None) -> List[str]:
+    if format_file:
+        format_name = link_format_file(format_file, tmp_dir)
+        return ['pdflatex', '-interaction=batchmode', '-fmt={}'.format(format_name), MAIN_TEMPLATE]
+    return ['pdflatex', MAIN_TEMPLATE]
 
 
-def execute_latex(tmp_dir):
-    current_dir = os.getcwd()
-    os.chdir(tmp_dir)
-    output, return_code = execute_shell_command_get_return_code('env buf_size=1000000 pdflatex {}'.format(MAIN_TEMPLATE))
+def execute_latex(tmp_dir, format_file=None):
+    with stage('latex', python_stage=False):
+        output, return_code = execute_command_in_directory(build_latex_command(tmp_dir, format_file), tmp_dir)
+    record_latex_statistics(tmp_dir)
+    check_latex_result(tmp_dir, output, return_code)
+
+
+def record_latex_statistics(tmp_dir):
+    recorder = get_recorder()
+    if recorder:
+        recorder.record_latex_log(Path(tmp_dir, LOG_NAME))
+
+
+def check_latex_result(tmp_dir, output: str, return_code: int):
     if return_code != 0:
-        error_log = output if not Path('main.log').is_file() else Path('main.log').read_text()
-        print(f'Warnings / Errors when trying to build PDF:\n{error_log}')
-        if not Path('main.pdf').exists():
-            raise RuntimeError('No pdf output generated. Aborting.')
-    os.chdir(current_dir)
+        error = find_first_error(Path(tmp_dir, LOG_NAME), Path(tmp_dir, MAIN_TEMPLATE))
+        summary = error.describe() if error is not None else output[-MAX_PRINTED_OUTPUT:]
+        print(f'Warnings / Errors when trying to build PDF:\n{summary}')
+        if not Path(tmp_dir, PDF_NAME).exists():
+            raise LatexCompilationError('No pdf output generated. Aborting.', error, return_code)
+
+
+def link_fact_image(target):
+    link_file(TEMPLATE_DIR / LOGO_FILE, Path(target) / LOGO_FILE)
 
 
-def copy_fact_image(target):
-    shutil.copy(str(Path(__file__).parent / 'templates' / LOGO_FILE), str(Path(target) / LOGO_FILE))
+def link_template_class(target, template_style='default'):
+    class_file = TEMPLATE_DIR / template_style / CUSTOM_TEMPLATE_CLASS
+    if class_file.is_file():
+        link_file(class_file, Path(target) / CUSTOM_TEMPLATE_CLASS)
+
+
+def link_file(source: Path, target: Path):
+    '''
+    Static template files are only read by pdflatex, so jobs get a symlink instead of a copy where possible.
+    '''
+    if target.is_symlink() or target.exists():
+        target.unlink()
+    try:
+        target.symlink_to(source)
+    except OSError:
+        shutil.copy(str(source), str(target))
 
 
 def create_report_filename(meta_data):
@@ -33,18 +179,101 @@ def create_report_filename(meta_data):
     return safer_name.encode('latin-1', errors='ignore').decode('latin-1')
 
 
-def compile_pdf(meta_data, tmp_dir):
-    copy_fact_image(tmp_dir)
-    execute_latex(tmp_dir)
+def prepare_typesetting(tmp_dir, cache=None) -> Tuple[Optional[str], bool]:
+    '''
+    Add the static files to tmp_dir and look its input up in cache. Returns the cache key and whether main.pdf of
+    tmp_dir was taken from cache.
+    '''
+    link_fact_image(tmp_dir)
+    if is_reproducible():
+        write_reproducible_settings(tmp_dir)
+    if not cache:
+        return None, False
+    cache_key = compute_input_hash(tmp_dir)
+    return cache_key, cache.get(cache_key, Path(tmp_dir, PDF_NAME))
+
+
+def retry_without_format(error: RuntimeError, format_file: Optional[Path]) -> bool:
+    # a broken format should not break the report, but a run killed for exceeding the limits would only be killed again
+    return format_file is not None and not (isinstance(error, LatexCompilationError) and error.killed)
+
+
+def finish_typesetting(tmp_dir, cache=None, cache_key=None) -> Path:
+    pdf_path = Path(tmp_dir, PDF_NAME)
+    if cache:
+        cache.put(cache_key, pdf_path)
+    return pdf_path
+
+
+def typeset_pdf(tmp_dir, template_style='default', cache=None, latex_pool=None) -> Path:
+    '''
+    Compile main.tex of tmp_dir (or take the result from cache) and return the path of the resulting main.pdf.
+    '''
+    cache_key, cached = prepare_typesetting(tmp_dir, cache)
+    if cached:
+        return Path(tmp_dir, PDF_NAME)
+
+    format_file = get_format_file(template_style)
+    try:
+        if latex_pool is None or not latex_pool.compile(tmp_dir):
+            execute_latex(tmp_dir, format_file)
+    except RuntimeError as error:
+        if not retry_without_format(error, format_file):
+            raise
+        execute_latex(tmp_dir)
+    return finish_typesetting(tmp_dir, cache, cache_key)
+
+
+def compile_pdf(meta_data, tmp_dir, template_style='default', cache=None, latex_pool=None):
     target_path = Path(tmp_dir, create_report_filename(meta_data))
-    shutil.move(str(Path(tmp_dir, PDF_NAME)), str(target_path))
+    os.replace(str(typeset_pdf(tmp_dir, template_style, cache, latex_pool)), str(target_path))
     return target_path
 
 
-def create_templates(analysis, meta_data, tmp_dir, template_style='default'):
-    engine = TemplateEngine(template_folder=template_style, tmp_dir=tmp_dir)
-    Path(tmp_dir, MAIN_TEMPLATE).write_text(engine.render_main_template(analysis=analysis))
-    Path(tmp_dir, META_TEMPLATE).write_text(engine.render_meta_template(meta_data))
+def reserve_output_path(output_dir: Path, file_name: str) -> Path:
+    '''
+    Atomically create an empty file for the report, adding a counter to the name if it is already taken.
+    '''
+    name = Path(file_name)
+    for counter in range(10000):
+        candidate = output_dir / (file_name if counter == 0 else '{}_{}{}'.format(name.stem, counter, name.suffix))
+        try:
+            with candidate.open('x'):
+                return candidate
+        except FileExistsError:
+            continue
+    raise RuntimeError('Could not find a free output name for {}'.format(file_name))
+
+
+def publish_pdf(pdf_path: Path, output_dir: Path, owner_reference: Path, reserve=False) -> Path:
+    '''
+    Move the report to output_dir. With reserve, an existing report of the same name is kept and the new one gets a
+    counter added to its name (see reserve_output_path).
+    '''
+    with stage('publish'):
+        output_path = reserve_output_path(output_dir, pdf_path.name) if reserve else output_dir / pdf_path.name
+        shutil.move(str(pdf_path), str(output_path))
+        change_owner(output_path, owner_reference)
+    return output_path
+
+
+def change_owner(path: Path, owner_reference: Path):
+    file_stats = owner_reference.lstat()
+    shutil.chown(path, user=file_stats.st_uid, group=file_stats.st_gid)
+
 
-    if template_style == 'default':
-        Path(tmp_dir, CUSTOM_TEMPLATE_CLASS).write_text(engine.render_template_class())
+def create_templates(analysis, meta_data, tmp_dir, template_style='default', engine=None, appendix=False, sections=None):
+    '''
+    Write main.tex and meta.tex (and with appendix the full inventory appendix.tex) to tmp_dir. The templates are
+    streamed to their files instead of being rendered into strings first. sections (see reduce_analysis) can be
+    passed if the analysis was reduced already.
+    '''
+    if engine is None:
+        engine = TemplateEngine(template_folder=template_style, tmp_dir=tmp_dir)
+    with stage('render'):
+        utc = is_reproducible()
+        engine.stream_main_template(analysis=analysis, tmp_dir=tmp_dir, sections=sections, appendix=appendix, utc=utc).dump(str(Path(tmp_dir, MAIN_TEMPLATE)))
+        Path(tmp_dir, META_TEMPLATE).write_text(engine.render_meta_template(meta_data, utc=utc))
+        if appendix:
+            engine.stream_appendix_template(analysis).dump(str(Path(tmp_dir, APPENDIX_TEMPLATE)))
+    link_template_class(tmp_dir, template_style)
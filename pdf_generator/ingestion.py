@@ -0,0 +1,143 @@
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import ijson
+
+from pdf_generator.instrumentation import stage
+from pdf_generator.tex_generation.ip_classification import IpClassification
+
+# plugins whose summary values (lists of uids) are only ever counted by the templates
+REDUCED_PLUGINS = {
+    'cpu_architecture', 'crypto_material', 'cve_lookup', 'exploit_mitigations', 'file_type', 'ip_and_uri_finder',
+    'known_vulnerabilities', 'software_components'
+}
+SAMPLE_SIZE = 3
+CLASSIFICATION_BATCH_SIZE = 4096
+
+_CONTAINER_START = {'start_map': dict, 'start_array': list}
+_CONTAINER_END = {'end_map', 'end_array'}
+
+
+class UidList:
+    '''
+    Stand-in for a summary list of uids that only keeps its length and the first few entries.
+    '''
+    __slots__ = ('count', 'sample')
+
+    def __init__(self, count=0, sample=()):
+        self.count = count
+        self.sample = tuple(sample)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.sample)
+
+    def __eq__(self, other):
+        return isinstance(other, UidList) and (self.count, self.sample) == (other.count, other.sample)
+
+    def __repr__(self):
+        return 'UidList(count={}, sample={})'.format(self.count, self.sample)
+
+
+def load_analysis(file_path: Path, sample_size=SAMPLE_SIZE, full_inventory=False) -> dict:
+    '''
+    Parse analysis.json incrementally. The uid lists of the summaries of REDUCED_PLUGINS are counted while reading
+    instead of being materialized, so memory usage does not grow with the number of files in the firmware.
+    Everything else, including unknown plugins and the entropy graph, is loaded unchanged.
+    With full_inventory the IP and URI elements are kept for the appendix instead of only being counted.
+    '''
+    with stage('load_json'), Path(file_path).open('rb') as input_file:
+        return build_reduced_analysis(ijson.parse(input_file, use_float=True), sample_size, full_inventory)
+
+
+def build_reduced_analysis(events: Iterator[Tuple[str, str, object]], sample_size=SAMPLE_SIZE, full_inventory=False):
+    root = None
+    containers, keys = [], []
+    for _, event, value in events:
+        if event == 'map_key':
+            keys[-1] = value
+            continue
+        if event in _CONTAINER_END:
+            containers.pop()
+            keys.pop()
+            continue
+
+        if event == 'start_array' and _is_reduced_summary_entry(containers, keys):
+            value = count_array(events, sample_size)
+        elif event == 'start_map' and _is_ip_summary(containers, keys):
+            value = classify_ip_summary(events, keep_elements=full_inventory)
+        elif event in _CONTAINER_START:
+            value = _CONTAINER_START[event]()
+
+        if not containers:
+            root = value
+        elif isinstance(containers[-1], dict):
+            containers[-1][keys[-1]] = value
+        else:
+            containers[-1].append(value)
+
+        if event in _CONTAINER_START and isinstance(value, (dict, list)):
+            containers.append(value)
+            keys.append(None)
+    return root
+
+
+def _is_reduced_summary_entry(containers, keys) -> bool:
+    return len(containers) == 3 and keys[0] in REDUCED_PLUGINS and keys[1] == 'summary' and isinstance(containers[2], dict)
+
+
+def _is_ip_summary(containers, keys) -> bool:
+    return len(containers) == 2 and keys[0] == 'ip_and_uri_finder' and keys[1] == 'summary'
+
+
+def classify_ip_summary(events: Iterator[Tuple[str, str, object]], keep_elements=False) -> IpClassification:
+    '''
+    Consume the events of the ip_and_uri_finder summary map whose start_map event was just read.
+    The keys are classified in batches as they are read, their uid lists are skipped.
+    '''
+    classification, batch = IpClassification(keep_elements), []
+    for _, event, value in events:
+        if event == 'map_key':
+            batch.append(value)
+            if len(batch) == CLASSIFICATION_BATCH_SIZE:
+                classification.add_batch(batch)
+                batch = []
+        elif event in _CONTAINER_START:
+            _skip_container(events)
+        elif event == 'end_map':
+            classification.add_batch(batch)
+            return classification
+    raise ValueError('Incomplete json input: map was not closed')
+
+
+def _skip_container(events: Iterator[Tuple[str, str, object]]):
+    depth = 1
+    for _, event, _ in events:
+        if event in _CONTAINER_START:
+            depth += 1
+        elif event in _CONTAINER_END:
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def count_array(events: Iterator[Tuple[str, str, object]], sample_size=SAMPLE_SIZE) -> UidList:
+    '''
+    Consume the events of an array whose start_array event was just read and count its top level elements.
+    '''
+    count, depth, sample = 0, 1, []
+    for _, event, value in events:
+        if event in _CONTAINER_START:
+            count += depth == 1
+            depth += 1
+        elif event in _CONTAINER_END:
+            depth -= 1
+            if depth == 0:
+                return UidList(count, sample)
+        elif event != 'map_key' and depth == 1:
+            count += 1
+            if len(sample) < sample_size:
+                sample.append(value)
+    raise ValueError('Incomplete json input: array was not closed')
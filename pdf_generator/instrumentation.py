@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import re
+import resource
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from threading import Lock, local
+from typing import Callable, Optional
+
+PROFILE_VARIABLE = 'FACT_PDF_PROFILE'
+SIDECAR_SUFFIX = '.metrics.json'
+HASH_CHUNK_SIZE = 1 << 16
+
+_PAGES_REGEX = re.compile(r'^Output written on .* \((\d+) pages?, (\d+) bytes\)')
+_MEMORY_REGEX = re.compile(r'^ (\d+) (strings|string characters|words of memory|multiletter control sequences) out of (\d+)')
+_CURRENT = local()  # holds the recorder of the report rendered by the thread
+
+
+def _max_rss_kib(who) -> int:
+    return resource.getrusage(who).ru_maxrss
+
+
+class StageRecorder:
+    '''
+    Collects wall time and cpu time (of this process and of child processes like pdflatex) per pipeline stage.
+    children_cpu_time covers every child that finished during the stage, including the compiles of other threads.
+    The peak RSS values are the high-water marks of the process (and of its largest child) when the stage ended, so
+    they are cumulative and not specific to the stage. Setting FACT_PDF_PROFILE to a directory additionally dumps
+    cProfile and tracemalloc data of python stages.
+    '''
+
+    def __init__(self, profile_dir=None):
+        self.stages = OrderedDict()
+        self.latex = {}
+        self._profiling = False
+        self._lock = Lock()  # stages may run in several threads, e.g. when styles are typeset concurrently
+        profile_dir = profile_dir if profile_dir is not None else os.environ.get(PROFILE_VARIABLE)
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+
+    @contextmanager
+    def stage(self, name: str, python_stage=True):
+        profiler = self._start_profiling() if python_stage and self.profile_dir else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            yield
+        finally:
+            children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            with self._lock:
+                self._add_metrics(name, wall_start, cpu_start, children_start, children_end)
+            if profiler:
+                self._stop_profiling(name, profiler)
+
+    def _add_metrics(self, name, wall_start, cpu_start, children_start, children_end):
+        metrics = self.stages.setdefault(name, {'wall_time': 0.0, 'cpu_time': 0.0, 'children_cpu_time': 0.0, 'calls': 0})
+        metrics['wall_time'] += time.perf_counter() - wall_start
+        metrics['cpu_time'] += time.process_time() - cpu_start
+        metrics['children_cpu_time'] += (
+            children_end.ru_utime + children_end.ru_stime - children_start.ru_utime - children_start.ru_stime
+        )
+        metrics['calls'] += 1
+        metrics['process_peak_rss_kib'] = _max_rss_kib(resource.RUSAGE_SELF)
+        metrics['children_process_peak_rss_kib'] = children_end.ru_maxrss
+
+    def _start_profiling(self):
+        # profiling is opt-in, its modules are not imported on the way of a normal report run
+        import cProfile  # pylint: disable=import-outside-toplevel
+        import tracemalloc  # pylint: disable=import-outside-toplevel
+        with self._lock:
+            if self._profiling:  # one profiled stage at a time, tracemalloc is process wide
+                return None
+            self._profiling = True
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+        return profiler
+
+    def _stop_profiling(self, name, profiler):
+        import tracemalloc  # pylint: disable=import-outside-toplevel
+        profiler.disable()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self.profile_dir / '{}-{}-{}'.format(name, os.getpid(), int(time.time() * 1000))
+        profiler.dump_stats('{}.prof'.format(prefix))
+        tracemalloc.take_snapshot().dump('{}.tracemalloc'.format(prefix))
+        tracemalloc.stop()
+        self._profiling = False
+
+    def record_latex_log(self, log_file: Path):
+        if log_file.is_file():
+            self.latex = parse_latex_log(log_file)
+
+    def to_dict(self) -> dict:
+        return {'stages': self.stages, 'latex': self.latex}
+
+    def write_sidecar(self, pdf_path: Path) -> Path:
+        return write_sidecar(pdf_path, self.to_dict())
+
+
+def write_sidecar(pdf_path: Path, metrics: dict) -> Path:
+    sidecar = pdf_path.with_name(pdf_path.stem + SIDECAR_SUFFIX)
+    if pdf_path.is_file():
+        metrics = dict(metrics, pdf=describe_pdf(pdf_path))
+    sidecar.write_text(json.dumps(metrics, indent=2))
+    return sidecar
+
+
+def describe_pdf(pdf_path: Path) -> dict:
+    '''
+    Size and sha256 of the pdf, in reproducible mode the hash can be compared across runs.
+    '''
+    sha256 = hashlib.sha256()
+    with pdf_path.open('rb') as pdf:
+        for chunk in iter(lambda: pdf.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return {'sha256': sha256.hexdigest(), 'bytes': pdf_path.stat().st_size}
+
+
+def parse_latex_log(log_file: Path) -> dict:
+    statistics = {'pages': None, 'output_bytes': None, 'warnings': 0, 'tex_memory': {}}
+    with log_file.open(errors='replace') as log:
+        for line in log:
+            if 'Warning' in line:
+                statistics['warnings'] += 1
+            elif line.startswith('Output written on'):
+                match = _PAGES_REGEX.match(line)
+                if match:
+                    statistics['pages'], statistics['output_bytes'] = int(match.group(1)), int(match.group(2))
+            elif line.startswith(' ') and ' out of ' in line:
+                match = _MEMORY_REGEX.match(line)
+                if match:
+                    statistics['tex_memory'][match.group(2)] = {'used': int(match.group(1)), 'available': int(match.group(3))}
+    return statistics
+
+
+def append_metrics(metrics_file: Path, job_name: str, metrics: dict):
+    with metrics_file.open('a') as output:
+        output.write(json.dumps(dict(metrics, job=job_name, timestamp=time.time())) + '\n')
+
+
+def get_recorder() -> Optional[StageRecorder]:
+    return getattr(_CURRENT, 'recorder', None)
+
+
+@contextmanager
+def recording(recorder: Optional[StageRecorder] = None):
+    '''
+    Make recorder (a new one by default) the recorder of the calling thread. Threads started inside do not inherit it,
+    pass it on with recording(recorder) there.
+    '''
+    recorder = recorder if recorder is not None else StageRecorder()
+    previous, _CURRENT.recorder = get_recorder(), recorder
+    try:
+        yield recorder
+    finally:
+        _CURRENT.recorder = previous
+
+
+def bind_recorder(function: Callable) -> Callable:
+    '''
+    Wrap function so that it records into the recorder of the calling thread, also when it is run by another thread.
+    '''
+    recorder = get_recorder()
+    if recorder is None:
+        return function
+
+    @wraps(function)
+    def run_with_recorder(*args, **kwargs):
+        with recording(recorder):
+            return function(*args, **kwargs)
+    return run_with_recorder
+
+
+@contextmanager
+def stage(name: str, python_stage=True):
+    recorder = get_recorder()
+    if recorder is None:
+        yield
+        return
+    with recorder.stage(name, python_stage=python_stage):
+        yield
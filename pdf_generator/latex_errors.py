@@ -0,0 +1,97 @@
+import re
+from itertools import islice
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+CONTEXT_LINES = 2
+MAX_LINES_AFTER_ERROR = 30
+MAX_CONTEXT_LINE_LENGTH = 200
+
+ERROR_CATEGORIES = [
+    ('capacity_exceeded', re.compile(r'TeX capacity exceeded')),
+    ('undefined_control_sequence', re.compile(r'Undefined control sequence')),
+    ('missing_file', re.compile(r"File `.*' not found|I can't find file")),
+    ('invalid_character', re.compile(r'invalid character|Package inputenc Error|Unicode character')),
+    ('unbalanced_input', re.compile(
+        r'Missing [${}] inserted|Extra [{}]|Extra alignment tab|Misplaced alignment tab|Paragraph ended before|'
+        r'Runaway argument|File ended while scanning|Too many }'
+    )),
+    ('emergency_stop', re.compile(r'Emergency stop')),
+]
+OTHER_CATEGORY = 'other'
+
+_LINE_REGEX = re.compile(r'^l\.(\d+) ?(.*)')
+
+
+class LatexError(NamedTuple):
+    category: str
+    message: str
+    line: Optional[int]
+    context: List[str]
+
+    def describe(self) -> str:
+        location = ' (main.tex line {})'.format(self.line) if self.line is not None else ''
+        return '\n'.join(['[{}] {}{}'.format(self.category, self.message, location), *self.context])
+
+
+class LatexCompilationError(RuntimeError):
+    '''
+    pdflatex did not produce a usable pdf. error holds the first error of main.log (if there is one), killed is set
+    if the watchdog had to stop pdflatex because it exceeded its time or output limit.
+    '''
+
+    def __init__(self, message: str, error: Optional[LatexError] = None, return_code: Optional[int] = None, killed=False):
+        super().__init__(message if error is None else '{}\n{}'.format(message, error.describe()))
+        self.error = error
+        self.return_code = return_code
+        self.killed = killed
+
+
+def classify_error(message: str) -> str:
+    for category, regex in ERROR_CATEGORIES:
+        if regex.search(message):
+            return category
+    return OTHER_CATEGORY
+
+
+def find_first_error(log_file: Path, main_tex: Optional[Path] = None) -> Optional[LatexError]:
+    '''
+    Read log_file line by line until the first TeX error ("! ..." line) and the "l.<n>" line pointing to its source
+    line. The context lines are taken from main_tex if given.
+    '''
+    if not log_file.is_file():
+        return None
+    message, line_number = None, None
+    with log_file.open(errors='replace') as log:
+        for line in log:
+            if message is None:
+                if line.startswith('!'):
+                    message, lines_after = line[1:].strip(), 0
+                continue
+            match = _LINE_REGEX.match(line)
+            if match:
+                line_number = int(match.group(1))
+                break
+            lines_after += 1
+            if lines_after > MAX_LINES_AFTER_ERROR:
+                break
+    if message is None:
+        return None
+    context = read_context(main_tex, line_number) if main_tex is not None and line_number is not None else []
+    return LatexError(classify_error(message), message, line_number, context)
+
+
+def read_context(tex_file: Path, line_number: int) -> List[str]:
+    if not tex_file.is_file():
+        return []
+    first_line = max(line_number - CONTEXT_LINES, 1)
+    with tex_file.open(errors='replace') as tex:
+        lines = islice(tex, first_line - 1, line_number + CONTEXT_LINES)
+        return [
+            '{}{:>5}: {}'.format('>' if number == line_number else ' ', number, _shorten(line.rstrip('\n')))
+            for number, line in enumerate(lines, start=first_line)
+        ]
+
+
+def _shorten(line: str) -> str:
+    return line if len(line) <= MAX_CONTEXT_LINE_LENGTH else '{}...'.format(line[:MAX_CONTEXT_LINE_LENGTH])
@@ -0,0 +1,141 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, NamedTuple, Optional, Tuple
+
+from pdf_generator.cache_directory import get_cache_directory
+from pdf_generator.tex_generation.template_engine import CUSTOM_TEMPLATE_CLASS, MAIN_TEMPLATE
+
+FORMAT_CACHE_VERSION = 1
+DUMP_MARKER = r'\csname endofdump\endcsname'
+TEMPLATE_DIR = Path(__file__).parent / 'templates'
+
+_FAILED_FORMATS = set()
+
+
+def get_preamble(main_template: Path) -> Optional[str]:
+    '''
+    Everything in front of the dump marker is static and can be dumped into a format.
+    Templates without the marker are always compiled from scratch.
+    '''
+    content = main_template.read_text()
+    if DUMP_MARKER not in content:
+        return None
+    return content.split(DUMP_MARKER, 1)[0]
+
+
+@lru_cache(maxsize=1)
+def get_pdflatex_version() -> str:
+    try:
+        output = subprocess.run(['pdflatex', '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False).stdout
+    except OSError:
+        return 'unavailable'
+    return output.decode(errors='replace').split('\n', 1)[0]
+
+
+def get_format_name(template_style: str, class_file: Path, preamble: str) -> str:
+    key = sha256()
+    for part in (get_pdflatex_version().encode(), class_file.read_bytes(), preamble.encode()):
+        key.update(sha256(part).digest())
+    return '{}-{}'.format(template_style, key.hexdigest()[:16])
+
+
+class FormatSource(NamedTuple):
+    name: str
+    class_file: Path
+    preamble: str
+
+
+def find_format(template_style='default') -> Tuple[Optional[Path], Optional[FormatSource]]:
+    '''
+    Return the cached format file of template_style and, if it still has to be built, the source to build it from.
+    The cache key covers the class file and the preamble of main.tex, so changes to either lead to a rebuild.
+    The format file is None if the style has no dumpable preamble or building its format failed before.
+    '''
+    template_dir = TEMPLATE_DIR / template_style
+    class_file = template_dir / CUSTOM_TEMPLATE_CLASS
+    if not class_file.is_file() or not (template_dir / MAIN_TEMPLATE).is_file():
+        return None, None
+    preamble = get_preamble(template_dir / MAIN_TEMPLATE)
+    if preamble is None:
+        return None, None
+
+    format_name = get_format_name(template_style, class_file, preamble)
+    format_file = get_cache_directory('formats/v{}'.format(FORMAT_CACHE_VERSION)) / '{}.fmt'.format(format_name)
+    if format_file.is_file():
+        return format_file, None
+    if format_name in _FAILED_FORMATS:
+        return None, None
+    return format_file, FormatSource(format_name, class_file, preamble)
+
+
+def finish_format_build(format_file: Path, source: FormatSource, built: bool) -> Optional[Path]:
+    if not built:
+        _FAILED_FORMATS.add(source.name)
+        return None
+    return format_file
+
+
+def get_format_file(template_style='default') -> Optional[Path]:
+    '''
+    Return the dumped format for template_style, building it on first use (see find_format).
+    None is returned if the style has no dumpable preamble or the format can not be built.
+    '''
+    format_file, source = find_format(template_style)
+    if source is None:
+        return format_file
+    return finish_format_build(format_file, source, build_format(format_file, source.class_file, source.preamble))
+
+
+def build_format(format_file: Path, class_file: Path, preamble: str) -> bool:
+    with TemporaryDirectory() as build_dir:
+        command = prepare_format_build(build_dir, format_file, class_file, preamble)
+        try:
+            process = subprocess.run(
+                command, cwd=build_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=get_format_environment(), check=False
+            )
+        except OSError as error:
+            logging.warning('Could not build LaTeX format: {}'.format(error))
+            return False
+        return install_format(build_dir, format_file, process.returncode)
+
+
+def get_format_environment() -> dict:
+    return dict(os.environ, buf_size='1000000')
+
+
+def prepare_format_build(build_dir: str, format_file: Path, class_file: Path, preamble: str) -> List[str]:
+    '''
+    Write the files for dumping preamble into build_dir and return the pdflatex command to run there.
+    '''
+    shutil.copy(str(class_file), build_dir)
+    Path(build_dir, 'preamble.tex').write_text('{}{}\n'.format(preamble, DUMP_MARKER))
+    return [
+        'pdflatex', '-ini', '-interaction=batchmode', '-jobname={}'.format(format_file.stem),
+        '&pdflatex', 'mylatexformat.ltx', 'preamble.tex'
+    ]
+
+
+def install_format(build_dir: str, format_file: Path, return_code: int) -> bool:
+    built_format = Path(build_dir, format_file.name)
+    if return_code != 0 or not built_format.is_file():
+        logging.warning('Could not build LaTeX format {}, falling back to full compilation'.format(format_file.name))
+        return False
+    # copy next to the target first, so concurrent builders never see a partially written format
+    partial_file = format_file.with_suffix('.{}-{}.partial'.format(os.getpid(), threading.get_ident()))
+    shutil.copy(str(built_format), str(partial_file))
+    os.replace(str(partial_file), str(format_file))
+    return True
+
+
+def link_format_file(format_file: Path, target_dir: str) -> str:
+    link = Path(target_dir, format_file.name)
+    if not link.exists():
+        link.symlink_to(format_file)
+    return format_file.stem
@@ -0,0 +1,272 @@
+'''
+Pool of pdflatex processes that are started ahead of time. Each one has loaded the dumped format of the template style
+(process start, kpathsea initialisation and preamble) and blocks on \\input of a fifo until a job writes the part of
+main.tex following the dump marker into it. pdflatex typesets exactly one document per run, so every process is
+replaced right after its job while the next job is being rendered.
+'''
+import errno
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import time
+from pathlib import Path
+from queue import Empty, Queue
+from tempfile import mkdtemp
+from threading import Lock
+from typing import Optional
+
+from pdf_generator.generator import (
+    check_latex_result, check_limits, get_latex_environment, get_latex_limits, LatexLimits, LOG_NAME, MAX_PRINTED_OUTPUT,
+    PDF_NAME, record_latex_statistics
+)
+from pdf_generator.instrumentation import stage
+from pdf_generator.latex_errors import LatexCompilationError
+from pdf_generator.latex_format import DUMP_MARKER, get_format_file, link_format_file
+from pdf_generator.tex_generation.template_engine import MAIN_TEMPLATE
+
+STANDBY_FILE = 'standby.tex'
+JOB_FIFO = 'job.tex'
+TERMINAL_LOG = 'terminal.log'
+JOB_NAME = Path(MAIN_TEMPLATE).stem
+POLL_INTERVAL = 0.005
+
+
+def build_job_input(main_tex: str, job_dir) -> Optional[str]:
+    '''
+    The part of main_tex a standby process still has to read. Files of the job (meta.tex, images) are looked up in
+    job_dir, since the process runs in its slot directory. Returns None if main_tex has no dump marker.
+    '''
+    if DUMP_MARKER not in main_tex:
+        return None
+    body = main_tex.split(DUMP_MARKER, 1)[1]
+    return '\\expandafter\\def\\csname input@path\\endcsname{{{{{}/}}}}\n{}'.format(Path(job_dir).absolute().as_posix(), body)
+
+
+class _StandbySlot:
+    def __init__(self, root: Path, index: int):
+        self.root, self.index = root, index
+        self.directory = None
+        self.process = None
+        self.uses = 0
+        self.started = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def create_directory(self, format_file: Path):
+        self.remove_directory()
+        self.directory = Path(mkdtemp(prefix='slot{}_'.format(self.index), dir=str(self.root)))
+        os.mkfifo(str(self.directory / JOB_FIFO))
+        link_format_file(format_file, str(self.directory))
+        (self.directory / STANDBY_FILE).write_text('{}\n\\input{{{}}}\n'.format(DUMP_MARKER, JOB_FIFO))
+        self.uses = 0
+
+    def remove_directory(self):
+        if self.directory is not None:
+            shutil.rmtree(str(self.directory), ignore_errors=True)
+            self.directory = None
+
+    def clean_directory(self):
+        for output in self.directory.glob('{}.*'.format(JOB_NAME)):
+            output.unlink()
+
+    def spawn(self, format_file: Path):
+        with (self.directory / TERMINAL_LOG).open('wb') as terminal_log:
+            self.process = subprocess.Popen(  # pylint: disable=consider-using-with
+                [
+                    'pdflatex', '-interaction=batchmode', '-fmt={}'.format(format_file.stem), '-jobname={}'.format(JOB_NAME),
+                    STANDBY_FILE
+                ],
+                cwd=str(self.directory), stdin=subprocess.DEVNULL, stdout=terminal_log, stderr=subprocess.STDOUT,
+                env=get_latex_environment(), start_new_session=True
+            )
+        self.started = time.monotonic()
+
+    def open_fifo(self, timeout: float) -> Optional[int]:
+        '''
+        Open the fifo for writing once the process blocks on reading it. Returns None if the process died or did not
+        get there within timeout (measured from its start).
+        '''
+        while self.alive:
+            try:
+                return os.open(str(self.directory / JOB_FIFO), os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as error:
+                if error.errno != errno.ENXIO:  # ENXIO: no reader yet, the process is still loading
+                    raise
+            if time.monotonic() - self.started > timeout:
+                return None
+            time.sleep(POLL_INTERVAL)
+        return None
+
+    def kill(self):
+        if self.process is None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self.process = None
+
+
+class LatexPool:
+    '''
+    Keeps size standby pdflatex processes for template_style. A slot (its directory and fifo) is reused for max_uses
+    jobs before it is recreated. Processes that died or did not get ready within startup_timeout are replaced.
+    compile returns False if no standby process could take the job, callers then compile as usual.
+    Jobs run under the same time and output limits as execute_latex.
+    '''
+
+    def __init__(self, template_style='default', size=1, max_uses=100, startup_timeout=10.0):
+        self.template_style = template_style
+        self.size = size
+        self.max_uses = max_uses
+        self.startup_timeout = startup_timeout
+        self.format_file = None
+        self.restarts = 0
+        self._root = None
+        self._slots = []
+        self._idle = Queue()
+        self._lock = Lock()
+
+    def start(self) -> bool:
+        with self._lock:
+            if self._root is not None:
+                return True
+            self.format_file = get_format_file(self.template_style)
+            if self.format_file is None:
+                logging.warning('No LaTeX format for style {}, standby processes are disabled'.format(self.template_style))
+                return False
+            self._root = Path(mkdtemp(prefix='fact_pdf_standby_'))
+            for index in range(self.size):
+                slot = _StandbySlot(self._root, index)
+                self._slots.append(slot)
+                self._restart(slot)
+                self._idle.put(slot)
+        return True
+
+    def close(self):
+        with self._lock:
+            for slot in self._slots:
+                slot.kill()
+            self._slots = []
+            self._idle = Queue()
+            if self._root is not None:
+                shutil.rmtree(str(self._root), ignore_errors=True)
+                self._root = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def check_health(self):
+        '''
+        Replace idle processes that exited in the meantime (crashed, killed by the OOM killer, ...). Called by compile
+        before it takes a slot, so a job is never handed to a dead process.
+        '''
+        for slot in list(self._slots):
+            if not slot.alive and self._take(slot):
+                self._restart(slot)
+                self._idle.put(slot)
+
+    def compile(self, tmp_dir) -> bool:
+        '''
+        Typeset main.tex of tmp_dir in a standby process, leaving main.pdf and main.log in tmp_dir.
+        Raises RuntimeError like execute_latex if pdflatex did not produce a pdf.
+        '''
+        if self._root is None:
+            return False
+        job_input = build_job_input(Path(tmp_dir, MAIN_TEMPLATE).read_text(), tmp_dir)
+        if job_input is None:
+            return False
+        self.check_health()
+        try:
+            slot = self._idle.get(timeout=self.startup_timeout)
+        except Empty:
+            return False
+        try:
+            return self._compile_in_slot(slot, tmp_dir, job_input)
+        finally:
+            self._restart(slot)
+            self._idle.put(slot)
+
+    def _compile_in_slot(self, slot: _StandbySlot, tmp_dir, job_input: str) -> bool:
+        fifo = slot.open_fifo(self.startup_timeout)
+        if fifo is None:
+            logging.warning('Standby pdflatex process {} is not ready'.format(slot.index))
+            return False
+        limits, started = get_latex_limits(), time.monotonic()
+        with stage('latex', python_stage=False):
+            return_code = self._run_job(slot, fifo, job_input.encode('utf-8', errors='surrogateescape'), limits, started)
+        for output in (PDF_NAME, LOG_NAME):
+            if (slot.directory / output).is_file():
+                shutil.move(str(slot.directory / output), str(Path(tmp_dir, output)))
+        record_latex_statistics(tmp_dir)
+        check_latex_result(tmp_dir, _read_tail(slot.directory / TERMINAL_LOG), return_code)
+        return True
+
+    def _run_job(self, slot: _StandbySlot, fifo: int, job_input: bytes, limits: LatexLimits, started: float) -> int:
+        try:
+            while True:
+                if fifo is not None:
+                    try:
+                        job_input = job_input[os.write(fifo, job_input):]
+                    except BlockingIOError:
+                        pass
+                    except BrokenPipeError:
+                        job_input = b''  # pdflatex stopped reading, its log tells why
+                    if not job_input:
+                        os.close(fifo)  # end of input for pdflatex
+                        fifo = None
+                return_code = slot.process.poll()
+                if return_code is not None:
+                    return return_code
+                violation = check_limits(started, limits, slot.directory, (slot.directory / TERMINAL_LOG).stat().st_size)
+                if violation:
+                    slot.kill()
+                    raise LatexCompilationError(violation, killed=True)
+                time.sleep(POLL_INTERVAL)
+        finally:
+            if fifo is not None:
+                os.close(fifo)
+
+    def _take(self, slot: _StandbySlot) -> bool:
+        idle_slots, taken = [], False
+        while True:
+            try:
+                idle_slot = self._idle.get_nowait()
+            except Empty:
+                break
+            if idle_slot is slot:
+                taken = True
+            else:
+                idle_slots.append(idle_slot)
+        for idle_slot in idle_slots:
+            self._idle.put(idle_slot)
+        return taken
+
+    def _restart(self, slot: _StandbySlot):
+        slot.kill()
+        if slot.directory is None or slot.uses >= self.max_uses:
+            slot.create_directory(self.format_file)
+        else:
+            slot.clean_directory()
+        slot.uses += 1
+        if slot.started:
+            self.restarts += 1
+        try:
+            slot.spawn(self.format_file)
+        except OSError as error:
+            logging.warning('Could not start standby pdflatex process: {}'.format(error))
+
+
+def _read_tail(file_path: Path) -> str:
+    with file_path.open('rb') as output:
+        output.seek(max(file_path.stat().st_size - MAX_PRINTED_OUTPUT, 0))
+        return output.read().decode(errors='replace')
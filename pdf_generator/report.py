@@ -0,0 +1,98 @@
+'''
+Library entry point: render a report from analysis and meta data dicts and get the pdf as bytes or as an open file.
+Each call works in its own scratch directory on tmpfs (if available), so it can be used from many threads at once.
+'''
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import BinaryIO, Dict, Iterable, Optional
+
+from pdf_generator.backends import DIRECT_BACKEND, LATEX_BACKEND
+from pdf_generator.generator import create_templates, typeset_pdf
+from pdf_generator.instrumentation import get_recorder, recording
+from pdf_generator.tex_generation.summary_reduction import reduce_analysis
+from pdf_generator.tex_generation.template_engine import TemplateEngine
+
+SCRATCH_DIR_VARIABLE = 'FACT_PDF_SCRATCH_DIR'
+SHARED_MEMORY_DIR = Path('/dev/shm')
+
+_ENGINES = {}
+_ENGINES_LOCK = Lock()
+
+
+def get_scratch_directory() -> Optional[str]:
+    '''
+    Directory for the files of running jobs: FACT_PDF_SCRATCH_DIR, /dev/shm or (None) the default temp directory.
+    '''
+    configured = os.environ.get(SCRATCH_DIR_VARIABLE)
+    if configured:
+        return configured
+    if SHARED_MEMORY_DIR.is_dir() and os.access(str(SHARED_MEMORY_DIR), os.W_OK | os.X_OK):
+        return str(SHARED_MEMORY_DIR)
+    return None
+
+
+def get_engine(template_style='default') -> TemplateEngine:
+    with _ENGINES_LOCK:
+        if template_style not in _ENGINES:
+            _ENGINES[template_style] = TemplateEngine(template_folder=template_style)
+        return _ENGINES[template_style]
+
+
+def generate_report(analysis: dict, meta_data: dict, template_style='default', backend=LATEX_BACKEND, cache=None, latex_pool=None, appendix=False) -> bytes:
+    with open_report(analysis, meta_data, template_style, backend, cache, latex_pool, appendix) as report:
+        return report.read()
+
+
+def open_report(analysis: dict, meta_data: dict, template_style='default', backend=LATEX_BACKEND, cache=None, latex_pool=None, appendix=False) -> BinaryIO:
+    '''
+    Render the report and return the pdf opened for reading. The scratch directory is already removed at that point,
+    the file only lives on until it is closed.
+    '''
+    with TemporaryDirectory(prefix='fact_pdf_', dir=get_scratch_directory()) as tmp_dir:
+        if backend == DIRECT_BACKEND:
+            from pdf_generator.direct_pdf import render_direct_pdf  # pylint: disable=import-outside-toplevel
+            pdf_path = render_direct_pdf(analysis, meta_data, tmp_dir)
+        else:
+            create_templates(analysis, meta_data, tmp_dir, template_style, engine=get_engine(template_style), appendix=appendix)
+            pdf_path = typeset_pdf(tmp_dir, template_style, cache=cache, latex_pool=latex_pool)
+        return pdf_path.open('rb')
+
+
+def generate_reports(analysis: dict, meta_data: dict, template_styles: Iterable[str], cache=None, appendix=False, max_workers=None) -> Dict[str, bytes]:
+    '''
+    Render one analysis in several template styles and return {style: pdf bytes}, see typeset_styles.
+    '''
+    with TemporaryDirectory(prefix='fact_pdf_', dir=get_scratch_directory()) as tmp_dir:
+        pdf_paths = typeset_styles(analysis, meta_data, template_styles, tmp_dir, cache, appendix, max_workers)
+        return {template_style: pdf_path.read_bytes() for template_style, pdf_path in pdf_paths.items()}
+
+
+def typeset_styles(analysis: dict, meta_data: dict, template_styles: Iterable[str], tmp_dir, cache=None, appendix=False, max_workers=None) -> Dict[str, Path]:
+    '''
+    Typeset the analysis in each style in a sub directory of tmp_dir, concurrently, and return {style: pdf path}.
+    The summaries are reduced once for all styles and images are decoded once (see store_base64_image), so each extra
+    style costs little more than its rendering and pdflatex run. Raises the error of the first failing style.
+    '''
+    template_styles = list(dict.fromkeys(template_styles))
+    sections = reduce_analysis(analysis)
+    recorder = get_recorder()
+
+    def render_style(template_style: str) -> Path:
+        style_dir = Path(tmp_dir, template_style)
+        style_dir.mkdir()
+        create_templates(analysis, meta_data, str(style_dir), template_style, engine=get_engine(template_style), appendix=appendix, sections=sections)
+        return typeset_pdf(str(style_dir), template_style, cache=cache)
+
+    def typeset_style(template_style: str) -> Path:
+        # the recorder of the caller is handed to the worker threads, so their stages end up in its metrics
+        if recorder is None:
+            return render_style(template_style)
+        with recording(recorder):
+            return render_style(template_style)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(template_styles) or 1, thread_name_prefix='fact_pdf_style') as executor:
+        futures = {template_style: executor.submit(typeset_style, template_style) for template_style in template_styles}
+        return {template_style: future.result() for template_style, future in futures.items()}
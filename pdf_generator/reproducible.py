@@ -0,0 +1,36 @@
+'''
+Reproducible mode: identical input gives a byte identical pdf. pdflatex gets a fixed SOURCE_DATE_EPOCH (forced for all
+dates), no creation dates, trailer id or pdfTeX file info are written and times in the templates are rendered in UTC.
+It is enabled by FACT_PDF_REPRODUCIBLE=1 or by setting SOURCE_DATE_EPOCH.
+'''
+import os
+from pathlib import Path
+
+REPRODUCIBLE_VARIABLE = 'FACT_PDF_REPRODUCIBLE'
+SOURCE_DATE_EPOCH_VARIABLE = 'SOURCE_DATE_EPOCH'
+DEFAULT_SOURCE_DATE_EPOCH = 0
+REPRODUCIBLE_FILE = 'reproducible.tex'
+
+# read by main.tex with \InputIfFileExists, global since combined documents input it inside the group of each report
+REPRODUCIBLE_SETTINGS = '\n'.join([
+    r'\global\pdfinfoomitdate=1',
+    r'\pdftrailerid{}',
+    r'\global\pdfsuppressptexinfo=-1',
+    ''
+])
+
+
+def is_reproducible() -> bool:
+    return os.environ.get(REPRODUCIBLE_VARIABLE, '') not in ('', '0') or SOURCE_DATE_EPOCH_VARIABLE in os.environ
+
+
+def get_source_date_epoch() -> int:
+    return int(os.environ.get(SOURCE_DATE_EPOCH_VARIABLE, DEFAULT_SOURCE_DATE_EPOCH))
+
+
+def get_reproducible_environment() -> dict:
+    return {SOURCE_DATE_EPOCH_VARIABLE: str(get_source_date_epoch()), 'FORCE_SOURCE_DATE': '1', 'TZ': 'UTC'}
+
+
+def write_reproducible_settings(tmp_dir):
+    Path(tmp_dir, REPRODUCIBLE_FILE).write_text(REPRODUCIBLE_SETTINGS)
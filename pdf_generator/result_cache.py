@@ -0,0 +1,124 @@
+import os
+import shutil
+from contextlib import suppress
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Optional
+
+from pdf_generator.cache_directory import get_cache_directory
+from pdf_generator.reproducible import REPRODUCIBLE_FILE
+from pdf_generator.tex_generation.template_engine import APPENDIX_TEMPLATE, CUSTOM_TEMPLATE_CLASS, MAIN_TEMPLATE, META_TEMPLATE
+
+CACHE_SIZE_VARIABLE = 'FACT_PDF_RESULT_CACHE_SIZE'
+DEFAULT_MAX_SIZE = 256 * 1024 ** 2
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+CHUNK_SIZE = 1024 ** 2
+
+_DEFAULT_CACHES = {}
+_DEFAULT_CACHES_LOCK = Lock()
+
+
+def _hash_file(path: Path) -> bytes:
+    file_hash = sha256()
+    with path.open('rb') as input_file:
+        for chunk in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.digest()
+
+
+def compute_input_hash(tmp_dir) -> str:
+    '''
+    Hash everything pdflatex reads from tmp_dir: the rendered templates, the class file and all images.
+    '''
+    directory = Path(tmp_dir)
+    inputs = [directory / name for name in (MAIN_TEMPLATE, META_TEMPLATE, APPENDIX_TEMPLATE, REPRODUCIBLE_FILE, CUSTOM_TEMPLATE_CLASS)]
+    inputs.extend(sorted(path for path in directory.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES))
+    input_hash = sha256()
+    for path in inputs:
+        if path.is_file():
+            input_hash.update(path.name.encode())
+            input_hash.update(_hash_file(path))
+    return input_hash.hexdigest()
+
+
+class PdfCache:
+    '''
+    Content addressed store of finished reports with least recently used eviction.
+    Entries are written atomically through a partial file of their own, so one cache directory can be shared by several
+    processes and threads.
+    '''
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = Path(directory) if directory else get_cache_directory('results')
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits, self.misses = 0, 0
+        self._lock = Lock()
+
+    def get(self, key: str, target: Path) -> bool:
+        entry = self.directory / '{}.pdf'.format(key)
+        try:
+            shutil.copyfile(str(entry), str(target))
+            os.utime(str(entry))
+        except FileNotFoundError:  # not cached or evicted in the meantime
+            self._count(hit=False)
+            return False
+        self._count(hit=True)
+        return True
+
+    def put(self, key: str, pdf_path: Path):
+        if pdf_path.stat().st_size > self.max_size:
+            return
+        with NamedTemporaryFile(dir=str(self.directory), prefix='{}.'.format(key), suffix='.partial', delete=False) as partial_entry:
+            pass
+        try:
+            shutil.copyfile(str(pdf_path), partial_entry.name)
+            os.replace(partial_entry.name, str(self.directory / '{}.pdf'.format(key)))
+        except FileNotFoundError:  # lost a race with a cleanup of the directory, the result is just not cached
+            with suppress(FileNotFoundError):
+                os.unlink(partial_entry.name)
+            return
+        self.evict()
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(str(self.directory)):
+            if entry.name.endswith('.pdf'):
+                stats = entry.stat()
+                entries.append((stats.st_mtime, stats.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:  # evicted by another process
+                pass
+            total_size -= size
+
+    @property
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(str(self.directory)) if entry.name.endswith('.pdf'))
+
+
+def get_default_cache() -> Optional[PdfCache]:
+    '''
+    The cache of FACT_PDF_CACHE_DIR, one instance per directory and size, so its counters cover all reports of the process.
+    '''
+    max_size = int(os.environ.get(CACHE_SIZE_VARIABLE, DEFAULT_MAX_SIZE))
+    if max_size <= 0:
+        return None
+    directory = get_cache_directory('results')
+    with _DEFAULT_CACHES_LOCK:
+        if (directory, max_size) not in _DEFAULT_CACHES:
+            _DEFAULT_CACHES[(directory, max_size)] = PdfCache(directory, max_size=max_size)
+        return _DEFAULT_CACHES[(directory, max_size)]
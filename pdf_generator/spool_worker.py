@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+
+from pdf_generator.backends import DIRECT_BACKEND, LATEX_BACKEND
+from pdf_generator.generator import change_owner, compile_pdf, create_templates, publish_pdf
+from pdf_generator.ingestion import load_analysis
+from pdf_generator.instrumentation import append_metrics, recording, write_sidecar
+from pdf_generator.latex_pool import LatexPool
+from pdf_generator.result_cache import get_default_cache
+from pdf_generator.tex_generation.template_engine import TemplateEngine
+
+INCOMING_DIR = 'incoming'
+CLAIMED_DIR = 'claimed'
+FAILED_DIR = 'failed'
+ERROR_LOG = 'error.log'
+RETRY_MARKER = '.retried'
+
+_ENGINE = None
+_CACHE = None
+_LATEX_POOL = None
+
+
+def _initialize_worker_process(template_style, standby=0):
+    global _ENGINE, _CACHE, _LATEX_POOL  # pylint: disable=global-statement
+    _ENGINE = TemplateEngine(template_folder=template_style)
+    _CACHE = get_default_cache()
+    if standby > 0:
+        _LATEX_POOL = LatexPool(template_style, size=standby)
+        if _LATEX_POOL.start():
+            # atexit handlers are not run in pool processes, the standby processes would block on their fifo forever
+            Finalize(None, _LATEX_POOL.close, exitpriority=10)
+
+
+def render_job(job_dir: str, template_style: str = 'default', backend: str = LATEX_BACKEND, standby: int = 0) -> Tuple[str, dict]:
+    '''
+    Render the job in job_dir and leave the resulting pdf inside job_dir. Returns its path and the stage metrics.
+    The worker process is set up by its first job, the template engine is reused for every job it handles.
+    '''
+    if _ENGINE is None:  # no executor initializer before python 3.7
+        _initialize_worker_process(template_style, standby)
+    job_path = Path(job_dir)
+    with recording() as recorder:
+        analysis = load_analysis(job_path / 'analysis.json')
+        meta_data = json.loads((job_path / 'meta.json').read_text())
+        engine = _ENGINE
+
+        with TemporaryDirectory() as tmp_dir:
+            if backend == DIRECT_BACKEND:
+                from pdf_generator.direct_pdf import render_direct_pdf  # pylint: disable=import-outside-toplevel
+                pdf_path = render_direct_pdf(analysis, meta_data, tmp_dir)
+            else:
+                create_templates(analysis, meta_data, tmp_dir, template_style, engine=engine)
+                pdf_path = compile_pdf(meta_data, tmp_dir, template_style, cache=_CACHE, latex_pool=_LATEX_POOL)
+            target_path = job_path / pdf_path.name
+            shutil.move(str(pdf_path), str(target_path))
+    return str(target_path), recorder.to_dict()
+
+
+class SpoolWorker:
+    '''
+    Processes job folders (each containing analysis.json and meta.json) dropped into <spool_dir>/incoming.
+    Producers must create a job folder elsewhere on the same file system and rename it into incoming when complete.
+    Jobs are claimed by an atomic rename into <spool_dir>/claimed/<worker_id>, so several workers can share one spool
+    directory. At most max_pending jobs are claimed at a time, everything else stays in incoming for other workers.
+    Jobs left in the claimed folder of this worker_id by a killed worker are returned to incoming (once) on start.
+    With standby > 0 every worker process keeps that many pdflatex processes started ahead of time (see LatexPool).
+    '''
+
+    def __init__(self, spool_dir: Path, output_dir: Path, owner_reference: Path, template_style='default',
+                 concurrency=None, max_pending=None, poll_interval=1.0, metrics_file=None, backend=LATEX_BACKEND, standby=0,
+                 worker_id=None):
+        self.spool_dir = Path(spool_dir)
+        self.output_dir = Path(output_dir)
+        self.owner_reference = Path(owner_reference)
+        self.template_style = template_style
+        self.backend = backend
+        self.standby = standby if backend == LATEX_BACKEND else 0
+        self.concurrency = concurrency if concurrency else os.cpu_count() or 1
+        self.max_pending = max_pending if max_pending else 2 * self.concurrency
+        self.poll_interval = poll_interval
+        self.metrics_file = Path(metrics_file) if metrics_file else None
+        self.processed, self.failed = 0, 0
+        self._stop_requested = False
+        self.claimed_dir = self.spool_dir / CLAIMED_DIR / (worker_id if worker_id else socket.gethostname())
+
+        for directory in (self.spool_dir / INCOMING_DIR, self.claimed_dir, self.spool_dir / FAILED_DIR):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def stop(self):
+        self._stop_requested = True
+
+    def run(self, stop_when_idle=False):
+        self.recover_jobs()
+        pending = {}
+        executor = self._start_executor()
+        try:
+            while not self._stop_requested or pending:
+                if not self._stop_requested:
+                    for job_dir in self.claim_jobs(self.max_pending - len(pending)):
+                        pending[executor.submit(render_job, str(job_dir), self.template_style, self.backend, self.standby)] = job_dir
+
+                if not pending:
+                    if stop_when_idle:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(pending, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                pool_broken = False
+                for future in done:
+                    pool_broken |= self._finish_job(pending.pop(future), future)
+                if pool_broken:
+                    executor.shutdown(wait=False)
+                    executor = self._start_executor()
+        finally:
+            executor.shutdown()
+
+    def recover_jobs(self) -> int:
+        '''
+        Hand back the jobs a previous run of this worker claimed but did not finish (killed or restarted container).
+        Returns the number of recovered jobs.
+        '''
+        stranded = sorted(path for path in self.claimed_dir.iterdir() if path.is_dir())
+        for job_dir in stranded:
+            logging.warning('Recovering job {} claimed by a previous run'.format(job_dir.name))
+            self._handle_crashed_job(job_dir)
+        return len(stranded)
+
+    def claim_jobs(self, limit: int) -> List[Path]:
+        claimed = []
+        if limit <= 0:
+            return claimed
+        incoming = self.spool_dir / INCOMING_DIR
+        for job_name in sorted(entry.name for entry in os.scandir(str(incoming)) if entry.is_dir()):
+            target = self.claimed_dir / job_name
+            try:
+                (incoming / job_name).rename(target)
+            except FileNotFoundError:  # claimed by another worker in the meantime
+                continue
+            claimed.append(target)
+            if len(claimed) == limit:
+                break
+        return claimed
+
+    def _start_executor(self):
+        return ProcessPoolExecutor(max_workers=self.concurrency)
+
+    def _finish_job(self, job_dir: Path, future) -> bool:
+        try:
+            pdf_path, metrics = future.result()
+            with recording() as recorder:
+                output_path = publish_pdf(Path(pdf_path), self.output_dir, self.owner_reference, reserve=True)
+            metrics['stages'].update(recorder.stages)
+            self._write_metrics(job_dir.name, output_path, metrics)
+            shutil.rmtree(str(job_dir))
+            self.processed += 1
+        except BrokenProcessPool:
+            self._handle_crashed_job(job_dir)
+            return True
+        except Exception:  # pylint: disable=broad-except
+            self._fail_job(job_dir, traceback.format_exc())
+        return False
+
+    def _write_metrics(self, job_name: str, pdf_path: Path, metrics: dict):
+        change_owner(write_sidecar(pdf_path, metrics), self.owner_reference)
+        if self.metrics_file:
+            append_metrics(self.metrics_file, job_name, dict(metrics, output=pdf_path.name))
+
+    def _handle_crashed_job(self, job_dir: Path):
+        # a crashing worker process (or a killed worker) takes down every pending job, so give each of them one more try
+        if (job_dir / RETRY_MARKER).exists():
+            self._fail_job(job_dir, 'Worker process terminated unexpectedly while rendering this job')
+            return
+        (job_dir / RETRY_MARKER).touch()
+        job_dir.rename(self.spool_dir / INCOMING_DIR / job_dir.name)
+
+    def _fail_job(self, job_dir: Path, error: str):
+        logging.error('Report generation failed for job {}:\n{}'.format(job_dir.name, error))
+        self.failed += 1
+        (job_dir / ERROR_LOG).write_text(error)
+        target = self.spool_dir / FAILED_DIR / job_dir.name
+        if target.exists():
+            target = target.with_name('{}_{}'.format(job_dir.name, int(time.time() * 1000)))
+        job_dir.rename(target)
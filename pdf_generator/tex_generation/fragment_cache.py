@@ -0,0 +1,98 @@
+import json
+import os
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import Callable, Hashable, Optional
+
+from pdf_generator.ingestion import UidList
+from pdf_generator.tex_generation.ip_classification import IP_CLASSES, IpClassification
+from pdf_generator.tex_generation.summary_reduction import EXTRA_RESULT_FIELDS
+
+FRAGMENT_CACHE_VERSION = 1
+FRAGMENT_CACHE_SIZE_VARIABLE = 'FACT_PDF_FRAGMENT_CACHE_SIZE'
+DEFAULT_FRAGMENT_CACHE_SIZE = 1024
+
+
+def _encode_reduced_value(value):
+    if isinstance(value, UidList):
+        return {'count': value.count, 'sample': value.sample}
+    if isinstance(value, IpClassification):
+        return {ip_class: [value.counts[ip_class], value.sample(ip_class) if value.counts[ip_class] else None] for ip_class in IP_CLASSES}
+    raise TypeError('Can not hash summary value of type {}'.format(type(value).__name__))
+
+
+_SUMMARY_ENCODER = json.JSONEncoder(check_circular=False, default=_encode_reduced_value)
+
+
+def hash_summary(plugin_result) -> str:
+    '''
+    Hash of the summary of a plugin result, encoded chunk wise. Key order is kept since it is visible in the report.
+    Missing plugins and plugins without summary hash to different values. Other fields the reducers read (e.g. the CVE
+    scores in cve_results) are part of the hash as well.
+    '''
+    summary_hash = sha256()
+    if plugin_result is None:
+        return summary_hash.hexdigest()
+    summary = plugin_result.get('summary') if isinstance(plugin_result, dict) else None
+    _update_hash(summary_hash, b'summary:', summary)
+    for field in sorted(set(EXTRA_RESULT_FIELDS.values())):
+        if isinstance(plugin_result, dict) and field in plugin_result:
+            _update_hash(summary_hash, '{}:'.format(field).encode(), plugin_result[field])
+    return summary_hash.hexdigest()
+
+
+def _update_hash(summary_hash, prefix: bytes, value):
+    summary_hash.update(prefix)
+    for chunk in _SUMMARY_ENCODER.iterencode(value):
+        summary_hash.update(chunk.encode('utf-8', errors='surrogatepass'))
+
+
+def hash_template_source(source: str) -> str:
+    return sha256('{}:{}'.format(FRAGMENT_CACHE_VERSION, source).encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def get_fragment_cache_size() -> int:
+    return int(os.environ.get(FRAGMENT_CACHE_SIZE_VARIABLE, DEFAULT_FRAGMENT_CACHE_SIZE))
+
+
+class FragmentCache:
+    '''
+    Bounded LRU cache of rendered template fragments. It is shared by all engines (and threads) of a process.
+    '''
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else get_fragment_cache_size()
+        self.hits, self.misses = 0, 0
+        self._fragments = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> str:
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = render()  # rendered outside the lock, at worst two threads render the same fragment
+
+        if self.max_entries > 0:
+            with self._lock:
+                self._fragments[key] = fragment
+                self._fragments.move_to_end(key)
+                while len(self._fragments) > self.max_entries:
+                    self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self._fragments)
+
+
+FRAGMENT_CACHE = FragmentCache()
@@ -0,0 +1,132 @@
+import binascii
+import logging
+import os
+import shutil
+from contextlib import suppress
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Optional
+
+from pdf_generator.cache_directory import get_cache_directory
+from pdf_generator.instrumentation import stage
+
+IMAGE_DPI_VARIABLE = 'FACT_PDF_IMAGE_DPI'
+# \textwidth of the main column: letterpaper minus the 7.6cm + 1cm margins set in twentysecondcv.cls
+TEXT_WIDTH_INCHES = 8.5 - 8.6 / 2.54
+CHUNK_SIZE = 4 * 256 * 1024
+MAX_CACHED_IMAGES = 256
+# strings cache their own hash, so repeated lookups of the same image (e.g. one analysis rendered in several styles)
+# neither hash its content again nor keep more than a few encoded images alive
+MAX_REMEMBERED_HASHES = 4
+_WHITESPACE = b' \t\r\n'
+
+
+def decode_base64_stream(base64_string: str, output_file: BinaryIO, chunk_size=CHUNK_SIZE):
+    '''
+    Decode base64_string chunk by chunk, so neither an encoded copy nor the whole decoded content is held in memory.
+    '''
+    remainder = b''
+    for offset in range(0, len(base64_string), chunk_size):
+        encoded_chunk = base64_string[offset:offset + chunk_size].encode('ascii', errors='ignore')
+        chunk = remainder + encoded_chunk.translate(None, _WHITESPACE)
+        complete_length = len(chunk) - len(chunk) % 4
+        output_file.write(binascii.a2b_base64(chunk[:complete_length]))
+        remainder = chunk[complete_length:]
+    if remainder:
+        output_file.write(binascii.a2b_base64(remainder))
+
+
+def hash_base64_string(base64_string: str, chunk_size=CHUNK_SIZE) -> str:
+    string_hash = sha256()
+    for offset in range(0, len(base64_string), chunk_size):
+        string_hash.update(base64_string[offset:offset + chunk_size].encode('utf-8'))
+    return string_hash.hexdigest()
+
+
+@lru_cache(maxsize=MAX_REMEMBERED_HASHES)
+def _hash_image(base64_string: str) -> str:
+    return hash_base64_string(base64_string)
+
+
+def get_target_dpi() -> Optional[int]:
+    dpi = int(os.environ.get(IMAGE_DPI_VARIABLE, 0))
+    return dpi if dpi > 0 else None
+
+
+def downscale_image(image_path: Path, target_dpi: int, width_inches=TEXT_WIDTH_INCHES):
+    '''
+    Shrink the image to the pixel width needed for width_inches at target_dpi and recompress it.
+    Images that are small enough already are left untouched.
+    '''
+    target_width = int(width_inches * target_dpi)
+    # only needed for downscaling, so Pillow is not imported before FACT_PDF_IMAGE_DPI asks for it
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+    with Image.open(str(image_path)) as image:
+        if image.width <= target_width:
+            return
+        target_height = max(1, round(image.height * target_width / image.width))
+        resized = image.resize((target_width, target_height), Image.LANCZOS)
+        resized.save(str(image_path), format=image.format, optimize=True)
+
+
+def store_base64_image(base64_string: str, filename: str, directory, suffix='png', target_dpi=None) -> str:
+    '''
+    Place the decoded image as <directory>/<filename>.<suffix> and return its path.
+    Images are decoded (and optionally downscaled) once into a shared cache keyed by the hash of their encoded content
+    and hard linked into the job directory, so identical graphs in several jobs are processed only once.
+    '''
+    with stage('image_decode'):
+        return _store_base64_image(base64_string, filename, directory, suffix, target_dpi)
+
+
+def _store_base64_image(base64_string, filename, directory, suffix, target_dpi):
+    target_dpi = target_dpi if target_dpi is not None else get_target_dpi()
+    cache_dir = get_cache_directory('images')
+    cache_name = '{}{}.{}'.format(_hash_image(base64_string), '-{}dpi'.format(target_dpi) if target_dpi else '', suffix)
+    cached_image = cache_dir / cache_name
+
+    if not cached_image.is_file():
+        partial_file = NamedTemporaryFile(dir=str(cache_dir), suffix='.partial', delete=False)  # pylint: disable=consider-using-with
+        try:
+            with partial_file:
+                decode_base64_stream(base64_string, partial_file)
+            if target_dpi:
+                try:
+                    downscale_image(Path(partial_file.name), target_dpi)
+                except OSError as error:
+                    logging.warning('Could not downscale {}: {}'.format(filename, error))
+            os.replace(partial_file.name, str(cached_image))
+        except BaseException:
+            # e.g. invalid base64 or an image Pillow fails on, the cache directory must not fill up with partial files
+            with suppress(FileNotFoundError):
+                os.unlink(partial_file.name)
+            raise
+        evict_cached_images(cache_dir)
+    else:
+        os.utime(str(cached_image))
+
+    file_path = Path(directory, '{}.{}'.format(filename, suffix))
+    if file_path.exists():
+        file_path.unlink()
+    try:
+        os.link(str(cached_image), str(file_path))
+    except FileNotFoundError:  # evicted by another process in the meantime
+        with file_path.open('wb') as output_file:
+            decode_base64_stream(base64_string, output_file)
+    except OSError:
+        shutil.copyfile(str(cached_image), str(file_path))
+    return str(file_path)
+
+
+def evict_cached_images(cache_dir: Path, max_images=MAX_CACHED_IMAGES):
+    # jobs hold hard links (or copies) of their images, so removing cache entries never affects running jobs
+    images = [entry for entry in os.scandir(str(cache_dir)) if not entry.name.endswith('.partial')]
+    if len(images) <= max_images:
+        return
+    for entry in sorted(images, key=lambda entry: entry.stat().st_mtime)[:len(images) - max_images]:
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
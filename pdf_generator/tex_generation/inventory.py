@@ -0,0 +1,39 @@
+'''
+Complete listings of the summaries for the optional appendix. Entries are produced lazily, so the appendix template
+can be streamed to disk without holding its output in memory.
+'''
+from typing import Iterator, List, Tuple
+
+from pdf_generator.tex_generation.ip_classification import classify_element, IP_CLASSES, IpClassification
+
+INVENTORY_SECTIONS = [
+    ('software_components', 'Software'), ('cve_lookup', 'CVEs'), ('ip_and_uri_finder', 'IPs and URIs'),
+    ('cpu_architecture', 'Executables')
+]
+
+
+def iterate_inventory(plugin: str, summary) -> Iterator[Tuple[str, str]]:
+    '''
+    (left column, right column) rows of the appendix: the class and the element for ip_and_uri_finder (only the counts
+    per class if the elements were not kept while loading), the number of files and the summary entry otherwise.
+    '''
+    if isinstance(summary, IpClassification) and summary.elements is None:  # loaded without full_inventory
+        for ip_class in IP_CLASSES:
+            yield str(summary.counts[ip_class]), ip_class
+        return
+    if plugin == 'ip_and_uri_finder':
+        for element in summary.elements if isinstance(summary, IpClassification) else summary:
+            yield classify_element(element), element
+        return
+    for entry, files in summary.items():
+        yield str(len(files)), entry
+
+
+def get_inventory(analysis: dict) -> List[Tuple[str, Iterator[Tuple[str, str]]]]:
+    inventory = []
+    for plugin, title in INVENTORY_SECTIONS:
+        plugin_result = analysis.get(plugin) if isinstance(analysis, dict) else None
+        summary = plugin_result.get('summary') if isinstance(plugin_result, dict) else None
+        if summary:
+            inventory.append((title, iterate_inventory(plugin, summary)))
+    return inventory
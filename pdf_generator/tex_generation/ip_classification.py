@@ -0,0 +1,73 @@
+import socket
+from functools import lru_cache
+from typing import Iterable
+
+IPV4, IPV6, URI = 'IPv4', 'IPv6', 'URI'
+IP_CLASSES = (IPV4, IPV6, URI)
+SHORT_ELEMENT_LENGTH = 50
+
+# every string accepted by inet_pton consists of these characters, everything else can skip the parsing
+_IPV4_CHARACTERS = frozenset('0123456789.')
+_IPV6_CHARACTERS = frozenset('0123456789abcdefABCDEF:.')
+
+
+def _is_valid_address(address_family, element):
+    try:
+        socket.inet_pton(address_family, element)
+        return True
+    except OSError:
+        return False
+
+
+@lru_cache(maxsize=2 ** 16)
+def classify_element(element: str) -> str:
+    if element.count('.') == 3 and _IPV4_CHARACTERS.issuperset(element) and _is_valid_address(socket.AF_INET, element):
+        return IPV4
+    if ':' in element and _IPV6_CHARACTERS.issuperset(element) and _is_valid_address(socket.AF_INET6, element):
+        return IPV6
+    return URI
+
+
+class IpClassification:
+    '''
+    Per class element counts of an ip_and_uri_finder summary together with the sample element shown in the report
+    (the first element of at most SHORT_ELEMENT_LENGTH characters, else the truncated first element).
+    Elements can be added in batches, so a summary never has to be held in memory as a whole.
+    With keep_elements all elements are kept as well (in elements), e.g. for the full inventory appendix.
+    '''
+    __slots__ = ('counts', 'elements', '_first', '_first_short')
+
+    def __init__(self, keep_elements=False):
+        self.counts = dict.fromkeys(IP_CLASSES, 0)
+        self.elements = [] if keep_elements else None
+        self._first = {}
+        self._first_short = {}
+
+    def add_batch(self, elements: Iterable[str]):
+        counts, first, first_short = self.counts, self._first, self._first_short
+        if self.elements is not None:
+            elements = list(elements)
+            self.elements.extend(elements)
+        for element in elements:
+            ip_class = classify_element(element)
+            counts[ip_class] += 1
+            if ip_class not in first_short:
+                first.setdefault(ip_class, element)
+                if len(element) <= SHORT_ELEMENT_LENGTH:
+                    first_short[ip_class] = element
+
+    def sample(self, ip_class: str) -> str:
+        if ip_class in self._first_short:
+            return self._first_short[ip_class]
+        return self._first[ip_class][:SHORT_ELEMENT_LENGTH + 1]
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+
+def classify_ip_elements(elements: Iterable[str]) -> IpClassification:
+    if isinstance(elements, IpClassification):
+        return elements
+    classification = IpClassification()
+    classification.add_batch(elements)
+    return classification
@@ -0,0 +1,235 @@
+import re
+from collections import OrderedDict
+from collections.abc import Mapping
+from heapq import nlargest, nsmallest
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from pdf_generator.tex_generation.ip_classification import classify_ip_elements, IpClassification
+
+MITIGATION_ORDER = ['Canary', 'NX', 'RELRO', 'PIE', 'FORTIFY']
+MITIGATION_LABELS = [('CANARY', 'Canary'), ('PIE', 'PIE'), ('RELRO', 'RELRO'), ('NX', 'NX'), ('FORTIFY_SOURCE', 'FORTIFY')]
+SOFTWARE_ENTRIES = 10
+TOP_FILE_TYPES = 5
+TOP_CVES = 10
+CRITICAL_MARKER = ' (CRITICAL)'
+# CVSS v3 qualitative ratings: (severity, lowest score), entries without known score are UNKNOWN
+CVE_SEVERITIES = [('CRITICAL', 9.0), ('HIGH', 7.0), ('MEDIUM', 4.0), ('LOW', 0.0)]
+UNKNOWN_SEVERITY = 'UNKNOWN'
+SEVERITY_ORDER = [severity for severity, _ in CVE_SEVERITIES] + [UNKNOWN_SEVERITY]
+# plugin result fields read by the reducers in addition to the summary
+EXTRA_RESULT_FIELDS = {'cve_lookup': 'cve_results'}
+
+_CVE_ID_REGEX = re.compile(r'^(.*) (CVE-\d{4}-\d+)$')
+_SEVERITY_RANK = {severity: rank for rank, severity in enumerate(reversed(SEVERITY_ORDER))}
+
+
+def reduce_crypto_material(summary: dict) -> List[str]:
+    return list(summary)
+
+
+def reduce_exploit_mitigations(summary: dict) -> str:
+    return ','.join(
+        '{{{}/{}}}'.format(label.replace('_', '\\_'), ratio) for label, ratio in exploit_mitigation_ratios(summary)
+    )
+
+
+def exploit_mitigation_ratios(summary: dict) -> List[Tuple[str, float]]:
+    '''
+    Single pass over the summary: counts all files per mitigation (used as reference) and the files that have it
+    present / enabled at once.
+    '''
+    totals = dict.fromkeys(MITIGATION_ORDER, 0)
+    enabled = dict.fromkeys(MITIGATION_ORDER, 0)
+    for entry, files in summary.items():
+        file_count = len(files)
+        is_enabled = 'present' in entry or 'enabled' in entry
+        for mitigation in MITIGATION_ORDER:
+            if mitigation in entry:
+                totals[mitigation] += file_count
+                if is_enabled:
+                    enabled[mitigation] += file_count
+
+    max_count = next((totals[mitigation] for mitigation in MITIGATION_ORDER if totals[mitigation]), 1)
+    return [(label, enabled[mitigation] / max_count) for label, mitigation in MITIGATION_LABELS]
+
+
+def reduce_software_components(summary: dict) -> Dict[str, object]:
+    return {
+        'entries': nsmallest(SOFTWARE_ENTRIES, summary),
+        'others': max(len(summary) - SOFTWARE_ENTRIES, 0),
+    }
+
+
+def reduce_known_vulnerabilities(summary: dict) -> List[str]:
+    return list(summary)
+
+
+def cve_criticals(summary) -> List[str]:
+    criticals = [cve for cve in summary if 'CRITICAL' in cve]
+    criticals.append(f'and {len(summary) - len(criticals)} other uncritical')
+    return criticals
+
+
+class CveEntry(NamedTuple):
+    name: str
+    severity: str
+    score: Optional[float]
+
+
+class CveAggregation(NamedTuple):
+    '''
+    Exact number of cve_lookup entries per severity (in SEVERITY_ORDER) and the top highest rated entries.
+    '''
+    counts: Dict[str, int]
+    top: List[CveEntry]
+    total: int
+
+    @property
+    def others(self) -> int:
+        return self.total - len(self.top)
+
+
+def get_severity(score: Optional[float], critical=False) -> str:
+    if critical:
+        return CVE_SEVERITIES[0][0]
+    if score is None:
+        return UNKNOWN_SEVERITY
+    return next(severity for severity, lowest_score in CVE_SEVERITIES if score >= lowest_score)
+
+
+def parse_cve_entry(entry: str, cve_results: Optional[dict] = None) -> CveEntry:
+    '''
+    Severity and score of a cve_lookup summary entry. Entries are "<software> (CRITICAL)" or "<software>", whose score
+    is the highest of its CVEs in cve_results, or name a single CVE ("<software> CVE-<year>-<number>").
+    '''
+    critical = entry.endswith(CRITICAL_MARKER)
+    name = entry[:-len(CRITICAL_MARKER)] if critical else entry
+    score = None
+    if isinstance(cve_results, dict):
+        if name in cve_results:
+            score = _highest_score(cve_results[name].values() if isinstance(cve_results[name], dict) else [])
+        else:
+            match = _CVE_ID_REGEX.match(name)
+            cves = cve_results.get(match.group(1)) if match else None
+            if isinstance(cves, dict) and match.group(2) in cves:
+                score = _highest_score([cves[match.group(2)]])
+    return CveEntry(entry, get_severity(score, critical), score)
+
+
+def _highest_score(cves) -> Optional[float]:
+    scores = [score for score in (_parse_score(cve) for cve in cves) if score is not None]
+    return max(scores) if scores else None
+
+
+def _parse_score(cve) -> Optional[float]:
+    if not isinstance(cve, dict):
+        return None
+    for key in ('score3', 'score2'):  # CVSS v3 if available
+        try:
+            return float(cve[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def aggregate_cves(summary, cve_results: Optional[dict] = None, top=TOP_CVES) -> CveAggregation:
+    '''
+    Parse each entry once, counting it in its severity bucket while a heap bounded to top entries keeps the highest
+    rated ones (severity first, then score, ties in summary order). The result does not grow with the summary.
+    '''
+    counts = dict.fromkeys(SEVERITY_ORDER, 0)
+
+    def parse_entries() -> Iterator[CveEntry]:
+        for entry in summary:
+            cve = parse_cve_entry(entry, cve_results)
+            counts[cve.severity] += 1
+            yield cve
+
+    top_entries = nlargest(top, parse_entries(), key=_rank_cve)
+    return CveAggregation(counts, top_entries, sum(counts.values()))
+
+
+def _rank_cve(cve: CveEntry) -> Tuple[int, float]:
+    return _SEVERITY_RANK[cve.severity], cve.score if cve.score is not None else -1.0
+
+
+def reduce_cve_lookup(summary: dict, cve_results: Optional[dict] = None) -> CveAggregation:
+    return aggregate_cves(summary, cve_results)
+
+
+def reduce_file_type(summary: dict) -> List[Tuple[str, int]]:
+    if len(summary) <= TOP_FILE_TYPES:
+        top_entries = summary.items()
+    else:
+        top_entries = nlargest(TOP_FILE_TYPES, summary.items(), key=lambda item: len(item[1]))
+    return [(file_type, len(files)) for file_type, files in top_entries]
+
+
+def reduce_ip_and_uri_finder(summary) -> IpClassification:
+    return classify_ip_elements(summary)
+
+
+def reduce_cpu_architecture(summary: dict) -> List[Tuple[str, int]]:
+    return [(architecture, len(files)) for architecture, files in summary.items()]
+
+
+SECTION_REDUCERS = OrderedDict([
+    ('crypto_material', reduce_crypto_material),
+    ('exploit_mitigations', reduce_exploit_mitigations),
+    ('software_components', reduce_software_components),
+    ('known_vulnerabilities', reduce_known_vulnerabilities),
+    ('cve_lookup', reduce_cve_lookup),
+    ('file_type', reduce_file_type),
+    ('ip_and_uri_finder', reduce_ip_and_uri_finder),
+    ('cpu_architecture', reduce_cpu_architecture),
+])
+
+
+def reduce_section(plugin: str, plugin_result) -> Optional[object]:
+    summary = plugin_result.get('summary') if isinstance(plugin_result, dict) else None
+    if not summary:
+        return None
+    if plugin in EXTRA_RESULT_FIELDS:
+        return SECTION_REDUCERS[plugin](summary, plugin_result.get(EXTRA_RESULT_FIELDS[plugin]))
+    return SECTION_REDUCERS[plugin](summary)
+
+
+def reduce_analysis(analysis: dict) -> Dict[str, object]:
+    '''
+    Walk each plugin summary once and return the figures shown in the report, keyed by plugin.
+    Plugins missing from the analysis are left out, plugins with an empty summary are mapped to None.
+    '''
+    if not isinstance(analysis, dict):
+        return {}
+    return {
+        plugin: reduce_section(plugin, analysis[plugin])
+        for plugin in SECTION_REDUCERS
+        if plugin in analysis
+    }
+
+
+class ReducedSections(Mapping):
+    '''
+    reduce_analysis for templates that still use sections directly, each section is reduced on its first lookup only.
+    '''
+
+    def __init__(self, analysis: dict):
+        self._analysis = analysis if isinstance(analysis, dict) else {}
+        self._plugins = [plugin for plugin in SECTION_REDUCERS if plugin in self._analysis]
+        self._reduced = {}
+
+    def __getitem__(self, plugin: str):
+        if plugin not in self._reduced:
+            if plugin not in self._plugins:
+                raise KeyError(plugin)
+            self._reduced[plugin] = reduce_section(plugin, self._analysis[plugin])
+        return self._reduced[plugin]
+
+    def __contains__(self, plugin) -> bool:
+        return plugin in self._plugins
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._plugins)
+
+    def __len__(self) -> int:
+        return len(self._plugins)
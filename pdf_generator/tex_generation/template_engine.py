@@ -1,19 +1,28 @@
-from base64 import decodebytes
 from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from time import localtime, strftime
+from time import gmtime, localtime, strftime
 
 from random import choice
-import socket
-from typing import List
+from typing import Dict, Iterable, List, Tuple
+from weakref import WeakKeyDictionary
 
 import jinja2
-from common_helper_files import human_readable_file_size
+
+from pdf_generator.cache_directory import get_cache_directory
+from pdf_generator.tex_generation.fragment_cache import FRAGMENT_CACHE, hash_summary, hash_template_source
+from pdf_generator.tex_generation.image_processing import store_base64_image
+from pdf_generator.tex_generation.inventory import get_inventory
+from pdf_generator.tex_generation.ip_classification import classify_ip_elements, IP_CLASSES, IpClassification
+from pdf_generator.tex_generation.summary_reduction import cve_criticals, reduce_section, ReducedSections, SECTION_REDUCERS
 
 MAIN_TEMPLATE = 'main.tex'
 META_TEMPLATE = 'meta.tex'
+APPENDIX_TEMPLATE = 'appendix.tex'
+SECTION_TEMPLATE = 'sections/{}.tex'
 CUSTOM_TEMPLATE_CLASS = 'twentysecondcv.cls'
 LOGO_FILE = 'fact.png'
+BYTECODE_CACHE_VERSION = 1
 
 LATEX_CHARACTER_ESCAPES = OrderedDict([
     ('\\', ''),
@@ -35,9 +44,12 @@ LATEX_CHARACTER_ESCAPES = OrderedDict([
     ('<', '\\textless{}'),
     ('\n', '\\newline ')
 ])
+LATEX_ESCAPE_TABLE = str.maketrans(dict(LATEX_CHARACTER_ESCAPES))
+_TEMPLATE_CHECKSUMS = WeakKeyDictionary()
 
 
 def render_number_as_size(number, verbose=True):
+    from common_helper_files import human_readable_file_size  # pylint: disable=import-outside-toplevel
     if not isinstance(number, (int, float)):
         return 'not available'
     if verbose:
@@ -45,27 +57,38 @@ def render_number_as_size(number, verbose=True):
     return human_readable_file_size(int(number))
 
 
-def render_unix_time(unix_time_stamp):
+def render_unix_time(unix_time_stamp, utc=False):
     if not isinstance(unix_time_stamp, (int, float)):
         return 'not available'
-    return strftime('%Y-%m-%d %H:%M:%S', localtime(unix_time_stamp))
+    return strftime('%Y-%m-%d %H:%M:%S', gmtime(unix_time_stamp) if utc else localtime(unix_time_stamp))
+
+
+@jinja2.pass_context
+def _render_unix_time_filter(context, unix_time_stamp):
+    # templates are rendered with utc=True in reproducible mode, where the result must not depend on the local timezone
+    return render_unix_time(unix_time_stamp, utc=context.get('utc', False))
 
 
 def replace_special_characters(data):
-    for character, replacement in LATEX_CHARACTER_ESCAPES.items():
-        if character in data:
-            data = data.replace(character, replacement)
-    return data
+    return data.translate(LATEX_ESCAPE_TABLE)
+
+
+def replace_special_characters_in_list(data: Iterable[str]) -> List[str]:
+    translate = str.translate
+    return [translate(entry, LATEX_ESCAPE_TABLE) for entry in data]
 
 
-def decode_base64_to_file(base64_string, filename, directory, suffix='png'):
-    file_path = Path(directory, '{}.{}'.format(filename, suffix))
-    file_path.write_bytes(decodebytes(base64_string.encode('utf-8')))
-    return str(file_path)
+def get_bytecode_cache(templates_to_use='default'):
+    return jinja2.FileSystemBytecodeCache(str(get_cache_directory('jinja/v{}/{}'.format(BYTECODE_CACHE_VERSION, templates_to_use))))
 
 
 # X-Executable in summary
+@lru_cache(maxsize=None)
 def create_jinja_environment(templates_to_use='default'):
+    '''
+    Environments are shared by all engines of a process. Compiled templates are additionally stored in a bytecode cache
+    on disk, which jinja invalidates by checksum whenever a template source changes.
+    '''
     template_directory = Path(Path(__file__).parent.parent, 'templates', templates_to_use)
     environment = jinja2.Environment(
         block_start_string=r'\BLOCK{',
@@ -78,63 +101,19 @@ def create_jinja_environment(templates_to_use='default'):
         line_comment_prefix='%#',
         trim_blocks=True,
         autoescape=False,
-        loader=jinja2.FileSystemLoader(str(template_directory))
+        loader=jinja2.FileSystemLoader(str(template_directory)),
+        bytecode_cache=get_bytecode_cache(templates_to_use)
     )
     _add_filters_to_jinja(environment)
     return environment
 
 
-def get_five_longest_entries(summary, top=5):
-    sorted_summary = dict()
-    if len(summary) < top + 1:
-        return summary
-    for key in sorted(summary, key=lambda key: len(summary[key]), reverse=True):
-        sorted_summary.update({key: summary[key]})
-        if len(sorted_summary) == top:
-            return sorted_summary
-    return sorted_summary
-
-
-def exploit_mitigation(summary):
-    summary = summary['exploit_mitigations']['summary']
-    max_count = _count_mitigations(summary)
-    numbers = dict()
-    for key in ['PIE', 'RELRO', 'Canary', 'NX', 'FORTIFY']:
-        numbers[key] = _count_occurrences(key, summary)
-    return (
-        f'{{CANARY/{numbers["Canary"] / max_count}}},{{PIE/{numbers["PIE"] / max_count}}},'
-        f'{{RELRO/{numbers["RELRO"] / max_count}}},{{NX/{numbers["NX"] / max_count}}},'
-        f'{{FORTIFY\\_SOURCE/{numbers["FORTIFY"] / max_count}}}'
-    )
-
-
-def _count_occurrences(key, summary):
-    return sum(
-        len(summary[entry])
-        for entry in summary
-        if key in entry and ('present' in entry or 'enabled' in entry)
-    )
-
-
-def _count_mitigations(summary):
-    for mitigation in ['Canary', 'NX', 'RELRO', 'PIE', 'FORTIFY']:
-        count = _count_this_mitigation(summary, mitigation)
-        if count != 0:
-            return count
-    if count == 0:
-        count = 1
-    return count
-
-
-def _count_this_mitigation(summary, mitigation):
-    count = 0
-    for selected_summary in summary:
-        if mitigation in selected_summary:
-            count += len(summary[selected_summary])
-    return count
+def software_components(software_string):
+    software, ver_number = split_software_version(software_string)
+    return f'{ver_number}}}{{{replace_special_characters(software)}'
 
 
-def software_components(software_string):
+def split_software_version(software_string) -> Tuple[str, str]:
     software = software_string.strip()
     ver_number = ''
     if ' ' in software:
@@ -143,7 +122,7 @@ def software_components(software_string):
             software, ver_number = _larger_two_components(split_software_string)
         elif len(split_software_string[1]) > 0:
             software, ver_number = _less_three_components(split_software_string)
-    return f'{ver_number}}}{{{replace_special_characters(software)}'
+    return software, ver_number
 
 
 def _less_three_components(software_string):
@@ -165,97 +144,112 @@ def _order_components(software, ver_number):
     return software, ver_number
 
 
-def aggregate_ip_stats(summary_of_ip_analysis: dict) -> List[str]:
-    uris, ipv4s, ipv6s = _sort_ip_analysis_results(summary_of_ip_analysis)
-    return [
-        _aggregate_ip_class(ipv4s, 'IPv4'),
-        _aggregate_ip_class(ipv6s, 'IPv6'),
-        _aggregate_ip_class(uris, 'URI'),
-    ]
+def aggregate_ip_stats(summary_of_ip_analysis) -> List[str]:
+    classification = classify_ip_elements(summary_of_ip_analysis)
+    return [_aggregate_ip_class(classification, ip_class) for ip_class in IP_CLASSES]
 
 
-def _aggregate_ip_class(elements_of_ip_class, ip_class):
-    if not elements_of_ip_class:
+def _aggregate_ip_class(classification: IpClassification, ip_class):
+    if not classification.counts[ip_class]:
         return f'0}}{{{ip_class}\\quad$\\>$'
 
     return (
-        f'{len(elements_of_ip_class)}}}{{{ip_class}\\quad$\\>$ '
-        f'(incl. {replace_special_characters(_find_short_element(elements_of_ip_class, 50))})'
+        f'{classification.counts[ip_class]}}}{{{ip_class}\\quad$\\>$ '
+        f'(incl. {replace_special_characters(classification.sample(ip_class))})'
     )
 
 
-def _find_short_element(elements_of_ip_class, max_length):
-    for element in elements_of_ip_class:
-        if len(element) <= max_length:
-            return element
-    return elements_of_ip_class[0][:51]
-
-
-def _sort_ip_analysis_results(summary_of_ip_analysis):
-    uris, ipv4s, ipv6s = [], [], []
-    for element in summary_of_ip_analysis:
-        if not _validate_ip(element, socket.AF_INET) and not _validate_ip(element, socket.AF_INET6):
-            uris.append(element)
-        elif _validate_ip(element, socket.AF_INET):
-            ipv4s.append(element)
-        else:
-            ipv6s.append(element)
-    return uris, ipv4s, ipv6s
-
-
-def _validate_ip(ip, address_format):
-    try:
-        _ = socket.inet_pton(address_format, ip)
-        return True
-    except OSError:
-        return False
-
-
 def get_x_entries(summary, how_many=10):
     if len(summary) <= how_many:
         return summary
     return summary[:how_many]
 
 
-def cve_criticals(summary):
-    f_string = []
-    else_count = len(summary)
-    for cve in summary:
-        if 'CRITICAL' in cve:
-            f_string.append(cve)
-            else_count -= 1
-    f_string.append(f'and {else_count} other uncritical')
-    return f_string
-
-
 def _add_filters_to_jinja(environment):
     environment.filters['number_format'] = render_number_as_size
-    environment.filters['nice_unix_time'] = render_unix_time
+    environment.filters['nice_unix_time'] = _render_unix_time_filter
     environment.filters['filter_chars'] = replace_special_characters
+    environment.filters['filter_chars_all'] = replace_special_characters_in_list
     environment.filters['elements_count'] = len
-    environment.filters['base64_to_png'] = decode_base64_to_file
-    environment.filters['top_five'] = get_five_longest_entries
+    environment.filters['base64_to_png'] = store_base64_image
     environment.filters['sort'] = sorted
-    environment.filters['call_for_mitigations'] = exploit_mitigation
     environment.filters['split_space'] = software_components
     environment.filters['aggregate_ip_stats'] = aggregate_ip_stats
     environment.filters['x_entries'] = get_x_entries
     environment.filters['cve_crits'] = cve_criticals
 
 
+def get_template_checksum(environment: jinja2.Environment, template: jinja2.Template) -> str:
+    # jinja replaces the template object when the source changes, so the checksum is computed once per object
+    if template not in _TEMPLATE_CHECKSUMS:
+        source, _, _ = environment.loader.get_source(environment, template.name)
+        _TEMPLATE_CHECKSUMS[template] = hash_template_source(source)
+    return _TEMPLATE_CHECKSUMS[template]
+
+
 class TemplateEngine:
-    def __init__(self, template_folder=None, tmp_dir=None):
+    def __init__(self, template_folder=None, tmp_dir=None, fragment_cache=FRAGMENT_CACHE):
         self._environment = create_jinja_environment(template_folder if template_folder else 'default')
         self._tmp_dir = tmp_dir
-
-    def render_main_template(self, analysis):
+        self._fragment_cache = fragment_cache
+
+    def load_templates(self) -> int:
+        '''
+        Compile all templates of the style ahead of their first use, which also fills the bytecode cache.
+        '''
+        names = self._environment.list_templates(extensions=['tex'])
+        for name in names:
+            self._environment.get_template(name)
+        return len(names)
+
+    def render_main_template(self, analysis, tmp_dir=None, sections=None, appendix=False, utc=False):
+        return ''.join(self.stream_main_template(analysis, tmp_dir, sections, appendix, utc))
+
+    def stream_main_template(self, analysis, tmp_dir=None, sections=None, appendix=False, utc=False) -> jinja2.environment.TemplateStream:
+        '''
+        The default main.tex includes the fragments of render_fragments, main templates of other styles may still use
+        the reduced sections directly. Without given sections they are reduced when the template looks them up.
+        '''
         template = self._environment.get_template(MAIN_TEMPLATE)
-        return template.render(analysis=analysis, tmp_dir=self._tmp_dir)
-
-    def render_meta_template(self, meta_data):
+        return template.stream(
+            analysis=analysis,
+            sections=sections if sections is not None else ReducedSections(analysis),
+            fragments=self.render_fragments(analysis, sections),
+            tmp_dir=tmp_dir if tmp_dir else self._tmp_dir,
+            appendix=appendix,
+            utc=utc
+        )
+
+    def stream_appendix_template(self, analysis) -> jinja2.environment.TemplateStream:
+        '''
+        The full inventory appendix. Its rows are generated while the stream is consumed, so dumping it to a file keeps
+        memory usage independent of its length.
+        '''
+        return self._environment.get_template(APPENDIX_TEMPLATE).stream(inventory=get_inventory(analysis))
+
+    def render_fragments(self, analysis, sections=None) -> Dict[str, str]:
+        '''
+        Render the section template of each plugin. Unless the reduced sections are given, fragments are looked up in
+        the fragment cache by template checksum and summary hash, so only sections whose summary changed are reduced
+        and rendered again.
+        '''
+        plugin_results = analysis if isinstance(analysis, dict) else {}
+        fragments = {}
+        for plugin in SECTION_REDUCERS:
+            try:
+                template = self._environment.get_template(SECTION_TEMPLATE.format(plugin))
+            except jinja2.TemplateNotFound:
+                continue
+            if sections is not None:
+                fragments[plugin] = template.render(present=plugin in sections, section=sections.get(plugin))
+                continue
+            plugin_result = plugin_results.get(plugin)
+            fragments[plugin] = self._fragment_cache.get_or_render(
+                (get_template_checksum(self._environment, template), plugin, hash_summary(plugin_result) if plugin in plugin_results else None),
+                lambda: template.render(present=plugin in plugin_results, section=reduce_section(plugin, plugin_result))  # pylint: disable=cell-var-from-loop
+            )
+        return fragments
+
+    def render_meta_template(self, meta_data, utc=False):
         template = self._environment.get_template(META_TEMPLATE)
-        return template.render(meta_data=meta_data)
-
-    def render_template_class(self):
-        template = self._environment.get_template(CUSTOM_TEMPLATE_CLASS)
-        return template.render(tmp_dir=self._tmp_dir)
+        return template.render(meta_data=meta_data, utc=utc)
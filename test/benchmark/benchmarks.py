@@ -0,0 +1,187 @@
+'''
+Benchmarks of the report pipeline on synthetic analyses:
+
+    python3 -m test.benchmark.benchmarks --scale medium --output results.json [--baseline previous.json]
+
+Results are stored as json. Given a baseline, every benchmark whose median time grew by more than its threshold
+(a factor, see THRESHOLDS) is reported as regression and the exit code is 1.
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict
+
+from pdf_generator.generator import compile_pdf, create_templates
+from pdf_generator.tex_generation import template_engine
+from pdf_generator.tex_generation.summary_reduction import aggregate_cves, reduce_exploit_mitigations, reduce_file_type
+from pdf_generator.tex_generation.template_engine import TemplateEngine
+from test.data.synthetic import generate_analysis, generate_meta, SCALES, write_payload
+
+DEFAULT_THRESHOLD = 1.25
+THRESHOLDS = {'compile_pdf': 1.5, 'create_templates': 1.4, 'startup': 1.5}
+# differences below this many seconds are timer noise, even if the ratio is large
+MINIMUM_DIFFERENCE = 0.001
+
+ENTRY_POINT = Path(__file__).parent.parent.parent / 'docker_entry.py'
+# seconds from starting docker_entry.py on a tiny analysis until it launches pdflatex
+STARTUP_BUDGET_VARIABLE = 'FACT_PDF_STARTUP_BUDGET'
+STARTUP_BUDGET = float(os.environ.get(STARTUP_BUDGET_VARIABLE, 1.0))
+# stands in for pdflatex: notes when the compilation of main.tex starts and fails, which ends the run
+FAKE_PDFLATEX = '''#!/bin/sh
+case "$*" in
+    *main.tex) date +%s.%N >> "{marker}" ;;
+esac
+exit 1
+'''
+
+
+def measure(function: Callable, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'repeat': repeat}
+
+
+def measure_startup(scale_name='tiny', repeat=5, seed=0) -> Dict[str, float]:
+    '''
+    Time from process start of docker_entry.py until it launches pdflatex, i.e. the cold start a one-shot container
+    pays before TeX does any work. Caches are prepared with --warm-up first, as in the docker image.
+    '''
+    with TemporaryDirectory() as tmp_dir:
+        interface_dir, bin_dir, marker = Path(tmp_dir, 'interface'), Path(tmp_dir, 'bin'), Path(tmp_dir, 'launches')
+        write_payload(interface_dir / 'data', SCALES[scale_name], seed)
+        bin_dir.mkdir()
+        fake_pdflatex = bin_dir / 'pdflatex'
+        fake_pdflatex.write_text(FAKE_PDFLATEX.format(marker=marker))
+        fake_pdflatex.chmod(0o755)
+        environment = dict(
+            os.environ, PATH='{}:{}'.format(bin_dir, os.environ.get('PATH', '')), FACT_PDF_INTERFACE_DIR=str(interface_dir),
+            FACT_PDF_CACHE_DIR=str(Path(tmp_dir, 'cache'))
+        )
+        subprocess.run([sys.executable, str(ENTRY_POINT), '--warm-up'], env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.run([sys.executable, str(ENTRY_POINT)], env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            if not marker.is_file():
+                raise RuntimeError('docker_entry.py did not launch pdflatex')
+            timings.append(float(marker.read_text().splitlines()[-1]) - start)
+            marker.unlink()
+    return {'min': min(timings), 'median': statistics.median(timings), 'repeat': repeat}
+
+
+def filter_benchmarks(analysis: dict, meta_data: dict, tmp_dir: str) -> Dict[str, Callable]:
+    software = list(analysis['software_components']['summary'])
+    file_types = analysis['file_type']['summary']
+    return {
+        'number_format': lambda: template_engine.render_number_as_size(meta_data['size']),
+        'nice_unix_time': lambda: template_engine.render_unix_time(analysis['file_type']['analysis_date']),
+        'filter_chars': lambda: template_engine.replace_special_characters(analysis['binwalk']['signature_analysis'] * 100),
+        'filter_chars_all': lambda: template_engine.replace_special_characters_in_list(software),
+        'elements_count': lambda: [len(uids) for uids in file_types.values()],
+        'base64_to_png': lambda: template_engine.store_base64_image(analysis['binwalk']['entropy_analysis_graph'], 'entropy_analysis_graph', tmp_dir),
+        'reduce_file_type': lambda: reduce_file_type(file_types),
+        'sort': lambda: sorted(software),
+        'reduce_exploit_mitigations': lambda: reduce_exploit_mitigations(analysis['exploit_mitigations']['summary']),
+        'split_space': lambda: [template_engine.software_components(name) for name in software],
+        'aggregate_ip_stats': lambda: template_engine.aggregate_ip_stats(analysis['ip_and_uri_finder']['summary']),
+        'x_entries': lambda: template_engine.get_x_entries(software),
+        'cve_crits': lambda: template_engine.cve_criticals(analysis['cve_lookup']['summary']),
+        'cve_aggregation': lambda: aggregate_cves(analysis['cve_lookup']['summary'], analysis['cve_lookup']['cve_results']),
+    }
+
+
+def run_benchmarks(scale_name='small', repeat=5, seed=0, include_latex=None, include_startup=True) -> dict:
+    '''
+    include_latex=None runs the compile_pdf benchmark only if pdflatex is installed.
+    '''
+    scale = SCALES[scale_name]
+    analysis, meta_data = generate_analysis(scale, seed), generate_meta(scale)
+    include_latex = shutil.which('pdflatex') is not None if include_latex is None else include_latex
+    results = {}
+
+    with TemporaryDirectory() as tmp_dir:
+        for name, function in filter_benchmarks(analysis, meta_data, tmp_dir).items():
+            results['filter.{}'.format(name)] = measure(function, repeat)
+
+        engine = TemplateEngine(tmp_dir=tmp_dir)
+        results['render_main_template'] = measure(lambda: engine.render_main_template(analysis=analysis, tmp_dir=tmp_dir), repeat)
+        results['create_templates'] = measure(lambda: create_templates(analysis, meta_data, tmp_dir, engine=engine), repeat)
+
+        if include_latex:
+            def compile_report():
+                with TemporaryDirectory() as compile_dir:
+                    create_templates(analysis, meta_data, compile_dir, engine=engine)
+                    compile_pdf(meta_data, compile_dir)
+            results['compile_pdf'] = measure(compile_report, max(1, repeat // 2))
+
+    if include_startup:
+        results['startup'] = measure_startup(repeat=repeat, seed=seed)
+
+    return {
+        'scale': scale_name, 'seed': seed, 'parameters': scale._asdict(), 'python': platform.python_version(),
+        'timestamp': time.time(), 'results': results
+    }
+
+
+def find_regressions(current: dict, baseline: dict, thresholds=None, default_threshold=DEFAULT_THRESHOLD) -> Dict[str, float]:
+    '''
+    Returns {benchmark name: ratio of median times} for every benchmark slower than its threshold allows.
+    Benchmarks missing in one of the runs are ignored.
+    '''
+    thresholds = THRESHOLDS if thresholds is None else thresholds
+    regressions = {}
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        old_median, new_median = baseline['results'][name]['median'], result['median']
+        if new_median - old_median < MINIMUM_DIFFERENCE:
+            continue
+        ratio = new_median / old_median if old_median else float('inf')
+        if ratio > thresholds.get(name, default_threshold):
+            regressions[name] = ratio
+    return regressions
+
+
+def _parse_args(arguments):
+    parser = argparse.ArgumentParser(description='Benchmark report generation on synthetic analyses')
+    parser.add_argument('--scale', default='small', choices=sorted(SCALES), help='size of the synthetic analysis')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic analysis')
+    parser.add_argument('--output', type=Path, default=None, help='write the results as json to this file')
+    parser.add_argument('--baseline', type=Path, default=None, help='results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed slowdown factor of benchmarks without own threshold')
+    parser.add_argument('--skip-latex', action='store_true', help='do not benchmark compile_pdf')
+    parser.add_argument('--skip-startup', action='store_true', help='do not benchmark the start of docker_entry.py')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = _parse_args(arguments)
+    current = run_benchmarks(args.scale, args.repeat, args.seed, include_latex=False if args.skip_latex else None, include_startup=not args.skip_startup)
+    for name, result in current['results'].items():
+        print('{:<30} median {:.6f} s  min {:.6f} s'.format(name, result['median'], result['min']))
+    if args.output:
+        args.output.write_text(json.dumps(current, indent=2))
+    if not args.baseline:
+        return 0
+
+    regressions = find_regressions(current, json.loads(args.baseline.read_text()), default_threshold=args.threshold)
+    for name, ratio in sorted(regressions.items()):
+        print('Regression in {}: {:.2f}x slower than baseline'.format(name, ratio), file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.ingestion import load_analysis
+from pdf_generator.tex_generation.template_engine import TemplateEngine
+from test.benchmark.benchmarks import find_regressions, main, measure_startup, run_benchmarks, STARTUP_BUDGET
+from test.data.synthetic import generate_analysis, generate_meta, SCALES, SyntheticScale, write_payload
+
+# pylint: disable=redefined-outer-name
+
+# the default run only catches gross regressions (e.g. reportlab imported again on startup) on slow or busy machines
+GENEROUS_STARTUP_FACTOR = 5
+
+
+def _run(medians: dict) -> dict:
+    return {'results': {name: {'median': median, 'min': median, 'repeat': 1} for name, median in medians.items()}}
+
+
+def test_generate_analysis_is_deterministic_and_scaled():
+    scale = SyntheticScale(files=2000, software_components=300, cves=400, uris=100, entropy_width=32, entropy_height=16)
+    analysis = generate_analysis(scale, seed=1)
+
+    assert analysis == generate_analysis(scale, seed=1)
+    assert sum(len(uids) for uids in analysis['file_type']['summary'].values()) == 2000
+    assert len(analysis['software_components']['summary']) == 300
+    assert len(analysis['cve_lookup']['summary']) == 400
+    assert len(analysis['ip_and_uri_finder']['summary']) == 100
+    assert analysis['binwalk']['entropy_analysis_graph'].startswith('iVBORw0KGgo')
+
+
+def test_synthetic_payload_renders(tmpdir):
+    job_dir = Path(str(tmpdir), 'job')
+    write_payload(job_dir, SCALES['small'])
+
+    analysis = load_analysis(job_dir / 'analysis.json')
+    meta_data = json.loads((job_dir / 'meta.json').read_text())
+    main_tex = TemplateEngine(tmp_dir=str(tmpdir)).render_main_template(analysis=analysis, tmp_dir=str(tmpdir))
+
+    assert meta_data['total_files_in_firmware'] == 1000
+    assert 'and 90 others' in main_tex
+    assert Path(str(tmpdir), 'entropy_analysis_graph.png').is_file()
+    assert generate_meta(SCALES['small']) == meta_data
+
+
+def test_run_benchmarks():
+    run = run_benchmarks('tiny', repeat=1, include_latex=False, include_startup=False)
+
+    assert run['scale'] == 'tiny'
+    assert {'filter.aggregate_ip_stats', 'filter.base64_to_png', 'render_main_template', 'create_templates'} <= set(run['results'])
+    assert 'compile_pdf' not in run['results'] and 'startup' not in run['results']
+    assert all(result['median'] >= 0 for result in run['results'].values())
+
+
+def test_find_regressions():
+    baseline = _run({'fast': 0.00001, 'render': 0.1, 'compile_pdf': 1.0, 'removed': 1.0})
+    current = _run({'fast': 0.0001, 'render': 0.2, 'compile_pdf': 1.4, 'new': 5.0})
+
+    assert find_regressions(current, baseline) == {'render': 2.0}
+    assert find_regressions(current, baseline, thresholds={}, default_threshold=1.3) == {'render': 2.0, 'compile_pdf': 1.4 / 1.0}
+
+
+def test_main_flags_regressions(monkeypatch, tmpdir):
+    monkeypatch.setattr('test.benchmark.benchmarks.MINIMUM_DIFFERENCE', 0)
+    output, baseline = Path(str(tmpdir), 'results.json'), Path(str(tmpdir), 'baseline.json')
+
+    assert main(['--scale', 'tiny', '--repeat', '1', '--skip-latex', '--skip-startup', '--output', str(output)]) == 0
+    results = json.loads(output.read_text())
+    for result in results['results'].values():
+        result['median'] = 1e-12
+    baseline.write_text(json.dumps(results))
+
+    assert main(['--scale', 'tiny', '--repeat', '1', '--skip-latex', '--skip-startup', '--baseline', str(baseline)]) == 1
+
+
+@pytest.mark.benchmark  # timing dependent, run with pytest -m benchmark
+def test_startup_within_budget():
+    result = measure_startup(repeat=3)
+    assert result['median'] < STARTUP_BUDGET, 'docker_entry.py needs {:.3f} s until pdflatex starts'.format(result['median'])
+
+
+def test_startup_within_generous_budget():
+    result = measure_startup(repeat=1)
+    assert result['median'] < GENEROUS_STARTUP_FACTOR * STARTUP_BUDGET, 'docker_entry.py needs {:.3f} s until pdflatex starts'.format(result['median'])
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(monkeypatch, tmpdir_factory):
+    # keep the caches of the tests out of the cache directory of the user
+    monkeypatch.setenv('FACT_PDF_CACHE_DIR', str(tmpdir_factory.mktemp('cache')))
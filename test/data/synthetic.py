@@ -0,0 +1,148 @@
+'''
+Generator for synthetic FACT analysis / meta payloads of configurable size.
+Output is deterministic for a given scale and seed, so benchmark runs are comparable.
+'''
+import base64
+import json
+import random
+import struct
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+ANALYSIS_DATE = 1591092558.1460986
+SYSTEM_VERSION = '3.7.1_1588174612'
+
+FILE_TYPES = [
+    'application/x-executable', 'application/x-sharedlib', 'application/x-object', 'text/plain', 'text/html',
+    'application/x-shellscript', 'application/gzip', 'application/octet-stream', 'image/png', 'image/gif',
+    'application/x-archive', 'filesystem/squashfs', 'compression/zlib', 'data/raw', 'inode/symlink',
+    'application/javascript', 'text/x-c', 'application/x-tex-tfm', 'audio/mpeg', 'linux/avm-kernel-image-v1'
+]
+ARCHITECTURES = ['ARM, 32-bit, big endian (M)', 'ARM, 32-bit, little endian (M)', 'MIPS, 32-bit, big endian (M)', 'x86, 32-bit, little endian (M)']
+MITIGATIONS = [
+    'Canary enabled', 'Canary disabled', 'NX enabled', 'NX disabled', 'PIE enabled', 'PIE disabled', 'PIE - invalid ELF file',
+    'RELRO fully enabled', 'RELRO partially enabled', 'RELRO disabled', 'FORTIFY_SOURCE enabled', 'FORTIFY_SOURCE disabled'
+]
+SOFTWARE_NAMES = ['BusyBox', 'Linux Kernel', 'OpenSSL', 'hostapd', 'libFLAC', 'wpa_supplicant', 'Dropbear SSH', 'dnsmasq', 'lighttpd', 'uClibc']
+CRYPTO_MATERIAL = ['SSLCertificate', 'SshRsaPrivateKeyBlock', 'PgpPublicKeyBlock', 'SshRsaPublicKey', 'PKCS8PrivateKey']
+VULNERABILITIES = ['BackDoor_String', 'Heartbleed', 'CVE-2014-6271 (Shellshock)', 'netgear_cgi', 'WPA_Key_Hardcoded']
+SEVERITIES = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+
+class SyntheticScale(NamedTuple):
+    files: int
+    software_components: int
+    cves: int
+    uris: int
+    entropy_width: int
+    entropy_height: int
+
+
+SCALES = {
+    'tiny': SyntheticScale(files=10, software_components=5, cves=5, uris=10, entropy_width=64, entropy_height=48),
+    'small': SyntheticScale(files=1000, software_components=100, cves=200, uris=500, entropy_width=640, entropy_height=480),
+    'medium': SyntheticScale(files=50000, software_components=1000, cves=2000, uris=10000, entropy_width=1280, entropy_height=960),
+    'large': SyntheticScale(files=250000, software_components=3000, cves=10000, uris=50000, entropy_width=2560, entropy_height=1920),
+    'huge': SyntheticScale(files=1000000, software_components=5000, cves=50000, uris=200000, entropy_width=4096, entropy_height=3072),
+}
+
+
+def create_png(width: int, height: int, rng: random.Random) -> bytes:
+    '''
+    Grayscale png with noisy rows, so it compresses about as badly as a real entropy graph.
+    '''
+    row_template = bytes(rng.getrandbits(8) for _ in range(width))
+    raw_rows = bytearray()
+    for row in range(height):
+        shift = row % width
+        raw_rows += b'\x00' + row_template[shift:] + row_template[:shift]
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(bytes(raw_rows), 6)) + chunk(b'IEND', b'')
+
+
+def _distribute(uids, keys, rng: random.Random) -> dict:
+    summary = {key: [] for key in keys}
+    for uid in uids:
+        summary[keys[rng.randrange(len(keys))]].append(uid)
+    return {key: value for key, value in summary.items() if value}
+
+
+def _sample(uids, count, rng: random.Random):
+    return [uids[rng.randrange(len(uids))] for _ in range(count)]
+
+
+def _plugin(summary, plugin_version, **fields):
+    return dict(fields, summary=summary, analysis_date=ANALYSIS_DATE, plugin_version=plugin_version, system_version=SYSTEM_VERSION)
+
+
+def _software_name(index: int) -> str:
+    return '{}_{} {}.{}.{}'.format(SOFTWARE_NAMES[index % len(SOFTWARE_NAMES)], index, index % 5, index % 17, index % 31)
+
+
+def _uri(index: int, rng: random.Random) -> str:
+    kind = index % 4
+    if kind == 0:
+        return '{}.{}.{}.{}'.format(rng.randrange(1, 224), rng.randrange(256), rng.randrange(256), rng.randrange(1, 255))
+    if kind == 1:
+        return '2001:db8:{:x}::{:x}'.format(index, rng.getrandbits(16))
+    if kind == 2:
+        return 'http://update{}.vendor.example/firmware_{}.bin?version=1&check=true'.format(index, rng.getrandbits(32))
+    return 'ftp://mirror{}.example.org/pub/{}'.format(index, rng.getrandbits(24))
+
+
+def generate_analysis(scale: SyntheticScale, seed=0) -> dict:
+    rng = random.Random(seed)
+    uids = ['{:064x}_{}'.format(rng.getrandbits(256), rng.randrange(100, 10 ** 7)) for _ in range(scale.files)]
+    executables = uids[:max(1, scale.files // 4)]
+
+    software = [_software_name(index) for index in range(scale.software_components)]
+    cve_summary = {}
+    for index in range(scale.cves):
+        product = software[index % len(software)] if software else _software_name(index)
+        critical = ' (CRITICAL)' if index % 7 == 0 else ''
+        cve_summary['{} CVE-{}-{}{}'.format(product, 2000 + index % 21, 1000 + index, critical)] = _sample(executables, 1 + index % 3, rng)
+    cve_results = {
+        product: {
+            'CVE-{}-{}'.format(2000 + index % 21, 1000 + index): {'score2': str(index % 10 + 0.5), 'score3': str(index % 10 + 0.8)}
+            for index in range(position, scale.cves, max(1, len(software)))
+        }
+        for position, product in enumerate(software)
+    }
+    entropy_graph = base64.b64encode(create_png(scale.entropy_width, scale.entropy_height, rng)).decode()
+
+    return {
+        'file_type': _plugin(_distribute(uids, FILE_TYPES, rng), '1.0', mime='application/x-tar', full='POSIX tar archive (GNU)'),
+        'crypto_material': _plugin({name: _sample(uids, 2, rng) for name in CRYPTO_MATERIAL[:1 + scale.files // 1000]}, '0.5.2'),
+        'software_components': _plugin({name: _sample(executables, 1 + rng.randrange(5), rng) for name in software}, '0.4.1'),
+        'exploit_mitigations': _plugin(_distribute(executables * 5, MITIGATIONS, rng), '0.1.2'),
+        'cve_lookup': _plugin(cve_summary, '0.0.4', cve_results=cve_results),
+        'cpu_architecture': _plugin(_distribute(executables, ARCHITECTURES, rng), '0.3.2'),
+        'ip_and_uri_finder': _plugin({_uri(index, rng): _sample(uids, 1, rng) for index in range(scale.uris)}, '0.4.2'),
+        'binwalk': _plugin(
+            {'something, that binwalk found': uids[:1]}, '0.5.2',
+            signature_analysis='DECIMAL       HEXADECIMAL     DESCRIPTION\n0             0x0             uImage header',
+            entropy_analysis_graph=entropy_graph
+        ),
+        'known_vulnerabilities': _plugin({name: _sample(uids, 1, rng) for name in VULNERABILITIES[:1 + scale.files // 10000]}, '0.2'),
+    }
+
+
+def generate_meta(scale: SyntheticScale) -> dict:
+    return {
+        'device_name': 'Synthetic device ({} files)'.format(scale.files), 'device_class': 'Router', 'device_part': '',
+        'vendor': 'Synthetic vendor', 'version': '1.0.{}'.format(scale.files), 'release_date': '2020-01-01',
+        'hid': 'synthetic_{}'.format(scale.files), 'size': 512 * scale.files + 4096,
+        'number_of_included_files': min(scale.files, 1000), 'included_files': [], 'total_files_in_firmware': scale.files
+    }
+
+
+def write_payload(directory: Path, scale: SyntheticScale, seed=0):
+    directory.mkdir(parents=True, exist_ok=True)
+    with (directory / 'analysis.json').open('w') as output_file:
+        json.dump(generate_analysis(scale, seed), output_file)
+    (directory / 'meta.json').write_text(json.dumps(generate_meta(scale)))
@@ -1,4 +1,10 @@
+import shutil
+import time
+from pathlib import Path
+
 import pytest
+from pdf_generator.generator import create_templates, typeset_pdf
+from pdf_generator.reproducible import REPRODUCIBLE_VARIABLE
 from pdf_generator.tex_generation.template_engine import TemplateEngine
 from test.data.test_dict import TEST_DICT, META_DICT
 
@@ -19,3 +25,17 @@ def test_latex_code_generation(stub_engine: TemplateEngine):
 def test_render_template(stub_engine, tmpdir):
     output = stub_engine.render_main_template(analysis=[TEST_DICT, META_DICT])
     assert output
+
+
+@pytest.mark.skipif(shutil.which('pdflatex') is None, reason='pdflatex not installed')
+def test_reproducible_pdf(monkeypatch, tmpdir):
+    monkeypatch.setenv(REPRODUCIBLE_VARIABLE, '1')
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: None)
+    reports = []
+    for run in ('first', 'second'):
+        tmp_dir = Path(str(tmpdir), run)
+        tmp_dir.mkdir()
+        create_templates(TEST_DICT, META_DICT, str(tmp_dir))
+        reports.append(typeset_pdf(str(tmp_dir)).read_bytes())
+        time.sleep(1)  # pdf dates have a resolution of seconds
+    assert reports[0] == reports[1]
@@ -1,5 +1,7 @@
 from pathlib import Path
 import shutil
+import subprocess
+import sys
 
 import PyPDF2
 
@@ -25,3 +27,10 @@ def test_docker_entry():
         PyPDF2.PdfFileReader(open(str(OUTPUT_FILE), 'rb'))
     except PyPDF2.utils.PdfReadError:
         assert False, 'PDF could not be read'
+
+
+def test_entry_point_imports_lazily():
+    heavy_modules = ['concurrent.futures', 'jinja2', 'PIL', 'reportlab']
+    check = 'import sys, docker_entry; print(*[module for module in {} if module in sys.modules])'.format(heavy_modules)
+    output = subprocess.run([sys.executable, '-c', check], cwd=str(Path(__file__).parent.parent), stdout=subprocess.PIPE, check=True).stdout
+    assert output.decode().strip() == ''
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.async_generator import AsyncReportGenerator, execute_latex_async, get_format_file_async, typeset_pdf_async
+from pdf_generator import async_generator
+from pdf_generator.instrumentation import recording
+from pdf_generator.latex_errors import LatexCompilationError
+from pdf_generator.latex_format import FormatSource
+from pdf_generator.result_cache import PdfCache
+from test.data.test_dict import META_DICT, TEST_DICT
+
+# pylint: disable=redefined-outer-name
+
+
+def run(coroutine):
+    # asyncio.run is not available before python 3.7
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+async def no_format(*_):
+    return None
+
+
+@pytest.fixture(scope='function')
+def latex_command(monkeypatch):
+    monkeypatch.setattr('pdf_generator.async_generator.get_format_file_async', no_format)
+    commands = {'command': ['sh', '-c', 'sleep 0.2; echo $PWD > main.pdf']}
+    monkeypatch.setattr('pdf_generator.async_generator.build_latex_command', lambda *_: commands['command'])
+    return commands
+
+
+def test_execute_latex_async_runs_in_directory(latex_command, tmpdir):
+    run(execute_latex_async(str(tmpdir)))
+    assert Path(str(tmpdir), 'main.pdf').read_text().strip() == str(tmpdir)
+
+
+def test_execute_latex_async_without_output(latex_command, tmpdir):
+    latex_command['command'] = ['sh', '-c', 'exit 1']
+    with pytest.raises(RuntimeError):
+        run(execute_latex_async(str(tmpdir)))
+
+
+def test_execute_latex_async_timeout(latex_command, monkeypatch, tmpdir):
+    monkeypatch.setenv('FACT_PDF_LATEX_TIMEOUT', '0.2')
+    latex_command['command'] = ['sh', '-c', 'sleep 30']
+    start = time.monotonic()
+    with pytest.raises(LatexCompilationError) as error:
+        run(execute_latex_async(str(tmpdir)))
+    assert time.monotonic() - start < 10
+    assert error.value.killed
+
+
+def test_cache_hit_does_not_start_latex(latex_command, tmpdir):
+    cache = PdfCache(Path(str(tmpdir), 'cache'))
+    work_dir = Path(str(tmpdir), 'work')
+    work_dir.mkdir()
+    (work_dir / 'main.tex').write_text('report')
+    first = run(typeset_pdf_async(str(work_dir), cache=cache)).read_bytes()
+
+    (work_dir / 'main.pdf').unlink()
+    latex_command['command'] = ['sh', '-c', 'exit 1']
+    assert run(typeset_pdf_async(str(work_dir), cache=cache)).read_bytes() == first
+
+
+def test_format_is_built_by_async_subprocess(monkeypatch, tmpdir):
+    format_file = Path(str(tmpdir), 'default-test.fmt')
+    source = FormatSource('default-test', Path(str(tmpdir), 'class.cls'), 'preamble')
+    monkeypatch.setattr('pdf_generator.async_generator.find_format', lambda *_: (format_file, source))
+    monkeypatch.setattr('pdf_generator.async_generator.prepare_format_build', lambda *_: ['sh', '-c', 'echo format > default-test.fmt'])
+    assert run(get_format_file_async('default')) == format_file
+    assert format_file.read_text().strip() == 'format'
+
+
+def test_generate_limits_concurrent_compiles(latex_command):
+    async def generate_reports():
+        generator = AsyncReportGenerator(max_concurrent_compiles=2)
+        return await asyncio.gather(*(generator.generate(TEST_DICT, META_DICT) for _ in range(4)))
+
+    start = time.monotonic()
+    reports = run(generate_reports())
+    assert time.monotonic() - start >= 0.4
+    assert len(set(reports)) == 4  # every report was compiled in its own directory
+
+
+def test_rendering_runs_outside_the_event_loop(latex_command, monkeypatch):
+    threads, create_templates = [], async_generator.create_templates
+
+    def create_templates_in_thread(*args, **kwargs):
+        threads.append(threading.get_ident())
+        create_templates(*args, **kwargs)
+
+    monkeypatch.setattr('pdf_generator.async_generator.create_templates', create_templates_in_thread)
+    with recording() as recorder:
+        assert run(AsyncReportGenerator().generate(TEST_DICT, META_DICT))
+    assert threads and threading.get_ident() not in threads
+    assert {'render', 'latex'} <= set(recorder.stages)
+
+
+def test_cancellation_kills_latex_and_removes_temp_dir(latex_command, tmpdir):
+    pid_file = Path(str(tmpdir), 'pid')
+    latex_command['command'] = ['sh', '-c', 'echo $$ $PWD > {}; exec sleep 30'.format(pid_file)]
+
+    async def cancel_report():
+        task = asyncio.ensure_future(AsyncReportGenerator().generate(TEST_DICT, META_DICT))
+        while not pid_file.exists() or not pid_file.read_text().strip():
+            if task.done():
+                task.result()  # re-raises whatever ended the report before pdflatex started
+                pytest.fail('report finished without starting pdflatex')
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    run(asyncio.wait_for(cancel_report(), timeout=30))
+    assert time.monotonic() - start < 10
+
+    pid, work_dir = pid_file.read_text().split()
+    assert not Path(work_dir).exists()
+    assert not Path('/proc', pid).exists() or 'Z' in Path('/proc', pid, 'stat').read_text().split()[2]
@@ -0,0 +1,79 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.batch import main, read_jobs, run_batch
+from pdf_generator.generator import reserve_output_path
+from test.data.test_dict import META_DICT
+
+# pylint: disable=redefined-outer-name
+
+TEST_ANALYSIS = Path(__file__).parent.parent / 'data' / 'analysis.json'
+
+
+def compile_mock(meta_data, tmp_dir, *_, **__):
+    if meta_data['device_name'] == 'broken':
+        raise RuntimeError('No pdf output generated. Aborting.')
+    pdf_path = Path(tmp_dir, '{}.pdf'.format(meta_data['device_name']))
+    pdf_path.write_text(tmp_dir)
+    return pdf_path
+
+
+@pytest.fixture(scope='function')
+def job_dir(monkeypatch, tmpdir):
+    monkeypatch.setattr('pdf_generator.batch.create_templates', lambda *_, **__: None)
+    monkeypatch.setattr('pdf_generator.batch.compile_pdf', compile_mock)
+    directory = Path(str(tmpdir), 'jobs')
+    for job_name, device_name in [('a', 'device'), ('b', 'device'), ('c', 'broken'), ('d', 'other')]:
+        (directory / job_name).mkdir(parents=True)
+        (directory / job_name / 'analysis.json').write_text(TEST_ANALYSIS.read_text())
+        (directory / job_name / 'meta.json').write_text(json.dumps(dict(META_DICT, device_name=device_name)))
+    (directory / 'incomplete').mkdir()
+    return directory
+
+
+def test_read_jobs_from_manifest(tmpdir):
+    manifest = Path(str(tmpdir), 'manifest.json')
+    manifest.write_text(json.dumps([{'analysis': 'fw/analysis.json', 'meta': '/abs/meta.json', 'name': 'fw'}]))
+    jobs = read_jobs(manifest)
+    assert len(jobs) == 1
+    assert jobs[0].analysis == Path(str(tmpdir), 'fw', 'analysis.json')
+    assert jobs[0].meta == Path('/abs/meta.json')
+
+
+def test_reserve_output_path(tmpdir):
+    first = reserve_output_path(Path(str(tmpdir)), 'report.pdf')
+    second = reserve_output_path(Path(str(tmpdir)), 'report.pdf')
+    assert (first.name, second.name) == ('report.pdf', 'report_1.pdf')
+
+
+def test_run_batch(job_dir, tmpdir):
+    output_dir = Path(str(tmpdir), 'output')
+    assert [job.name for job in read_jobs(job_dir)] == ['a', 'b', 'c', 'd']
+
+    results = {result.name: result for result in run_batch(read_jobs(job_dir), output_dir, processes=2)}
+    assert 'No pdf output generated' in results['c'].error
+    assert sorted(path.name for path in output_dir.iterdir()) == ['device.pdf', 'device_1.pdf', 'other.pdf']
+    # every job used its own temporary directory
+    assert len({path.read_text() for path in output_dir.iterdir()}) == 3
+
+
+def test_main_writes_summary(job_dir, tmpdir):
+    summary_file = Path(str(tmpdir), 'summary.json')
+    assert main([str(job_dir), '-o', str(Path(str(tmpdir), 'output')), '-j', '2', '--summary', str(summary_file)]) == 1
+
+    summary = json.loads(summary_file.read_text())
+    assert (summary['jobs'], summary['succeeded']) == (4, 3)
+    assert list(summary['failed']) == ['c']
+
+
+def test_direct_backend(tmpdir):
+    job_dir = Path(str(tmpdir), 'jobs', 'a')
+    job_dir.mkdir(parents=True)
+    (job_dir / 'analysis.json').write_text(TEST_ANALYSIS.read_text())
+    (job_dir / 'meta.json').write_text(json.dumps(META_DICT))
+    output_dir = Path(str(tmpdir), 'output')
+
+    assert main([str(job_dir.parent), '-o', str(output_dir), '-j', '1', '--backend', 'direct']) == 0
+    assert (output_dir / 'A_devices_name_analysis_report.pdf').read_bytes().startswith(b'%PDF')
@@ -0,0 +1,47 @@
+import os
+import stat
+from pathlib import Path
+
+from pdf_generator import cache_directory
+from pdf_generator.cache_directory import get_cache_directory
+
+# pylint: disable=protected-access
+
+
+def _use_default_root(monkeypatch, tmpdir):
+    monkeypatch.delenv('FACT_PDF_CACHE_DIR')
+    monkeypatch.setattr('pdf_generator.cache_directory.gettempdir', lambda: str(tmpdir))
+    cache_directory._get_fallback_root.cache_clear()
+    return Path(str(tmpdir), 'fact_pdf_report-{}'.format(os.getuid()))
+
+
+def test_default_root_is_private(monkeypatch, tmpdir):
+    cache_root = _use_default_root(monkeypatch, tmpdir)
+    assert get_cache_directory('images') == cache_root / 'images'
+    assert stat.S_IMODE(cache_root.stat().st_mode) == 0o700
+
+    cache_root.chmod(0o777)
+    get_cache_directory('images')
+    assert stat.S_IMODE(cache_root.stat().st_mode) == 0o700
+
+
+def test_foreign_root_is_not_used(monkeypatch, tmpdir):
+    cache_root = _use_default_root(monkeypatch, tmpdir)
+    cache_root.mkdir(mode=0o777)
+    user_id = os.getuid() + 1
+    monkeypatch.setattr('pdf_generator.cache_directory.os.getuid', lambda: user_id)
+    cache_root.rename(cache_root.with_name('fact_pdf_report-{}'.format(user_id)))
+
+    directory = get_cache_directory('formats')
+    assert directory.parent.name.startswith('fact_pdf_report-')
+    assert directory.parent != cache_root.with_name('fact_pdf_report-{}'.format(user_id))
+    assert get_cache_directory('formats') == directory
+
+
+def test_symlinked_root_is_not_used(monkeypatch, tmpdir):
+    cache_root = _use_default_root(monkeypatch, tmpdir)
+    target = Path(str(tmpdir), 'planted')
+    target.mkdir(mode=0o700)
+    cache_root.symlink_to(target)
+    assert get_cache_directory('results').parent != cache_root
+    assert not list(target.iterdir())
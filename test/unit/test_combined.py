@@ -0,0 +1,149 @@
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfReader
+from reportlab.pdfgen.canvas import Canvas
+
+from pdf_generator.combined import (
+    build_combined_document, compile_combined, find_failing_report, PAGES_FILE, read_page_ranges, split_pdf
+)
+from pdf_generator.generator import create_templates
+from pdf_generator.latex_errors import LatexCompilationError
+from test.data.test_dict import META_DICT, TEST_DICT
+
+# pylint: disable=redefined-outer-name
+
+JOBS = [(TEST_DICT, dict(META_DICT, device_name='first')), (TEST_DICT, dict(META_DICT, device_name='second')), ({}, dict(META_DICT, device_name='third'))]
+PAGES_PER_REPORT = [1, 2, 1]
+
+
+def write_pdf(pdf_path: Path, page_count: int):
+    canvas = Canvas(str(pdf_path))
+    for page in range(page_count):
+        canvas.drawString(100, 100, 'page {}'.format(page))
+        canvas.showPage()
+    canvas.save()
+
+
+def fake_combined_latex(tmp_dir, _format_file=None):
+    start_pages, page = [], 1
+    for index, page_count in enumerate(PAGES_PER_REPORT):
+        start_pages.append('{} {}'.format(index, page))
+        page += page_count
+    Path(tmp_dir, PAGES_FILE).write_text('\n'.join(start_pages) + '\n')
+    write_pdf(Path(tmp_dir, 'main.pdf'), sum(PAGES_PER_REPORT))
+
+
+def broken_combined_latex(tmp_dir, _format_file=None):
+    Path(tmp_dir, 'main.log').write_text('FACT report 0\nFACT report 1\n! Undefined control sequence.\nl.42 \\broken\nFACT report 2\n')
+    raise RuntimeError('No pdf output generated. Aborting.')
+
+
+@pytest.fixture(scope='function')
+def no_format(monkeypatch):
+    monkeypatch.setattr('pdf_generator.combined.get_format_file', lambda *_: None)
+
+
+def test_build_combined_document(tmpdir):
+    tmp_dir = Path(str(tmpdir))
+    report_dirs = []
+    for index, (analysis, meta_data) in enumerate(JOBS[:2]):
+        report_dir = tmp_dir / 'report{}'.format(index)
+        report_dir.mkdir()
+        create_templates(analysis, meta_data, str(report_dir))
+        report_dirs.append((index, report_dir))
+
+    document = build_combined_document(report_dirs, tmp_dir)
+
+    assert document.index('\\documentclass') < document.index('\\csname endofdump\\endcsname') < document.index('\\begin{document}')
+    assert document.count('\\begin{document}') == document.count('\\end{document}') == 1
+    assert document.count('\\begingroup') == document.count('\\endgroup') == 2
+    assert document.count('\n\\makeprofile') == 2
+    assert '\\input{report1/meta.tex}' in document
+    assert '\\input{meta.tex}' not in document
+    assert '\\immediate\\write\\factreportpages{1 \\thepage}' in document
+    assert document.index('\\typeout{FACT report 0}') < document.index('\\typeout{FACT report 1}')
+
+
+def test_build_combined_document_requires_dump_marker(tmpdir):
+    report_dir = Path(str(tmpdir), 'report0')
+    report_dir.mkdir()
+    (report_dir / 'main.tex').write_text('\\documentclass{article}\\begin{document}\\end{document}')
+    assert build_combined_document([(0, report_dir)], Path(str(tmpdir))) is None
+
+
+def test_split_pdf(tmpdir):
+    pdf_path, pages_file = Path(str(tmpdir), 'main.pdf'), Path(str(tmpdir), PAGES_FILE)
+    write_pdf(pdf_path, 4)
+    pages_file.write_text('0 1\n1 2\n2 4\n')
+    reader = PdfReader(str(pdf_path))
+
+    page_ranges = read_page_ranges(pages_file, len(reader.pages))
+    assert page_ranges == {0: range(0, 1), 1: range(1, 3), 2: range(3, 4)}
+
+    split_pdf(reader, page_ranges[1], Path(str(tmpdir), 'second.pdf'))
+    split_reader = PdfReader(str(Path(str(tmpdir), 'second.pdf')))
+    assert [page.extract_text().strip() for page in split_reader.pages] == ['page 1', 'page 2']
+
+
+def test_read_page_ranges_detects_missing_pages(tmpdir):
+    pages_file = Path(str(tmpdir), PAGES_FILE)
+    pages_file.write_text('0 1\n1 1\n')
+    with pytest.raises(RuntimeError):
+        read_page_ranges(pages_file, 1)
+
+
+def test_compile_combined(monkeypatch, no_format, tmpdir):
+    monkeypatch.setattr('pdf_generator.combined.execute_latex', fake_combined_latex)
+    monkeypatch.setattr('pdf_generator.combined.compile_pdf', lambda *_, **__: pytest.fail('reports must not be compiled alone'))
+
+    results = compile_combined(JOBS, str(tmpdir))
+
+    assert [result.error for result in results] == [None] * 3
+    assert [result.pdf_path.name for result in results] == ['first_analysis_report.pdf', 'second_analysis_report.pdf', 'third_analysis_report.pdf']
+    assert [len(PdfReader(str(result.pdf_path)).pages) for result in results] == PAGES_PER_REPORT
+
+
+def test_compile_combined_falls_back_to_single_reports(monkeypatch, no_format, tmpdir):
+    compiled = []
+
+    def compile_single(meta_data, report_dir, *_, **__):
+        if meta_data['device_name'] == 'second':
+            raise RuntimeError('No pdf output generated. Aborting.')
+        compiled.append(meta_data['device_name'])
+        pdf_path = Path(report_dir, '{}.pdf'.format(meta_data['device_name']))
+        write_pdf(pdf_path, 1)
+        return pdf_path
+
+    monkeypatch.setattr('pdf_generator.combined.execute_latex', broken_combined_latex)
+    monkeypatch.setattr('pdf_generator.combined.compile_pdf', compile_single)
+
+    results = compile_combined(JOBS, str(tmpdir))
+
+    assert compiled == ['first', 'third']
+    assert results[0].pdf_path.name == 'first.pdf'
+    assert results[1].pdf_path is None
+    assert 'No pdf output generated' in results[1].error
+    assert find_failing_report(Path(str(tmpdir), 'main.log')) == 1
+
+
+def test_killed_combined_run_is_not_retried(monkeypatch, tmpdir):
+    runs = []
+
+    def killed_latex(tmp_dir, format_file=None):
+        runs.append(format_file)
+        raise LatexCompilationError('pdflatex exceeded its time limit', killed=True)
+
+    def compile_single(meta_data, report_dir, *_, **__):
+        pdf_path = Path(report_dir, '{}.pdf'.format(meta_data['device_name']))
+        write_pdf(pdf_path, 1)
+        return pdf_path
+
+    monkeypatch.setattr('pdf_generator.combined.get_format_file', lambda *_: Path('main.fmt'))
+    monkeypatch.setattr('pdf_generator.combined.execute_latex', killed_latex)
+    monkeypatch.setattr('pdf_generator.combined.compile_pdf', compile_single)
+
+    results = compile_combined(JOBS, str(tmpdir))
+
+    assert runs == [Path('main.fmt')]
+    assert [result.pdf_path.name for result in results] == ['first.pdf', 'second.pdf', 'third.pdf']
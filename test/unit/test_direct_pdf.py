@@ -0,0 +1,83 @@
+import json
+import re
+import shutil
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfReader
+
+from pdf_generator.direct_pdf import get_section_rows, render_direct_pdf
+from pdf_generator.tex_generation.summary_reduction import reduce_analysis
+from test.data.test_dict import META_DICT, TEST_DICT
+
+# pylint: disable=redefined-outer-name
+
+TEST_ANALYSIS = Path(__file__).parent.parent / 'data' / 'analysis.json'
+
+
+def extract_text(pdf_path: Path) -> str:
+    return '\n'.join(page.extract_text() for page in PdfReader(str(pdf_path)).pages)
+
+
+def test_render_direct_pdf(tmpdir):
+    analysis = json.loads(TEST_ANALYSIS.read_text())
+    pdf_path = render_direct_pdf(analysis, META_DICT, str(tmpdir))
+
+    assert pdf_path.name == 'A_devices_name_analysis_report.pdf'
+    text = extract_text(pdf_path)
+    for expected in ['A devices name', 'Router', 'a vendor', 'version 42.13', '1970-01-01', 'SSLCertificate', 'FORTIFY_SOURCE']:
+        assert expected in text
+    sections = reduce_analysis(analysis)
+    for plugin in ['software_components', 'known_vulnerabilities', 'cve_lookup', 'file_type', 'cpu_architecture']:
+        for left_column, right_column in get_section_rows(plugin, sections[plugin]):
+            assert left_column in text
+            assert right_column in text
+    assert Path(str(tmpdir), 'entropy_analysis_graph.png').is_file()
+
+
+def test_missing_analyses(tmpdir):
+    text = extract_text(render_direct_pdf({}, {'device_name': 'empty'}, str(tmpdir)))
+
+    assert 'No Class' in text
+    assert text.count('Analysis not present') == 2
+    assert 'Software' not in text
+
+
+def test_section_rows():
+    sections = reduce_analysis(dict(TEST_DICT, ip_and_uri_finder={'summary': {'1.2.3.4': [1], 'http://a_b.example': [2]}}))
+
+    assert get_section_rows('software_components', sections['software_components'])[0] == ('1.24.2', 'BusyBox')
+    assert get_section_rows('file_type', sections['file_type'])[0] == ('16', 'compression/zlib')
+    assert get_section_rows('ip_and_uri_finder', sections['ip_and_uri_finder']) == [
+        ('1', 'IPv4 (incl. 1.2.3.4)'), ('0', 'IPv6'), ('1', 'URI (incl. http://a_b.example)')
+    ]
+    cve_rows = get_section_rows('cve_lookup', sections['cve_lookup'])
+    assert cve_rows[:3] == [('2', 'critical'), ('3', 'unknown'), ('', 'BusyBox 1.24.2 (CRITICAL)')]
+    assert cve_rows[-1] == ('', 'wpa_supplicant 2.7')
+
+
+def test_long_sections_continue_on_new_page(tmpdir):
+    analysis = {'known_vulnerabilities': {'summary': {'vulnerability {}'.format(index): [index] for index in range(100)}}}
+    pdf_path = render_direct_pdf(analysis, META_DICT, str(tmpdir))
+
+    assert len(PdfReader(str(pdf_path)).pages) > 1
+    assert 'vulnerability 99' in extract_text(pdf_path)
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r'[A-Za-z0-9]{3,}', text))
+
+
+@pytest.mark.skipif(shutil.which('pdflatex') is None, reason='pdflatex not installed')
+def test_text_matches_latex_output(tmpdir):
+    from pdf_generator.generator import compile_pdf, create_templates  # pylint: disable=import-outside-toplevel
+    analysis = json.loads(TEST_ANALYSIS.read_text())
+    latex_dir, direct_dir = Path(str(tmpdir), 'latex'), Path(str(tmpdir), 'direct')
+    latex_dir.mkdir()
+    direct_dir.mkdir()
+
+    create_templates(analysis, META_DICT, str(latex_dir))
+    latex_words = _words(extract_text(compile_pdf(META_DICT, str(latex_dir))))
+    direct_words = _words(extract_text(render_direct_pdf(analysis, META_DICT, str(direct_dir))))
+
+    assert direct_words <= latex_words
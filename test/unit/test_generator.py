@@ -1,51 +1,119 @@
 import json
+import os
+import time
 from pathlib import Path
 
 import pytest
 
 from pdf_generator.generator import (
-    copy_fact_image, create_report_filename, create_templates, execute_latex, LOGO_FILE, MAIN_TEMPLATE, META_TEMPLATE
+    compile_pdf, link_fact_image, create_report_filename, create_templates, CUSTOM_TEMPLATE_CLASS,
+    execute_command_in_directory, execute_latex, LatexLimits, LOGO_FILE, MAIN_TEMPLATE, META_TEMPLATE, TEMPLATE_DIR
 )
+from pdf_generator.latex_errors import LatexCompilationError
+from pdf_generator.result_cache import PdfCache
 from test.data.test_dict import META_DICT, TEST_DICT
 
 
+class MockStream:
+    def __init__(self, content):
+        self.content = content
+
+    def dump(self, file_name):
+        Path(file_name).write_text(self.content)
+
+
 class MockEngine:
     def __init__(self, *_, **__):
         pass
 
     @staticmethod
-    def render_main_template(analysis):
-        return json.dumps(analysis)
+    def stream_main_template(analysis, tmp_dir=None, sections=None, appendix=False, utc=False):
+        return MockStream(json.dumps(analysis))
 
     @staticmethod
-    def render_meta_template(meta_data):
+    def render_meta_template(meta_data, utc=False):
         return json.dumps(meta_data)
 
     @staticmethod
     def render_analysis_template(_, analysis):
         return json.dumps(analysis)
 
-    @staticmethod
-    def render_template_class():
-        return json.dumps('template_class.cls')
 
-
-def exec_mock(*_, **__):
-    Path('test').write_text('works')
+def exec_mock(_, directory):
+    Path(directory, 'test').write_text('works')
     return '', 0
 
 
 def test_execute_latex(monkeypatch, tmpdir):
-    monkeypatch.setattr('pdf_generator.generator.execute_shell_command_get_return_code', exec_mock)
+    monkeypatch.setattr('pdf_generator.generator.execute_command_in_directory', exec_mock)
+    current_dir = os.getcwd()
 
     execute_latex(str(tmpdir))
     assert Path(str(tmpdir), 'test').exists()
     assert Path(str(tmpdir), 'test').read_text() == 'works'
+    assert os.getcwd() == current_dir
+
+
+def test_execute_latex_without_output(monkeypatch, tmpdir):
+    monkeypatch.setattr('pdf_generator.generator.execute_command_in_directory', lambda *_: ('error output', 1))
+
+    with pytest.raises(RuntimeError):
+        execute_latex(str(tmpdir))
+
+
+def test_execute_command_in_directory(tmpdir):
+    output, return_code = execute_command_in_directory(['pwd'], str(tmpdir))
+    assert return_code == 0
+    assert output.strip() == str(tmpdir)
+
+
+def test_execute_latex_reports_first_error(monkeypatch, tmpdir):
+    Path(str(tmpdir), MAIN_TEMPLATE).write_text('\\documentclass{article}\n\\begin{document}\n\\broken\n')
+    Path(str(tmpdir), 'main.log').write_text('! Undefined control sequence.\nl.3 \\broken\n')
+    monkeypatch.setattr('pdf_generator.generator.execute_command_in_directory', lambda *_: ('', 1))
+
+    with pytest.raises(LatexCompilationError) as error:
+        execute_latex(str(tmpdir))
+    assert error.value.error.category == 'undefined_control_sequence'
+    assert error.value.error.line == 3
+    assert '>    3: \\broken' in str(error.value)
+    assert error.value.return_code == 1
+
+
+@pytest.mark.parametrize('command, limits, reason', [
+    (['sh', '-c', 'sleep 30'], LatexLimits(timeout=0.2, max_output=1000), 'time limit'),
+    (['yes'], LatexLimits(timeout=30, max_output=100000), 'output limit'),
+    (['sh', '-c', 'while true; do echo line >> main.log; done'], LatexLimits(timeout=30, max_output=100000), 'output limit'),
+])
+def test_watchdog_kills_latex(tmpdir, command, limits, reason):
+    start = time.monotonic()
+    with pytest.raises(LatexCompilationError) as error:
+        execute_command_in_directory(command, str(tmpdir), limits)
+    assert time.monotonic() - start < 10
+    assert error.value.killed
+    assert reason in str(error.value)
 
 
-def test_copy_fact_image(tmpdir):
-    copy_fact_image(str(tmpdir))
-    assert Path(str(tmpdir), LOGO_FILE).exists()
+def test_compile_pdf_does_not_retry_killed_latex(monkeypatch, tmpdir):
+    calls = []
+
+    def execute_mock(_tmp_dir, format_file=None):
+        calls.append(format_file)
+        raise LatexCompilationError('pdflatex exceeded the time limit of 1 seconds', killed=True)
+
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: Path('default.fmt'))
+    monkeypatch.setattr('pdf_generator.generator.execute_latex', execute_mock)
+
+    with pytest.raises(LatexCompilationError):
+        compile_pdf({'device_name': 'device'}, str(tmpdir))
+    assert calls == [Path('default.fmt')]
+
+
+def test_link_fact_image(tmpdir):
+    link_fact_image(str(tmpdir))
+    link_fact_image(str(tmpdir))
+    assert Path(str(tmpdir), LOGO_FILE).is_symlink()
+    assert Path(str(tmpdir), LOGO_FILE).read_bytes() == Path(TEMPLATE_DIR, LOGO_FILE).read_bytes()
 
 
 @pytest.mark.parametrize('device_name, pdf_name', [
@@ -63,3 +131,44 @@ def test_create_templates(monkeypatch, tmpdir):
 
     assert Path(str(tmpdir), MAIN_TEMPLATE).exists()
     assert Path(str(tmpdir), META_TEMPLATE).exists()
+    assert Path(str(tmpdir), CUSTOM_TEMPLATE_CLASS).read_bytes() == Path(TEMPLATE_DIR, 'default', CUSTOM_TEMPLATE_CLASS).read_bytes()
+
+
+def test_compile_pdf_falls_back_without_format(monkeypatch, tmpdir):
+    calls = []
+
+    def execute_mock(tmp_dir, format_file=None):
+        calls.append(format_file)
+        if format_file:
+            raise RuntimeError('No pdf output generated. Aborting.')
+        Path(tmp_dir, 'main.pdf').write_text('pdf')
+
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: Path('default.fmt'))
+    monkeypatch.setattr('pdf_generator.generator.execute_latex', execute_mock)
+
+    target_path = compile_pdf({'device_name': 'device'}, str(tmpdir))
+    assert calls == [Path('default.fmt'), None]
+    assert target_path.name == 'device_analysis_report.pdf'
+    assert target_path.read_text() == 'pdf'
+
+
+def test_compile_pdf_uses_result_cache(monkeypatch, tmpdir):
+    calls = []
+
+    def execute_mock(tmp_dir, _=None):
+        calls.append(tmp_dir)
+        Path(tmp_dir, 'main.pdf').write_text('pdf')
+
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: None)
+    monkeypatch.setattr('pdf_generator.generator.execute_latex', execute_mock)
+    cache = PdfCache(directory=Path(str(tmpdir), 'cache'))
+
+    for job in ('first', 'second'):
+        job_dir = Path(str(tmpdir), job)
+        job_dir.mkdir()
+        Path(job_dir, MAIN_TEMPLATE).write_text('identical input')
+        target_path = compile_pdf({'device_name': 'device'}, str(job_dir), cache=cache)
+        assert target_path.read_text() == 'pdf'
+
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
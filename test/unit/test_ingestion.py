@@ -0,0 +1,85 @@
+import json
+import tracemalloc
+from pathlib import Path
+
+from pdf_generator.ingestion import load_analysis, UidList
+from pdf_generator.tex_generation.template_engine import aggregate_ip_stats, TemplateEngine
+
+TEST_ANALYSIS = Path(__file__).parent.parent / 'data' / 'analysis.json'
+
+
+def test_summaries_are_reduced_to_counts():
+    analysis = load_analysis(TEST_ANALYSIS)
+    original = json.loads(TEST_ANALYSIS.read_text())
+
+    file_types = analysis['file_type']['summary']
+    assert list(file_types) == list(original['file_type']['summary'])
+    assert file_types['compression/zlib'] == UidList(16, [1, 3, 5])
+    assert len(file_types['compression/zlib']) == len(original['file_type']['summary']['compression/zlib'])
+    assert analysis['file_type']['analysis_date'] == original['file_type']['analysis_date']
+
+
+def test_unknown_plugins_and_entropy_graph_are_unchanged():
+    analysis = load_analysis(TEST_ANALYSIS)
+    original = json.loads(TEST_ANALYSIS.read_text())
+
+    assert analysis['binwalk'] == original['binwalk']
+    assert isinstance(analysis['binwalk']['summary']['something, that binwalk found'], list)
+
+
+def test_nested_entries_are_counted(tmpdir):
+    input_file = Path(str(tmpdir), 'analysis.json')
+    input_file.write_text(json.dumps({
+        'file_type': {'summary': {'nested': [[1, 2], {'uid': [3]}, 'uid', []]}},
+        'other': {'summary': {'kept': [[1, 2]]}},
+    }))
+    analysis = load_analysis(input_file)
+    assert len(analysis['file_type']['summary']['nested']) == 4
+    assert analysis['other']['summary']['kept'] == [[1, 2]]
+
+
+def test_rendering_is_unchanged(tmpdir):
+    engine = TemplateEngine()
+    streamed = engine.render_main_template(load_analysis(TEST_ANALYSIS), tmp_dir=str(tmpdir))
+    loaded = engine.render_main_template(json.loads(TEST_ANALYSIS.read_text()), tmp_dir=str(tmpdir))
+    assert streamed == loaded
+
+
+def test_memory_does_not_grow_with_summary_size(tmpdir):
+    input_file = Path(str(tmpdir), 'analysis.json')
+    uids = ['{:064x}_{}'.format(index, index) for index in range(200000)]
+    input_file.write_text(json.dumps({'file_type': {'summary': {'application/x-executable': uids}}}))
+    del uids
+
+    tracemalloc.start()
+    try:
+        analysis = load_analysis(input_file)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(analysis['file_type']['summary']['application/x-executable']) == 200000
+    assert peak < input_file.stat().st_size / 10
+
+
+def test_ip_summary_is_classified_while_parsing(tmpdir):
+    summary = {'1.2.3.4': [1, 2], '::1': [3], 'http://example.com': [{'nested': [4]}]}
+    input_file = Path(str(tmpdir), 'analysis.json')
+    input_file.write_text(json.dumps({'ip_and_uri_finder': {'summary': summary, 'plugin_version': '1.0'}}))
+
+    analysis = load_analysis(input_file)
+    classification = analysis['ip_and_uri_finder']['summary']
+    assert classification.counts == {'IPv4': 1, 'IPv6': 1, 'URI': 1}
+    assert analysis['ip_and_uri_finder']['plugin_version'] == '1.0'
+    assert aggregate_ip_stats(classification) == aggregate_ip_stats(summary)
+
+
+def test_full_inventory_keeps_ip_elements(tmpdir):
+    summary = {'1.2.3.4': [1, 2], '::1': [3], 'http://example.com': [4]}
+    input_file = Path(str(tmpdir), 'analysis.json')
+    input_file.write_text(json.dumps({'ip_and_uri_finder': {'summary': summary}}))
+
+    assert load_analysis(input_file)['ip_and_uri_finder']['summary'].elements is None
+    classification = load_analysis(input_file, full_inventory=True)['ip_and_uri_finder']['summary']
+    assert classification.elements == list(summary)
+    assert classification.counts == {'IPv4': 1, 'IPv6': 1, 'URI': 1}
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from pathlib import Path
+from threading import Thread
+
+from pdf_generator.instrumentation import (
+    append_metrics, bind_recorder, get_recorder, parse_latex_log, recording, stage, StageRecorder
+)
+
+# pylint: disable=redefined-outer-name
+
+LATEX_LOG = '''This is pdfTeX, Version 3.14159265-2.6-1.40.20 (TeX Live 2019/Debian) (preloaded format=pdflatex 2020.1.1)
+LaTeX Warning: Reference `foo' on page 1 undefined on input line 12.
+
+Package hyperref Warning: Token not allowed in a PDF string (PDFDocEncoding):
+(hyperref)                removing `\\\\' on input line 40.
+
+Here is how much of TeX's memory you used:
+ 15622 strings out of 483183
+ 300045 string characters out of 5966291
+ 597617 words of memory out of 5000000
+ 30289 multiletter control sequences out of 15000+600000
+Output written on main.pdf (3 pages, 125387 bytes).
+PDF statistics:
+'''
+
+
+def test_parse_latex_log(tmpdir):
+    log_file = Path(str(tmpdir), 'main.log')
+    log_file.write_text(LATEX_LOG)
+
+    statistics = parse_latex_log(log_file)
+
+    assert statistics['pages'] == 3
+    assert statistics['output_bytes'] == 125387
+    assert statistics['warnings'] == 2
+    assert statistics['tex_memory']['strings'] == {'used': 15622, 'available': 483183}
+    assert statistics['tex_memory']['words of memory'] == {'used': 597617, 'available': 5000000}
+    assert statistics['tex_memory']['multiletter control sequences']['used'] == 30289
+
+
+def test_stage_without_recorder_is_noop():
+    assert get_recorder() is None
+    with stage('render'):
+        pass
+    assert get_recorder() is None
+
+
+def test_recorder_is_per_thread():
+    with recording() as outer:
+        with recording() as inner:
+            threads = []
+            thread = Thread(target=lambda: threads.append(get_recorder()))
+            thread.start()
+            thread.join()
+            assert get_recorder() is inner
+        assert get_recorder() is outer
+    assert threads == [None]
+
+
+def test_bind_recorder():
+    assert bind_recorder(get_recorder)() is None
+    with recording() as recorder:
+        threads = []
+        thread = Thread(target=bind_recorder(lambda: threads.append(get_recorder())))
+        thread.start()
+        thread.join()
+    assert threads == [recorder]
+
+
+def test_stages_are_accumulated():
+    with recording(StageRecorder(profile_dir='')) as recorder:
+        assert get_recorder() is recorder
+        for _ in range(2):
+            with stage('render'):
+                sum(range(1000))
+        with stage('latex', python_stage=False):
+            pass
+    assert get_recorder() is None
+
+    assert list(recorder.stages) == ['render', 'latex']
+    assert recorder.stages['render']['calls'] == 2
+    assert recorder.stages['render']['wall_time'] > 0
+    assert recorder.stages['render']['process_peak_rss_kib'] > 0
+    assert set(recorder.stages['latex']) >= {'wall_time', 'cpu_time', 'children_cpu_time', 'children_process_peak_rss_kib'}
+
+
+def test_profile_dumps(tmpdir):
+    profile_dir = Path(str(tmpdir), 'profile')
+    with recording(StageRecorder(profile_dir=str(profile_dir))):
+        with stage('render'):
+            with stage('image_decode'):  # nested stages are covered by the outer profile
+                pass
+        with stage('latex', python_stage=False):
+            pass
+
+    assert sorted(path.suffix for path in profile_dir.iterdir()) == ['.prof', '.tracemalloc']
+    assert all(path.name.startswith('render-') for path in profile_dir.iterdir())
+
+
+def test_sidecar_and_metrics_file(tmpdir):
+    pdf_path = Path(str(tmpdir), 'report.pdf')
+    with recording(StageRecorder(profile_dir='')) as recorder:
+        with stage('publish'):
+            pass
+
+    sidecar = recorder.write_sidecar(pdf_path)
+    assert sidecar.name == 'report.metrics.json'
+    assert json.loads(sidecar.read_text()) == {'stages': {'publish': recorder.stages['publish']}, 'latex': {}}
+
+    pdf_path.write_bytes(b'%PDF-1.5')
+    assert json.loads(recorder.write_sidecar(pdf_path).read_text())['pdf'] == {
+        'sha256': hashlib.sha256(b'%PDF-1.5').hexdigest(), 'bytes': 8
+    }
+
+    metrics_file = Path(str(tmpdir), 'metrics.jsonl')
+    append_metrics(metrics_file, 'job_0', recorder.to_dict())
+    append_metrics(metrics_file, 'job_1', recorder.to_dict())
+    assert [json.loads(line)['job'] for line in metrics_file.read_text().splitlines()] == ['job_0', 'job_1']
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.latex_errors import classify_error, find_first_error, LatexCompilationError
+
+LOG = '''This is pdfTeX, Version 3.14159265-2.6-1.40.20 (TeX Live 2019) (preloaded format=default)
+(./main.tex
+LaTeX Warning: Something harmless.
+! Undefined control sequence.
+l.4 \\software{busybox}{1.2
+                            \\unknown}
+! Missing } inserted.
+l.9 }
+'''
+
+MAIN_TEX = '\n'.join('line {}'.format(number) for number in range(1, 11)) + '\n'
+
+
+@pytest.mark.parametrize('message, category', [
+    ('Undefined control sequence.', 'undefined_control_sequence'),
+    ('TeX capacity exceeded, sorry [buffer size=1000000].', 'capacity_exceeded'),
+    ("LaTeX Error: File `missing.png' not found.", 'missing_file'),
+    ('Missing $ inserted.', 'unbalanced_input'),
+    ('Paragraph ended before \\cvsect was complete.', 'unbalanced_input'),
+    ('Package inputenc Error: Unicode character ä (U+E4)', 'invalid_character'),
+    ('Emergency stop.', 'emergency_stop'),
+    ('Something new.', 'other'),
+])
+def test_classify_error(message, category):
+    assert classify_error(message) == category
+
+
+def test_find_first_error(tmpdir):
+    log_file, main_tex = Path(str(tmpdir), 'main.log'), Path(str(tmpdir), 'main.tex')
+    log_file.write_text(LOG)
+    main_tex.write_text(MAIN_TEX)
+
+    error = find_first_error(log_file, main_tex)
+
+    assert error.category == 'undefined_control_sequence'
+    assert error.message == 'Undefined control sequence.'
+    assert error.line == 4
+    assert error.context == ['     2: line 2', '     3: line 3', '>    4: line 4', '     5: line 5', '     6: line 6']
+    assert 'main.tex line 4' in error.describe()
+
+
+def test_find_first_error_without_errors(tmpdir):
+    log_file = Path(str(tmpdir), 'main.log')
+    assert find_first_error(log_file) is None
+    log_file.write_text('This is pdfTeX\nOutput written on main.pdf (2 pages, 1234 bytes).\n')
+    assert find_first_error(log_file) is None
+
+
+def test_find_first_error_without_line(tmpdir):
+    log_file = Path(str(tmpdir), 'main.log')
+    log_file.write_text('! TeX capacity exceeded, sorry [buffer size=1000000].\n')
+    error = find_first_error(log_file, Path(str(tmpdir), 'main.tex'))
+    assert (error.category, error.line, error.context) == ('capacity_exceeded', None, [])
+
+
+def test_compilation_error_is_runtime_error():
+    error = LatexCompilationError('No pdf output generated. Aborting.', return_code=1)
+    assert isinstance(error, RuntimeError)
+    assert str(error) == 'No pdf output generated. Aborting.'
+    assert (error.error, error.return_code, error.killed) == (None, 1, False)
@@ -0,0 +1,80 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from pdf_generator import latex_format
+from pdf_generator.latex_format import DUMP_MARKER, get_format_file, get_preamble
+from pdf_generator.tex_generation.template_engine import CUSTOM_TEMPLATE_CLASS, MAIN_TEMPLATE
+
+# pylint: disable=redefined-outer-name,protected-access
+
+
+@pytest.fixture(scope='function')
+def template_dir(monkeypatch, tmpdir):
+    monkeypatch.setenv('FACT_PDF_CACHE_DIR', str(Path(str(tmpdir), 'cache')))
+    monkeypatch.setattr('pdf_generator.latex_format.get_pdflatex_version', lambda: 'pdfTeX test')
+    monkeypatch.setattr(latex_format, '_FAILED_FORMATS', set())
+    templates = Path(str(tmpdir), 'templates')
+    shutil.copytree(str(latex_format.TEMPLATE_DIR / 'default'), str(templates / 'default'))
+    monkeypatch.setattr('pdf_generator.latex_format.TEMPLATE_DIR', templates)
+    return templates / 'default'
+
+
+@pytest.fixture(scope='function')
+def build_calls(monkeypatch):
+    calls = []
+
+    def build_mock(format_file, _class_file, preamble):
+        calls.append(preamble)
+        format_file.write_text('format')
+        return True
+
+    monkeypatch.setattr('pdf_generator.latex_format.build_format', build_mock)
+    return calls
+
+
+def test_get_preamble(template_dir):
+    preamble = get_preamble(template_dir / MAIN_TEMPLATE)
+    assert preamble.rstrip().endswith(r'\documentclass[letterpaper, icon]{twentysecondcv}')
+    assert DUMP_MARKER not in preamble
+
+    (template_dir / MAIN_TEMPLATE).write_text('no marker in here')
+    assert get_preamble(template_dir / MAIN_TEMPLATE) is None
+
+
+def test_format_is_cached(template_dir, build_calls):
+    format_file = get_format_file('default')
+    assert format_file.read_text() == 'format'
+    assert get_format_file('default') == format_file
+    assert len(build_calls) == 1
+
+
+def test_format_invalidation(template_dir, build_calls):
+    original_format = get_format_file('default')
+
+    main_template = template_dir / MAIN_TEMPLATE
+    main_template.write_text(main_template.read_text().replace(DUMP_MARKER, DUMP_MARKER + '\nchanged body'))
+    assert get_format_file('default') == original_format
+
+    (template_dir / CUSTOM_TEMPLATE_CLASS).write_text('changed class')
+    assert get_format_file('default') != original_format
+
+    main_template.write_text('\\batchmode\n' + main_template.read_text())
+    assert len({get_format_file('default'), original_format}) == 2
+    assert len(build_calls) == 3
+
+
+def test_no_format_without_class(template_dir, build_calls):
+    (template_dir / CUSTOM_TEMPLATE_CLASS).unlink()
+    assert get_format_file('default') is None
+    assert get_format_file('test') is None
+    assert not build_calls
+
+
+def test_failed_build_is_not_retried(template_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr('pdf_generator.latex_format.build_format', lambda *args: calls.append(args) and False)
+    assert get_format_file('default') is None
+    assert get_format_file('default') is None
+    assert len(calls) == 1
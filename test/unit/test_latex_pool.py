@@ -0,0 +1,118 @@
+import os
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.generator import compile_pdf, PDF_NAME
+from pdf_generator.latex_format import DUMP_MARKER
+from pdf_generator.latex_pool import build_job_input, LatexPool
+from pdf_generator.tex_generation.template_engine import MAIN_TEMPLATE, META_TEMPLATE
+
+# pylint: disable=redefined-outer-name
+
+FAKE_PDFLATEX = '''#!{python}
+import os, re, sys
+from pathlib import Path
+if os.environ.get('FAKE_PDFLATEX_CRASH'):
+    sys.exit(3)
+standby = Path(sys.argv[-1]).read_text()
+with open(re.search(r'\\\\input{{(.+?)}}', standby).group(1)) as fifo:
+    body = fifo.read()
+job_dir = re.search(r'input@path\\\\endcsname{{{{(.+?)/}}}}', body).group(1)
+if '\\\\fail' in body or not Path(job_dir, 'meta.tex').is_file():
+    Path('main.log').write_text('! Undefined control sequence.')
+    sys.exit(1)
+Path('main.log').write_text('fake pdfTeX log')
+Path('main.pdf').write_text('%PDF ' + str(os.getpid()) + ' ' + body)
+'''
+
+
+@pytest.fixture(scope='function')
+def fake_pdflatex(monkeypatch, tmpdir):
+    bin_dir = Path(str(tmpdir), 'bin')
+    bin_dir.mkdir()
+    script = bin_dir / 'pdflatex'
+    script.write_text(FAKE_PDFLATEX.format(python=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', '{}:{}'.format(bin_dir, os.environ['PATH']))
+    format_file = Path(str(tmpdir), 'default-test.fmt')
+    format_file.write_text('format')
+    monkeypatch.setattr('pdf_generator.latex_pool.get_format_file', lambda _: format_file)
+    return format_file
+
+
+@pytest.fixture(scope='function')
+def job_dir(tmpdir):
+    directory = Path(str(tmpdir), 'job')
+    directory.mkdir()
+    (directory / MAIN_TEMPLATE).write_text('\\documentclass{{twentysecondcv}}\n{}\n\\input{{meta.tex}}\n\\begin{{document}}body\\end{{document}}\n'.format(DUMP_MARKER))
+    (directory / META_TEMPLATE).write_text('meta')
+    return directory
+
+
+def test_build_job_input(tmpdir):
+    job_input = build_job_input('preamble{}\n\\begin{{document}}\\end{{document}}'.format(DUMP_MARKER), str(tmpdir))
+    assert job_input.startswith('\\expandafter\\def\\csname input@path\\endcsname{{{{{}/}}}}'.format(tmpdir))
+    assert job_input.endswith('\n\n\\begin{document}\\end{document}')
+    assert 'preamble' not in job_input
+    assert build_job_input('\\documentclass{article}', str(tmpdir)) is None
+
+
+def test_compile_in_standby_process(fake_pdflatex, job_dir):
+    with LatexPool(size=1, max_uses=2) as pool:
+        pids = set()
+        for _ in range(3):
+            assert pool.compile(job_dir)
+            output = (job_dir / PDF_NAME).read_text()
+            assert output.endswith('\\begin{document}body\\end{document}\n')
+            pids.add(output.split()[1])
+            assert (job_dir / 'main.log').read_text() == 'fake pdfTeX log'
+        assert len(pids) == 3
+        assert pool.restarts == 3
+        assert not list(Path(pool._root).glob('*/main.*'))  # pylint: disable=protected-access
+
+
+def test_failing_job_raises_and_slot_is_replaced(fake_pdflatex, job_dir):
+    with LatexPool(size=1) as pool:
+        (job_dir / MAIN_TEMPLATE).write_text('{}\\fail'.format(DUMP_MARKER))
+        with pytest.raises(RuntimeError):
+            pool.compile(job_dir)
+        (job_dir / MAIN_TEMPLATE).write_text('{}\\begin{{document}}\\end{{document}}'.format(DUMP_MARKER))
+        assert pool.compile(job_dir)
+
+
+def test_idle_process_that_died_is_replaced(fake_pdflatex, job_dir):
+    with LatexPool(size=1) as pool:
+        slot = pool._slots[0]  # pylint: disable=protected-access
+        slot.kill()
+        assert pool.compile(job_dir)
+        assert pool.restarts == 2
+
+
+def test_dead_processes_are_not_used(fake_pdflatex, job_dir, monkeypatch):
+    monkeypatch.setenv('FAKE_PDFLATEX_CRASH', '1')
+    with LatexPool(size=2, startup_timeout=1) as pool:
+        assert pool.compile(job_dir) is False
+        monkeypatch.delenv('FAKE_PDFLATEX_CRASH')
+        for slot in pool._slots:  # pylint: disable=protected-access
+            slot.process.wait()
+        assert pool.compile(job_dir)
+        assert pool.compile(job_dir)
+
+
+def test_pool_without_format(monkeypatch, job_dir):
+    monkeypatch.setattr('pdf_generator.latex_pool.get_format_file', lambda _: None)
+    pool = LatexPool()
+    assert pool.start() is False
+    assert pool.compile(job_dir) is False
+
+
+def test_compile_pdf_uses_pool(fake_pdflatex, job_dir, monkeypatch):
+    monkeypatch.setattr('pdf_generator.generator.execute_latex', lambda *_: pytest.fail('pdflatex must not be started cold'))
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda _: fake_pdflatex)
+    with LatexPool() as pool:
+        pdf_path = compile_pdf({'device_name': 'test'}, str(job_dir), latex_pool=pool)
+    assert pdf_path.name == 'test_analysis_report.pdf'
+    assert re.match(r'%PDF \d+ ', pdf_path.read_text())
@@ -0,0 +1,84 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.backends import DIRECT_BACKEND
+from pdf_generator.generator import PDF_NAME
+from pdf_generator.instrumentation import recording
+from pdf_generator.report import generate_report, generate_reports, get_engine, get_scratch_directory, open_report
+from pdf_generator.tex_generation.summary_reduction import reduce_analysis
+from test.data.test_dict import META_DICT, TEST_DICT
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture(scope='function')
+def scratch_dir(monkeypatch, tmpdir):
+    directory = Path(str(tmpdir), 'scratch')
+    directory.mkdir()
+    monkeypatch.setenv('FACT_PDF_SCRATCH_DIR', str(directory))
+    return directory
+
+
+@pytest.fixture(scope='function')
+def fake_latex(monkeypatch):
+    def execute_mock(tmp_dir, _format_file=None):
+        meta = Path(tmp_dir, 'meta.tex').read_text()
+        Path(tmp_dir, PDF_NAME).write_text('%PDF {} {}'.format(tmp_dir, re.search(r'\\cvname\{(.*?)\}', meta).group(1)))
+
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: None)
+    monkeypatch.setattr('pdf_generator.generator.execute_latex', execute_mock)
+
+
+def test_get_scratch_directory(monkeypatch, tmpdir):
+    monkeypatch.setenv('FACT_PDF_SCRATCH_DIR', str(tmpdir))
+    assert get_scratch_directory() == str(tmpdir)
+    monkeypatch.delenv('FACT_PDF_SCRATCH_DIR')
+    assert get_scratch_directory() in ('/dev/shm', None)
+
+
+def test_generate_report(fake_latex, scratch_dir):
+    report = generate_report(TEST_DICT, META_DICT)
+    assert report.startswith(b'%PDF')
+    assert report.decode().split()[1].startswith(str(scratch_dir))
+    assert not list(scratch_dir.iterdir())
+
+
+def test_open_report_outlives_scratch_directory(fake_latex, scratch_dir):
+    with open_report(TEST_DICT, META_DICT) as report:
+        assert not list(scratch_dir.iterdir())
+        assert report.read().startswith(b'%PDF')
+
+
+def test_generate_reports_from_threads(fake_latex, scratch_dir):
+    device_names = ['device {}'.format(index) for index in range(16)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        reports = list(executor.map(lambda name: generate_report(TEST_DICT, dict(META_DICT, device_name=name)), device_names))
+
+    assert [report.decode().split(' ', 2)[2] for report in reports] == device_names
+    assert len({report.split()[1] for report in reports}) == len(device_names)
+    assert get_engine() is get_engine()
+
+
+def test_generate_reports_per_style(monkeypatch, scratch_dir):
+    reduced = []
+    monkeypatch.setattr('pdf_generator.report.reduce_analysis', lambda analysis: reduced.append(analysis) or reduce_analysis(analysis))
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: None)
+    monkeypatch.setattr(
+        'pdf_generator.generator.execute_latex', lambda tmp_dir, _format_file=None: Path(tmp_dir, PDF_NAME).write_text('%PDF {}'.format(Path(tmp_dir).name))
+    )
+
+    with recording() as recorder:
+        reports = generate_reports(TEST_DICT, META_DICT, ['default', 'test', 'default'])
+
+    assert reports == {'default': b'%PDF default', 'test': b'%PDF test'}
+    assert len(reduced) == 1
+    assert recorder.stages['render']['calls'] == 2
+    assert not list(scratch_dir.iterdir())
+
+
+def test_generate_direct_report(scratch_dir):
+    assert generate_report(TEST_DICT, META_DICT, backend=DIRECT_BACKEND).startswith(b'%PDF')
+    assert not list(scratch_dir.iterdir())
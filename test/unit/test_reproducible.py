@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.generator import get_latex_environment, typeset_pdf
+from pdf_generator.reproducible import (
+    get_source_date_epoch, is_reproducible, REPRODUCIBLE_FILE, REPRODUCIBLE_SETTINGS, REPRODUCIBLE_VARIABLE,
+    SOURCE_DATE_EPOCH_VARIABLE
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    monkeypatch.delenv(REPRODUCIBLE_VARIABLE, raising=False)
+    monkeypatch.delenv(SOURCE_DATE_EPOCH_VARIABLE, raising=False)
+
+
+@pytest.mark.parametrize('environment, expected', [
+    ({}, False),
+    ({REPRODUCIBLE_VARIABLE: '0'}, False),
+    ({REPRODUCIBLE_VARIABLE: '1'}, True),
+    ({SOURCE_DATE_EPOCH_VARIABLE: '1600000000'}, True),
+])
+def test_is_reproducible(monkeypatch, environment, expected):
+    for variable, value in environment.items():
+        monkeypatch.setenv(variable, value)
+    assert is_reproducible() == expected
+
+
+def test_latex_environment(monkeypatch):
+    assert 'FORCE_SOURCE_DATE' not in get_latex_environment()
+
+    monkeypatch.setenv(REPRODUCIBLE_VARIABLE, '1')
+    environment = get_latex_environment()
+    assert get_source_date_epoch() == 0
+    assert (environment[SOURCE_DATE_EPOCH_VARIABLE], environment['FORCE_SOURCE_DATE'], environment['TZ']) == ('0', '1', 'UTC')
+
+    monkeypatch.setenv(SOURCE_DATE_EPOCH_VARIABLE, '1600000000')
+    assert get_latex_environment()[SOURCE_DATE_EPOCH_VARIABLE] == '1600000000'
+
+
+def test_typeset_writes_settings(monkeypatch, tmpdir):
+    monkeypatch.setattr('pdf_generator.generator.get_format_file', lambda *_: None)
+    monkeypatch.setattr('pdf_generator.generator.execute_latex', lambda tmp_dir, format_file=None: Path(tmp_dir, 'main.pdf').write_bytes(b'pdf'))
+
+    typeset_pdf(str(tmpdir))
+    assert not Path(str(tmpdir), REPRODUCIBLE_FILE).exists()
+
+    monkeypatch.setenv(REPRODUCIBLE_VARIABLE, '1')
+    typeset_pdf(str(tmpdir))
+    assert Path(str(tmpdir), REPRODUCIBLE_FILE).read_text() == REPRODUCIBLE_SETTINGS
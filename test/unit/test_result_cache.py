@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.result_cache import compute_input_hash, get_default_cache, PdfCache
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture(scope='function')
+def input_dir(tmpdir):
+    directory = Path(str(tmpdir), 'input')
+    directory.mkdir()
+    (directory / 'main.tex').write_text('main')
+    (directory / 'meta.tex').write_text('meta')
+    (directory / 'entropy_analysis_graph.png').write_bytes(b'image')
+    return directory
+
+
+def test_input_hash_covers_templates_and_images(input_dir):
+    original_hash = compute_input_hash(input_dir)
+    (input_dir / 'main.log').write_text('not an input')
+    assert compute_input_hash(input_dir) == original_hash
+
+    (input_dir / 'entropy_analysis_graph.png').write_bytes(b'other image')
+    assert compute_input_hash(input_dir) != original_hash
+
+    (input_dir / 'entropy_analysis_graph.png').write_bytes(b'image')
+    (input_dir / 'meta.tex').write_text('other meta')
+    assert compute_input_hash(input_dir) != original_hash
+
+
+def test_cache_hit_and_miss(tmpdir):
+    cache = PdfCache(directory=Path(str(tmpdir), 'cache'))
+    target = Path(str(tmpdir), 'report.pdf')
+
+    assert not cache.get('key', target)
+    assert not target.exists()
+
+    Path(str(tmpdir), 'compiled.pdf').write_bytes(b'pdf')
+    cache.put('key', Path(str(tmpdir), 'compiled.pdf'))
+    assert cache.get('key', target)
+    assert target.read_bytes() == b'pdf'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    cache = PdfCache(directory=Path(str(tmpdir), 'cache'), max_size=25)
+    pdf = Path(str(tmpdir), 'compiled.pdf')
+    pdf.write_bytes(b'x' * 10)
+
+    cache.put('first', pdf)
+    cache.put('second', pdf)
+    (cache.directory / 'first.pdf').touch()
+    (cache.directory / 'second.pdf').touch()
+    assert cache.get('first', Path(str(tmpdir), 'target.pdf'))  # most recently used now
+    cache.put('third', pdf)
+
+    assert sorted(path.name for path in cache.directory.iterdir()) == ['first.pdf', 'third.pdf']
+    assert cache.size == 20
+
+
+def test_oversized_results_are_not_cached(tmpdir):
+    cache = PdfCache(directory=Path(str(tmpdir), 'cache'), max_size=5)
+    pdf = Path(str(tmpdir), 'compiled.pdf')
+    pdf.write_bytes(b'x' * 10)
+    cache.put('key', pdf)
+    assert cache.size == 0
+
+
+def test_concurrent_puts_of_same_key(tmpdir):
+    cache = PdfCache(directory=Path(str(tmpdir), 'cache'))
+    pdfs = []
+    for index in range(4):
+        pdfs.append(Path(str(tmpdir), '{}.pdf'.format(index)))
+        pdfs[-1].write_bytes(b'%PDF same report' * 1000)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(20):
+            list(executor.map(lambda pdf: cache.put('samekey', pdf), pdfs))
+
+    assert [path.name for path in cache.directory.iterdir()] == ['samekey.pdf']
+    assert (cache.directory / 'samekey.pdf').read_bytes() == b'%PDF same report' * 1000
+
+
+def test_default_cache_is_shared(monkeypatch, tmpdir):
+    assert get_default_cache() is get_default_cache()
+    monkeypatch.setenv('FACT_PDF_CACHE_DIR', str(tmpdir))
+    assert get_default_cache() is not None and get_default_cache().directory == Path(str(tmpdir), 'results')
+    monkeypatch.setenv('FACT_PDF_RESULT_CACHE_SIZE', '0')
+    assert get_default_cache() is None
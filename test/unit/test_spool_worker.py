@@ -0,0 +1,99 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from pdf_generator.spool_worker import CLAIMED_DIR, ERROR_LOG, FAILED_DIR, INCOMING_DIR, RETRY_MARKER, SpoolWorker
+from test.data.test_dict import META_DICT, TEST_DICT
+
+# pylint: disable=redefined-outer-name
+
+
+def compile_mock(meta_data, tmp_dir, _template_style, **_):
+    if meta_data['device_name'] == 'broken':
+        raise RuntimeError('No pdf output generated. Aborting.')
+    pdf_path = Path(tmp_dir, '{}.pdf'.format(meta_data['device_name']))
+    pdf_path.write_text('pdf')
+    return pdf_path
+
+
+@pytest.fixture(scope='function')
+def spool_worker(monkeypatch, tmpdir):
+    monkeypatch.setattr('pdf_generator.spool_worker.create_templates', lambda *_, **__: None)
+    monkeypatch.setattr('pdf_generator.spool_worker.compile_pdf', compile_mock)
+    output_dir = Path(str(tmpdir), 'pdf')
+    output_dir.mkdir()
+    return SpoolWorker(Path(str(tmpdir), 'spool'), output_dir, Path(str(tmpdir)), concurrency=2, poll_interval=0.01, worker_id='worker_a')
+
+
+def _add_job(worker, name, device_name):
+    job_dir = worker.spool_dir / INCOMING_DIR / name
+    job_dir.mkdir()
+    (job_dir / 'analysis.json').write_text(json.dumps(TEST_DICT))
+    (job_dir / 'meta.json').write_text(json.dumps(dict(META_DICT, device_name=device_name)))
+
+
+def test_claim_jobs_respects_limit(spool_worker):
+    for index in range(3):
+        _add_job(spool_worker, 'job_{}'.format(index), 'device')
+
+    claimed = spool_worker.claim_jobs(2)
+    assert [job.name for job in claimed] == ['job_0', 'job_1']
+    assert all(job.parent == spool_worker.spool_dir / CLAIMED_DIR / 'worker_a' for job in claimed)
+    assert [job.name for job in (spool_worker.spool_dir / INCOMING_DIR).iterdir()] == ['job_2']
+    assert spool_worker.claim_jobs(0) == []
+
+
+def test_jobs_with_same_device_name_keep_both_reports(spool_worker):
+    _add_job(spool_worker, 'job_0', 'device')
+    _add_job(spool_worker, 'job_1', 'device')
+
+    spool_worker.run(stop_when_idle=True)
+
+    assert spool_worker.processed == 2
+    assert sorted(path.name for path in spool_worker.output_dir.glob('*.pdf')) == ['device.pdf', 'device_1.pdf']
+
+
+def test_recover_jobs_of_previous_run(spool_worker):
+    for index in range(2):
+        _add_job(spool_worker, 'job_{}'.format(index), 'device')
+    first, second = spool_worker.claim_jobs(2)
+    (second / RETRY_MARKER).touch()
+
+    assert spool_worker.recover_jobs() == 2
+    assert [job.name for job in (spool_worker.spool_dir / INCOMING_DIR).iterdir()] == ['job_0']
+    assert (spool_worker.spool_dir / INCOMING_DIR / first.name / RETRY_MARKER).exists()
+    assert (spool_worker.spool_dir / FAILED_DIR / second.name / ERROR_LOG).exists()
+    assert not list(spool_worker.claimed_dir.iterdir())
+
+
+def test_run_isolates_failing_jobs(spool_worker):
+    _add_job(spool_worker, 'job_0', 'first')
+    _add_job(spool_worker, 'job_1', 'broken')
+    _add_job(spool_worker, 'job_2', 'second')
+
+    spool_worker.run(stop_when_idle=True)
+
+    assert spool_worker.processed == 2
+    assert spool_worker.failed == 1
+    assert sorted(path.name for path in spool_worker.output_dir.iterdir()) == [
+        'first.metrics.json', 'first.pdf', 'second.metrics.json', 'second.pdf'
+    ]
+    assert 'No pdf output generated' in (spool_worker.spool_dir / FAILED_DIR / 'job_1' / ERROR_LOG).read_text()
+    assert not list(spool_worker.claimed_dir.iterdir())
+    assert not list((spool_worker.spool_dir / INCOMING_DIR).iterdir())
+
+
+def test_run_writes_metrics(spool_worker):
+    spool_worker.metrics_file = spool_worker.spool_dir / 'metrics.jsonl'
+    _add_job(spool_worker, 'job_0', 'first')
+
+    spool_worker.run(stop_when_idle=True)
+
+    sidecar = json.loads((spool_worker.output_dir / 'first.metrics.json').read_text())
+    assert {'load_json', 'publish'} <= set(sidecar['stages'])
+    aggregated = [json.loads(line) for line in spool_worker.metrics_file.read_text().splitlines()]
+    assert len(aggregated) == 1
+    assert aggregated[0]['job'] == 'job_0'
+    assert aggregated[0]['output'] == 'first.pdf'
+    assert aggregated[0]['stages'] == sidecar['stages']
@@ -0,0 +1,100 @@
+from copy import deepcopy
+from threading import Thread
+
+import pytest
+
+from pdf_generator.ingestion import UidList
+from pdf_generator.tex_generation.fragment_cache import FragmentCache, hash_summary
+from pdf_generator.tex_generation.ip_classification import classify_ip_elements
+from pdf_generator.tex_generation.template_engine import TemplateEngine
+from test.data.test_dict import TEST_DICT
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture(scope='function')
+def fragment_cache():
+    return FragmentCache(max_entries=64)
+
+
+def test_cache_is_bounded_lru():
+    cache = FragmentCache(max_entries=2)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get_or_render(key, lambda key=key: key.upper())
+
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.get_or_render('a', lambda: 'rendered again') == 'A'
+    assert cache.get_or_render('b', lambda: 'rendered again') == 'rendered again'
+
+
+def test_disabled_cache_always_renders():
+    cache = FragmentCache(max_entries=0)
+    assert cache.get_or_render('a', lambda: 'first') == 'first'
+    assert cache.get_or_render('a', lambda: 'second') == 'second'
+    assert len(cache) == 0
+
+
+def test_cache_is_thread_safe():
+    cache = FragmentCache(max_entries=16)
+
+    def render_many(offset):
+        for index in range(2000):
+            key = (index + offset) % 40
+            assert cache.get_or_render(key, lambda key=key: str(key)) == str(key)
+
+    threads = [Thread(target=render_many, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) == 16
+    assert cache.hits + cache.misses == 8 * 2000
+
+
+def test_hash_summary():
+    assert hash_summary(None) != hash_summary({'summary': {}})
+    assert hash_summary({'summary': {}}) != hash_summary({'summary': None})
+    assert hash_summary({'summary': {'a': [1], 'b': [2]}}) == hash_summary({'summary': {'a': [1], 'b': [2]}, 'analysis_date': 2})
+    assert hash_summary({'summary': {'a': [1], 'b': [2]}}) != hash_summary({'summary': {'b': [2], 'a': [1]}})
+    assert hash_summary({'summary': {'a': UidList(2, ['x'])}}) != hash_summary({'summary': {'a': UidList(3, ['x'])}})
+    assert hash_summary({'summary': {'a': [1]}, 'cve_results': {'a': {'CVE-1': {'score3': '9.8'}}}}) != hash_summary(
+        {'summary': {'a': [1]}, 'cve_results': {'a': {'CVE-1': {'score3': '5.0'}}}}
+    )
+
+    ips = classify_ip_elements(['1.2.3.4', 'http://example.com'])
+    assert hash_summary({'summary': ips}) == hash_summary({'summary': classify_ip_elements(['1.2.3.4', 'http://example.com'])})
+    assert hash_summary({'summary': ips}) != hash_summary({'summary': classify_ip_elements(['1.2.3.5', 'http://example.com'])})
+
+
+def test_only_changed_sections_are_rendered(fragment_cache, tmpdir):
+    engine = TemplateEngine(tmp_dir=str(tmpdir), fragment_cache=fragment_cache)
+    analysis = deepcopy(TEST_DICT)
+
+    first = engine.render_main_template(analysis)
+    rendered_sections = fragment_cache.misses
+    assert engine.render_main_template(deepcopy(analysis)) == first
+    assert fragment_cache.misses == rendered_sections
+
+    analysis['software_components']['summary']['dropbear 2019.78'] = [1]
+    changed = engine.render_main_template(analysis)
+    assert fragment_cache.misses == rendered_sections + 1
+    assert '2019.78}{dropbear' in changed
+    assert changed == TemplateEngine(tmp_dir=str(tmpdir), fragment_cache=FragmentCache(0)).render_main_template(analysis)
+
+
+def test_missing_and_empty_sections_are_distinguished(fragment_cache, tmpdir):
+    engine = TemplateEngine(tmp_dir=str(tmpdir), fragment_cache=fragment_cache)
+    without_crypto = {plugin: result for plugin, result in TEST_DICT.items() if plugin != 'crypto_material'}
+
+    assert 'Analysis not present' in engine.render_main_template(without_crypto)
+    assert 'Analysis not present' not in engine.render_main_template(dict(without_crypto, crypto_material={'summary': {}}))
+
+
+def test_precomputed_sections_bypass_cache(fragment_cache, tmpdir):
+    engine = TemplateEngine(tmp_dir=str(tmpdir), fragment_cache=fragment_cache)
+    output = engine.render_main_template(TEST_DICT, sections={'crypto_material': ['given section']})
+
+    assert 'given section' in output
+    assert len(fragment_cache) == 0
@@ -0,0 +1,108 @@
+import io
+import os
+import tracemalloc
+from base64 import b64encode, encodebytes
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from pdf_generator.tex_generation.image_processing import (
+    decode_base64_stream, evict_cached_images, get_target_dpi, store_base64_image, TEXT_WIDTH_INCHES
+)
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture(scope='function')
+def cache_dir(monkeypatch, tmpdir):
+    monkeypatch.setenv('FACT_PDF_CACHE_DIR', str(tmpdir))
+    return Path(str(tmpdir), 'images')
+
+
+@pytest.mark.parametrize('content', [b'', b'a', b'ab', b'abc', bytes(range(256)) * 100])
+@pytest.mark.parametrize('encode', [b64encode, encodebytes])
+def test_decode_base64_stream(content, encode):
+    output = io.BytesIO()
+    decode_base64_stream(encode(content).decode(), output, chunk_size=12)
+    assert output.getvalue() == content
+
+
+def test_store_base64_image_deduplicates(cache_dir, tmpdir):
+    image = b64encode(b'image content').decode()
+    first_job, second_job = Path(str(tmpdir), 'first'), Path(str(tmpdir), 'second')
+    first_job.mkdir()
+    second_job.mkdir()
+
+    first_path = store_base64_image(image, 'graph', str(first_job))
+    second_path = store_base64_image(image, 'graph', str(second_job))
+
+    assert Path(first_path).read_bytes() == Path(second_path).read_bytes() == b'image content'
+    assert len(list(cache_dir.iterdir())) == 1
+    assert os.stat(first_path).st_ino == os.stat(second_path).st_ino
+
+
+def test_repeated_image_is_hashed_once(monkeypatch, cache_dir, tmpdir):
+    hashed = []
+    monkeypatch.setattr('pdf_generator.tex_generation.image_processing.hash_base64_string', lambda image: hashed.append(image) or 'hash')
+    image = b64encode(b'shared image').decode()
+    for style in ('default', 'custom'):
+        Path(str(tmpdir), style).mkdir()
+        assert Path(store_base64_image(image, 'graph', str(Path(str(tmpdir), style)))).read_bytes() == b'shared image'
+    assert hashed == [image]
+
+
+def test_failed_decode_leaves_no_partial_file(monkeypatch, cache_dir, tmpdir):
+    def broken_downscale(*_):
+        raise ValueError('broken image')
+
+    monkeypatch.setattr('pdf_generator.tex_generation.image_processing.downscale_image', broken_downscale)
+    with pytest.raises(ValueError):
+        store_base64_image(b64encode(b'image content').decode(), 'graph', str(tmpdir), target_dpi=150)
+    assert not list(cache_dir.iterdir())
+
+
+@pytest.mark.parametrize('value, expected', [('150', 150), ('0', None), ('-1', None)])
+def test_get_target_dpi(monkeypatch, value, expected):
+    monkeypatch.setenv('FACT_PDF_IMAGE_DPI', value)
+    assert get_target_dpi() == expected
+
+
+def test_evict_cached_images(tmpdir):
+    for index in range(5):
+        image = Path(str(tmpdir), '{}.png'.format(index))
+        image.write_bytes(b'image')
+        os.utime(str(image), (index, index))
+    evict_cached_images(Path(str(tmpdir)), max_images=2)
+    assert sorted(path.name for path in Path(str(tmpdir)).iterdir()) == ['3.png', '4.png']
+
+
+def test_streaming_decode_memory(cache_dir, tmpdir):
+    content = os.urandom(24 * 1024 ** 2)
+    base64_string = encodebytes(content).decode()
+    del content
+
+    tracemalloc.start()
+    try:
+        store_base64_image(base64_string, 'graph', str(tmpdir))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert Path(str(tmpdir), 'graph.png').stat().st_size == 24 * 1024 ** 2
+    assert peak < 8 * 1024 ** 2  # decodebytes(base64_string.encode()) needs more than 56 MiB
+
+
+def test_downscale_reduces_size(cache_dir, tmpdir):
+    large_image = Image.effect_noise((4000, 1500), 64).convert('RGB')
+    buffer = io.BytesIO()
+    large_image.save(buffer, format='PNG')
+    base64_string = b64encode(buffer.getvalue()).decode()
+
+    original = Path(store_base64_image(base64_string, 'original', str(tmpdir), target_dpi=0))
+    downscaled = Path(store_base64_image(base64_string, 'downscaled', str(tmpdir), target_dpi=150))
+
+    with Image.open(str(downscaled)) as image:
+        assert image.width == int(TEXT_WIDTH_INCHES * 150)
+        assert image.height == round(1500 * image.width / 4000)
+    assert downscaled.stat().st_size < original.stat().st_size / 4
@@ -0,0 +1,82 @@
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+from pdf_generator.generator import create_templates
+from pdf_generator.ingestion import UidList
+from pdf_generator.tex_generation.inventory import get_inventory, iterate_inventory
+from pdf_generator.tex_generation.ip_classification import classify_ip_elements, IpClassification
+from pdf_generator.tex_generation.template_engine import APPENDIX_TEMPLATE, MAIN_TEMPLATE, TemplateEngine
+from test.data.test_dict import META_DICT, TEST_DICT
+
+
+def test_iterate_inventory():
+    assert list(iterate_inventory('software_components', {'busybox 1.2': [1, 2], 'dropbear': UidList(5)})) == [
+        ('2', 'busybox 1.2'), ('5', 'dropbear')
+    ]
+    assert list(iterate_inventory('ip_and_uri_finder', {'1.2.3.4': [1], 'http://example.com': [2]})) == [
+        ('IPv4', '1.2.3.4'), ('URI', 'http://example.com')
+    ]
+
+    kept = IpClassification(keep_elements=True)
+    kept.add_batch(iter(['::1', '1.2.3.4']))
+    assert list(iterate_inventory('ip_and_uri_finder', kept)) == [('IPv6', '::1'), ('IPv4', '1.2.3.4')]
+    assert list(iterate_inventory('ip_and_uri_finder', classify_ip_elements(['::1']))) == [('0', 'IPv4'), ('1', 'IPv6'), ('0', 'URI')]
+
+
+def test_get_inventory_skips_missing_and_empty_summaries():
+    inventory = get_inventory({'software_components': {'summary': {'a': [1]}}, 'cve_lookup': {'summary': {}}, 'file_type': {'summary': {'b': [1]}}})
+    assert [title for title, _ in inventory] == ['Software']
+
+
+def test_appendix_lists_everything(tmpdir):
+    analysis = {'software_components': {'summary': {'software_{} 1.0'.format(index): [index] for index in range(500)}}}
+    appendix = ''.join(TemplateEngine(tmp_dir=str(tmpdir)).stream_appendix_template(analysis))
+
+    assert appendix.startswith('\\newpage\n\\section{Software}')
+    assert appendix.count('\\twentyitemlong{') == 500
+    assert '\\twentyitemlong{1}{software\\_499 1.0}\n' in appendix
+    assert max(len(line) for line in appendix.splitlines()) < 100
+
+
+def test_create_templates_with_appendix(tmpdir):
+    create_templates(TEST_DICT, META_DICT, str(tmpdir), appendix=True)
+    assert '\\input{appendix.tex}' in Path(str(tmpdir), MAIN_TEMPLATE).read_text()
+    assert '\\section{CVEs}' in Path(str(tmpdir), APPENDIX_TEMPLATE).read_text()
+
+
+def test_create_templates_without_appendix(tmpdir):
+    create_templates(TEST_DICT, META_DICT, str(tmpdir))
+    assert 'appendix' not in Path(str(tmpdir), MAIN_TEMPLATE).read_text()
+    assert not Path(str(tmpdir), APPENDIX_TEMPLATE).exists()
+
+
+class _CountingFile(StringIO):
+    def __init__(self):
+        super().__init__()
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+        return len(text)
+
+
+def _peak_memory_of_dump(engine: TemplateEngine, analysis: dict) -> int:
+    output = _CountingFile()
+    tracemalloc.start()
+    try:
+        engine.stream_appendix_template(analysis).dump(output)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert output.size > 0
+    return peak
+
+
+def test_appendix_memory_does_not_grow_with_its_length(tmpdir):
+    engine = TemplateEngine(tmp_dir=str(tmpdir))
+    small = {'cpu_architecture': {'summary': {'arch {}'.format(index): UidList(1) for index in range(2000)}}}
+    large = {'cpu_architecture': {'summary': {'arch {}'.format(index): UidList(1) for index in range(100000)}}}
+
+    _peak_memory_of_dump(engine, small)  # compiles the template
+    assert _peak_memory_of_dump(engine, large) < 2 * _peak_memory_of_dump(engine, small) + 256 * 1024
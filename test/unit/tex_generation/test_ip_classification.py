@@ -0,0 +1,74 @@
+import socket
+from random import Random
+
+import pytest
+
+from pdf_generator.tex_generation.ip_classification import classify_element, classify_ip_elements, IPV4, IPV6, URI
+from pdf_generator.tex_generation.template_engine import aggregate_ip_stats, replace_special_characters
+
+
+def _validate_ip(ip, address_format):
+    try:
+        socket.inet_pton(address_format, ip)
+        return True
+    except OSError:
+        return False
+
+
+def _legacy_aggregate_ip_stats(summary):
+    uris, ipv4s, ipv6s = [], [], []
+    for element in summary:
+        if not _validate_ip(element, socket.AF_INET) and not _validate_ip(element, socket.AF_INET6):
+            uris.append(element)
+        elif _validate_ip(element, socket.AF_INET):
+            ipv4s.append(element)
+        else:
+            ipv6s.append(element)
+    return [_legacy_aggregate_class(ipv4s, 'IPv4'), _legacy_aggregate_class(ipv6s, 'IPv6'), _legacy_aggregate_class(uris, 'URI')]
+
+
+def _legacy_aggregate_class(elements, ip_class):
+    if not elements:
+        return f'0}}{{{ip_class}\\quad$\\>$'
+    short_element = next((element for element in elements if len(element) <= 50), elements[0][:51])
+    return f'{len(elements)}}}{{{ip_class}\\quad$\\>$ (incl. {replace_special_characters(short_element)})'
+
+
+@pytest.mark.parametrize('element, expected_class', [
+    ('1.2.3.4', IPV4),
+    ('255.255.255.255', IPV4),
+    ('256.1.1.1', URI),
+    ('1.2.3', URI),
+    ('::1', IPV6),
+    ('fe80::1', IPV6),
+    ('::ffff:1.2.3.4', IPV6),
+    ('fe80::1%eth0', URI),
+    ('dead:beef', URI),
+    ('http://1.2.3.4/', URI),
+    ('', URI),
+])
+def test_classify_element(element, expected_class):
+    assert classify_element(element) == expected_class
+
+
+def test_aggregate_ip_stats_matches_legacy_implementation():
+    random = Random(4711)
+    fragments = ['1', '12', '255', '300', '.', ':', '::', 'a', 'ff', 'http://', 'example.com', '/', '_', '%', 'x' * 30]
+    for _ in range(300):
+        summary = {''.join(random.choice(fragments) for _ in range(random.randint(0, 12))): [1] for _ in range(random.randint(1, 30))}
+        summary.update({'10.0.0.{}'.format(random.randint(0, 255)): [1], '::{}'.format(random.randint(0, 9)): [1]})
+        assert aggregate_ip_stats(summary) == _legacy_aggregate_ip_stats(summary)
+
+
+def test_long_elements_are_truncated():
+    summary = ['http://{}'.format('a' * 60), 'http://{}'.format('b' * 70)]
+    assert aggregate_ip_stats(summary) == _legacy_aggregate_ip_stats(summary)
+
+
+def test_batches_give_same_result():
+    elements = ['1.1.1.{}'.format(index) for index in range(10)] + ['::1', 'uri']
+    classification = classify_ip_elements([])
+    classification.add_batch(elements[:5])
+    classification.add_batch(elements[5:])
+    assert aggregate_ip_stats(classification) == aggregate_ip_stats(elements)
+    assert len(classification) == 12
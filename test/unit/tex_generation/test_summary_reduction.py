@@ -0,0 +1,132 @@
+from random import Random
+
+import pytest
+
+from pdf_generator.tex_generation.summary_reduction import (
+    aggregate_cves, CveEntry, get_severity, parse_cve_entry, reduce_analysis, reduce_cve_lookup, reduce_exploit_mitigations,
+    reduce_file_type, reduce_software_components, ReducedSections, TOP_CVES
+)
+from pdf_generator.tex_generation.template_engine import get_x_entries
+
+from test.data.test_dict import TEST_DICT
+
+
+def _legacy_exploit_mitigation(summary):
+    # the call_for_mitigations filter the default template used before the summaries were reduced
+    max_count = 1
+    for mitigation in ['Canary', 'NX', 'RELRO', 'PIE', 'FORTIFY']:
+        count = sum(len(summary[entry]) for entry in summary if mitigation in entry)
+        if count != 0:
+            max_count = count
+            break
+    numbers = {
+        key: sum(len(summary[entry]) for entry in summary if key in entry and ('present' in entry or 'enabled' in entry))
+        for key in ['PIE', 'RELRO', 'Canary', 'NX', 'FORTIFY']
+    }
+    return (
+        f'{{CANARY/{numbers["Canary"] / max_count}}},{{PIE/{numbers["PIE"] / max_count}}},'
+        f'{{RELRO/{numbers["RELRO"] / max_count}}},{{NX/{numbers["NX"] / max_count}}},'
+        f'{{FORTIFY\\_SOURCE/{numbers["FORTIFY"] / max_count}}}'
+    )
+
+
+def _legacy_five_longest_entries(summary, top=5):
+    # the top_five filter the default template used before the summaries were reduced
+    if len(summary) < top + 1:
+        return summary
+    return {key: summary[key] for key in sorted(summary, key=lambda key: len(summary[key]), reverse=True)[:top]}
+
+
+def _random_summary(random, keys):
+    return {key: list(range(random.randint(0, 20))) for key in keys}
+
+
+def test_reduce_exploit_mitigations_matches_filter():
+    random = Random(42)
+    entry_names = [
+        'Canary disabled', 'Canary enabled', 'FORTIFY_SOURCE disabled', 'FORTIFY_SOURCE enabled', 'NX disabled',
+        'NX enabled', 'PIE - invalid ELF file', 'PIE enabled', 'RELRO disabled', 'RELRO fully enabled', 'RELRO partially enabled'
+    ]
+    summaries = [TEST_DICT['exploit_mitigations']['summary'], {'NX enabled': [1]}, {'unknown': [1, 2]}]
+    summaries.extend(_random_summary(random, random.sample(entry_names, random.randint(1, 11))) for _ in range(200))
+
+    for summary in summaries:
+        assert reduce_exploit_mitigations(summary) == _legacy_exploit_mitigation(summary)
+
+
+@pytest.mark.parametrize('entry_count', [0, 3, 5, 6, 40])
+def test_reduce_file_type_matches_filter(entry_count):
+    summary = _random_summary(Random(entry_count), ['type/{}'.format(index) for index in range(entry_count)])
+    expected = _legacy_five_longest_entries(summary)
+    assert reduce_file_type(summary) == [(file_type, len(expected[file_type])) for file_type in expected]
+
+
+@pytest.mark.parametrize('entry_count', [1, 10, 11, 500])
+def test_reduce_software_components_matches_filter(entry_count):
+    names = ['software {} 1.{}'.format(index, index) for index in range(entry_count)]
+    Random(entry_count).shuffle(names)
+    reduced = reduce_software_components(dict.fromkeys(names, [1]))
+    assert reduced['entries'] == get_x_entries(sorted(names))
+    assert reduced['others'] == max(entry_count - 10, 0)
+
+
+def test_reduce_cve_lookup():
+    reduced = reduce_cve_lookup({'foo (CRITICAL)': [], 'bar': [], 'baz (CRITICAL)': []})
+    assert reduced.counts == {'CRITICAL': 2, 'HIGH': 0, 'MEDIUM': 0, 'LOW': 0, 'UNKNOWN': 1}
+    assert [cve.name for cve in reduced.top] == ['foo (CRITICAL)', 'baz (CRITICAL)', 'bar']
+    assert reduced.others == 0
+
+
+@pytest.mark.parametrize('score, critical, expected', [
+    (None, False, 'UNKNOWN'), (None, True, 'CRITICAL'), (9.0, False, 'CRITICAL'), (8.9, False, 'HIGH'), (4.0, False, 'MEDIUM'),
+    (0.0, False, 'LOW'), (2.0, True, 'CRITICAL'),
+])
+def test_get_severity(score, critical, expected):
+    assert get_severity(score, critical) == expected
+
+
+def test_parse_cve_entry():
+    cve_results = {
+        'OpenSSL 1.0.2r': {'CVE-2019-1': {'score2': '5.0', 'score3': '7.5'}, 'CVE-2019-2': {'score2': '4.3', 'score3': 'N/A'}},
+        'busybox': {'CVE-2017-3': {'score2': '10.0'}},
+    }
+    assert parse_cve_entry('OpenSSL 1.0.2r', cve_results) == CveEntry('OpenSSL 1.0.2r', 'HIGH', 7.5)
+    assert parse_cve_entry('busybox CVE-2017-3 (CRITICAL)', cve_results) == CveEntry('busybox CVE-2017-3 (CRITICAL)', 'CRITICAL', 10.0)
+    assert parse_cve_entry('busybox CVE-2017-4', cve_results) == CveEntry('busybox CVE-2017-4', 'UNKNOWN', None)
+    assert parse_cve_entry('hostapd 2.7') == CveEntry('hostapd 2.7', 'UNKNOWN', None)
+
+
+def test_aggregate_cves_is_bounded():
+    summary = {'software CVE-2020-{}'.format(index): [index] for index in range(5000)}
+    cve_results = {'software': {'CVE-2020-{}'.format(index): {'score3': str(index % 100 / 10)} for index in range(5000)}}
+    aggregation = aggregate_cves(summary, cve_results)
+
+    assert aggregation.total == 5000 and sum(aggregation.counts.values()) == 5000
+    assert aggregation.counts == {'CRITICAL': 500, 'HIGH': 1000, 'MEDIUM': 1500, 'LOW': 2000, 'UNKNOWN': 0}
+    assert len(aggregation.top) == TOP_CVES and aggregation.others == 5000 - TOP_CVES
+    assert all(cve.score == 9.9 for cve in aggregation.top)
+    assert [cve.name for cve in aggregation.top[:2]] == ['software CVE-2020-99', 'software CVE-2020-199']
+
+
+def test_reduce_analysis():
+    sections = reduce_analysis(dict(TEST_DICT, ip_and_uri_finder={'summary': {}}, unknown_plugin={'summary': {'a': [1]}}))
+    assert sections['ip_and_uri_finder'] is None
+    assert 'unknown_plugin' not in sections
+    assert 'binwalk' not in sections
+    assert sections['cpu_architecture'] == [('ARM, 32-bit, big endian (M)', 9), ('x86, 32-bit, little endian (M)', 42)]
+    assert reduce_analysis('no analysis') == {}
+
+
+def test_reduced_sections_are_lazy(monkeypatch):
+    reduced = []
+    monkeypatch.setattr('pdf_generator.tex_generation.summary_reduction.reduce_section', lambda plugin, _: reduced.append(plugin) or plugin)
+    sections = ReducedSections(TEST_DICT)
+    assert 'file_type' in sections and 'binwalk' not in sections
+    assert not reduced
+    assert sections['file_type'] == sections['file_type'] == 'file_type'
+    assert reduced == ['file_type']
+
+
+def test_reduced_sections_match_reduce_analysis():
+    assert dict(ReducedSections(TEST_DICT)) == reduce_analysis(TEST_DICT)
+    assert not ReducedSections('no analysis')
@@ -1,11 +1,16 @@
 from pathlib import Path
+from random import Random
 
+import jinja2
 import pytest
+
 from pdf_generator.tex_generation.template_engine import (
-    software_components, TemplateEngine, decode_base64_to_file, render_number_as_size, render_unix_time,
-    replace_special_characters, get_five_longest_entries
+    create_jinja_environment, software_components, TemplateEngine, render_number_as_size,
+    render_unix_time, replace_special_characters, replace_special_characters_in_list,
+    LATEX_CHARACTER_ESCAPES, MAIN_TEMPLATE
 )
 
+from pdf_generator.tex_generation.summary_reduction import reduce_analysis
 from test.data.test_dict import TEST_DICT
 
 # pylint: disable=redefined-outer-name
@@ -31,9 +36,32 @@ def test_nice_unix_time():
     assert render_unix_time(10) == '1970-01-01 01:00:10'
 
 
-def test_convert_base64_to_png_filter(tmpdir):
-    decode_base64_to_file('0000', 'testfile', str(tmpdir))
-    assert Path(str(tmpdir), 'testfile.png').read_bytes() == b'\xd3\x4d\x34'
+def test_render_with_reduced_sections(tmpdir):
+    engine = TemplateEngine()
+    assert engine.render_main_template(TEST_DICT, tmp_dir=str(tmpdir), sections=reduce_analysis(TEST_DICT)) == engine.render_main_template(TEST_DICT, tmp_dir=str(tmpdir))
+
+
+@pytest.mark.parametrize('reduced', [True, False])
+def test_main_template_gets_sections(monkeypatch, reduced):
+    engine = TemplateEngine()
+    environment = engine._environment  # pylint: disable=protected-access
+    template, get_template = environment.from_string(r'\VAR{sections.cpu_architecture[0][1]} \VAR{"file_type" in sections}'), environment.get_template
+    monkeypatch.setattr(environment, 'get_template', lambda name: template if name == MAIN_TEMPLATE else get_template(name))
+    sections = reduce_analysis(TEST_DICT) if reduced else None
+    assert engine.render_main_template(TEST_DICT, sections=sections) == '9 True'
+
+
+def test_load_templates():
+    engine = TemplateEngine()
+    assert engine.load_templates() == len(list(Path(engine._environment.loader.searchpath[0]).rglob('*.tex')))  # pylint: disable=protected-access
+
+
+def test_nice_unix_time_utc():
+    assert render_unix_time(10, utc=True) == '1970-01-01 00:00:10'
+    assert render_unix_time('10', utc=True) == 'not available'
+
+    template = create_jinja_environment().from_string('\\VAR{time | nice_unix_time}')
+    assert template.render(time=10, utc=True) == '1970-01-01 00:00:10'
 
 
 def test_filter_latex_special_chars():
@@ -43,6 +71,24 @@ def test_filter_latex_special_chars():
     assert replace_special_characters(r'100 $') == r'100 \$'
 
 
+def _sequential_replace_special_characters(data):
+    for character, replacement in LATEX_CHARACTER_ESCAPES.items():
+        if character in data:
+            data = data.replace(character, replacement)
+    return data
+
+
+def test_filter_latex_special_chars_matches_sequential_replacement():
+    random = Random(1337)
+    alphabet = ''.join(LATEX_CHARACTER_ESCAPES) + 'ab 1.\\{}$'
+    samples = [''.join(random.choice(alphabet) for _ in range(random.randint(0, 40))) for _ in range(2000)]
+    samples.extend(['', 'plain text', '$(x)^2 ~ {y}_1 <> #5 & 10%', 'C:\\Windows\n[path]'])
+
+    for sample in samples:
+        assert replace_special_characters(sample) == _sequential_replace_special_characters(sample)
+    assert replace_special_characters_in_list(samples) == [_sequential_replace_special_characters(sample) for sample in samples]
+
+
 def test_render_meta_template(stub_engine):
     assert stub_engine.render_meta_template(meta_data='anything') == 'Test anything - '
 
@@ -51,13 +97,6 @@ def test_render_main_template(stub_engine):
     assert stub_engine.render_main_template(analysis='else') == 'Test  - else'
 
 
-def test_get_five_longest_entries():
-    assert len(get_five_longest_entries(TEST_DICT['file_type']['summary'], top=3)) <= 3
-    longest_dict = get_five_longest_entries(TEST_DICT['file_type']['summary'], top=1)
-    assert len(longest_dict) == 1
-    assert 'compression/zlib' in longest_dict.keys()
-
-
 @pytest.mark.parametrize('test_input, expected_output', [
     ('FOO 1.0', '1.0}{FOO'),
     ('1.0 FOO', '1.0}{FOO'),
@@ -68,3 +107,30 @@ def test_get_five_longest_entries():
 ])
 def test_software_components(test_input, expected_output):
     assert software_components(test_input) == expected_output
+
+
+def test_jinja_environment_is_shared():
+    assert TemplateEngine()._environment is TemplateEngine(template_folder='default')._environment  # pylint: disable=protected-access
+
+
+def test_compiled_templates_are_loaded_from_bytecode_cache(monkeypatch, tmpdir):
+    monkeypatch.setenv('FACT_PDF_CACHE_DIR', str(tmpdir))
+    create_jinja_environment.cache_clear()
+    compile_calls = []
+    original_compile = jinja2.Environment.compile
+
+    def counting_compile(self, *args, **kwargs):
+        compile_calls.append(args)
+        return original_compile(self, *args, **kwargs)
+
+    monkeypatch.setattr(jinja2.Environment, 'compile', counting_compile)
+    try:
+        create_jinja_environment('default').get_template(MAIN_TEMPLATE)
+        assert len(compile_calls) == 1
+        assert list(Path(str(tmpdir), 'jinja').glob('*/default/*.cache'))
+
+        create_jinja_environment.cache_clear()
+        create_jinja_environment('default').get_template(MAIN_TEMPLATE)
+        assert len(compile_calls) == 1
+    finally:
+        create_jinja_environment.cache_clear()